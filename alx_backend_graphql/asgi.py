@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql_crm.settings")
+from crm.health import HealthCheckASGIApp
 
-application = get_asgi_application()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+
+django_application = get_asgi_application()
+
+# /healthz and /readyz are answered before Django's request handling
+application = HealthCheckASGIApp(django_application)
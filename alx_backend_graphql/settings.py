@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -83,6 +84,23 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Shared by every web worker, cron job and Celery worker: the response cache
+# and its model versions, persisted queries and client cost budgets must be
+# seen by all of them (see crm/cache.py). The test runner swaps in a
+# per-process cache (see crm/testing.py).
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CRM_CACHE_URL", "redis://localhost:6379/1"),
+        "KEY_PREFIX": "crm",
+    }
+}
+
+TEST_RUNNER = "crm.testing.CRMTestRunner"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,9 +146,119 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Graphene settings
 GRAPHENE = {
     'SCHEMA': 'alx_backend_graphql.schema.schema',
+    'MIDDLEWARE': ['crm.instrumentation.TracingMiddleware'],
+    # Checked by crm.cost before an operation runs; see that module for
+    # how the estimate is computed.
+    'QUERY_COST': {
+        'MAX_COST': 5000,
+        'MAX_DEPTH': 10,
+        'LIST_SIZE': 100,
+        'FIELD_WEIGHTS': {
+            # Aggregates over the whole orders table
+            'Query.crmStats': 50,
+            'Query.dailySales': 5,
+        },
+        # e.g. 20000 to throttle clients spending more per minute
+        'CLIENT_BUDGET': None,
+        'CLIENT_BUDGET_WINDOW': 60,
+        'CACHE_ALIAS': 'default',
+    },
 }
 
 # Cron jobs settings
 CRONJOBS = [
     ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),
 ]
+
+# CRM settings
+CRM_BULK_CREATE_BATCH_SIZE = 500
+CRM_SEARCH_BACKEND = 'auto'  # 'auto', 'icontains', 'fts5' (SQLite) or 'trigram' (PostgreSQL)
+CRM_GRAPHQL_DOCUMENT_CACHE_SIZE = 512  # parsed + validated documents kept per process
+CRM_PERSISTED_QUERY_TIMEOUT = None  # seconds; None keeps persisted queries until evicted
+CRM_EXPORT_CHUNK_SIZE = 2000  # orders fetched per round trip by /exports/orders and export_orders
+CRM_EXPORT_TOKEN = None  # bearer token for /exports/orders; staff users and DEBUG need none
+CRM_TASK_PARTITION_SIZE = 10000  # order ids per subtask of the partitioned Celery jobs
+
+# How cron jobs and Celery tasks run GraphQL documents (see
+# crm/graphql_client.py): in-process ('local') or posted to URL ('http')
+CRM_GRAPHQL_CLIENT = {
+    'MODE': 'local',
+    'URL': 'http://localhost:8000/graphql',
+    'TIMEOUT': 30,
+    'POOL_SIZE': 4,
+}
+
+# Inactive customer cleanup (see crm/cleanup.py): customers who never
+# ordered and were created more than INACTIVE_DAYS ago are deleted
+# BATCH_SIZE at a time, pausing SLEEP seconds between batches.
+CRM_CUSTOMER_CLEANUP = {
+    'INACTIVE_DAYS': 365,
+    'BATCH_SIZE': 500,
+    'SLEEP': 0.1,
+}
+
+# Order reminders (see crm/reminders.py): each run handles the orders
+# placed since the previous one, BATCH_SIZE per transaction. The first run
+# starts LOOKBACK_DAYS back.
+CRM_ORDER_REMINDERS = {
+    'BATCH_SIZE': 500,
+    'LOOKBACK_DAYS': 7,
+    # Seconds an order's transaction may take to commit; newer orders wait
+    # for the next run
+    'GRACE_SECONDS': 60,
+}
+
+# Logs of the cron jobs and Celery tasks (see crm/joblog.py): JSON lines in
+# DIRECTORY/<job>_log.txt, written once per job run. Files are rotated past
+# MAX_BYTES and, with ROTATE_WHEN 'daily' or 'hourly', once per period,
+# keeping BACKUP_COUNT old files. BACKGROUND writes from a separate thread.
+CRM_JOB_LOGS = {
+    'DIRECTORY': '/tmp',
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    'ROTATE_WHEN': None,
+    'BACKGROUND': False,
+}
+
+# /healthz and /readyz probes (see crm/health.py). /readyz runs CHECKS,
+# waiting up to TIMEOUT seconds for the broker. log_crm_heartbeat gets URL
+# from the running web server (MODE 'http'; URL None is /readyz on the
+# server of CRM_GRAPHQL_CLIENT['URL']). MODE 'local' only runs the checks
+# in the cron process and cannot tell whether the web server is up.
+CRM_HEALTH = {
+    'CHECKS': ('database', 'cache', 'broker'),
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 2,
+    'MODE': 'http',
+    'URL': None,
+}
+
+# Response cache for read-only GraphQL queries (see crm/cache.py). Only
+# operations whose root fields are all listed in FIELDS are cached; each
+# field lists models it reads that are not visible from its selection set.
+CRM_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,
+    'FIELDS': {
+        'hello': [],
+        'allCustomers': [],
+        'allProducts': [],
+        'allOrders': [],
+        'dailySales': [],
+        'crmStats': ['crm.Customer', 'crm.Order'],
+    },
+}
+
+# Resolver/SQL instrumentation of /graphql, served at /metrics. Send the
+# debug header (any value when DEBUG is on, else DEBUG_TOKEN) to get the
+# trace back under extensions.tracing. /metrics needs DEBUG, a staff user
+# or "Authorization: Bearer <METRICS_TOKEN>".
+CRM_GRAPHQL_METRICS = {
+    'ENABLED': True,
+    'DEBUG_HEADER': 'X-CRM-Debug',
+    'DEBUG_TOKEN': None,
+    'METRICS_TOKEN': None,
+    'SAMPLE_SIZE': 1024,
+    'QUANTILES': (0.5, 0.9, 0.99),
+}
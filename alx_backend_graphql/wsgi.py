@@ -11,6 +11,11 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql_crm.settings")
+from crm.health import HealthCheckWSGIApp
 
-application = get_wsgi_application()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+
+django_application = get_wsgi_application()
+
+# /healthz and /readyz are answered before Django's request handling
+application = HealthCheckWSGIApp(django_application)
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
 
 
 class CrmConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "crm"
+
+    def ready(self):
+        from . import checks  # noqa: F401 (registers the system checks)
+        from .cache import invalidate_instance, invalidate_relation, invalidate_through
+        from .instrumentation import install_sql_wrapper
+        from .models import Customer, Product, Order, OrderItem, DailySalesRollup
+        from .search import install_search_indexes
+
+        post_migrate.connect(install_search_indexes, sender=self)
+        connection_created.connect(install_sql_wrapper)
+        for model in (Customer, Product, Order, DailySalesRollup):
+            post_save.connect(invalidate_instance, sender=model)
+            post_delete.connect(invalidate_instance, sender=model)
+        post_save.connect(invalidate_through, sender=OrderItem)
+        post_delete.connect(invalidate_through, sender=OrderItem)
+        m2m_changed.connect(invalidate_relation, sender=Order.products.through)
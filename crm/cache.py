@@ -0,0 +1,261 @@
+"""
+Response caching for read-only GraphQL operations.
+
+A query is cacheable when every root field it selects is listed in
+``CRM_RESPONSE_CACHE['FIELDS']``. Its cache key combines the normalized
+document, operation name and variables with the current version of every
+model the response depends on: the models behind the DjangoObjectTypes in
+the selection set plus any extra models declared for the root fields.
+Saving, deleting or changing the relations of a model bumps its version on
+commit, which makes every response that read it unreachable.
+
+Writes that bypass model signals (``update()``, ``bulk_create()``, raw SQL)
+must call ``invalidate_on_commit`` themselves.
+
+The cache is an optimization: when it cannot be reached, the error is logged
+and the request runs as a cache miss.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from graphql import OperationType, TypeInfo, TypeInfoVisitor, Visitor, get_named_type, print_ast, visit
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_PREFIX = 'crm:response:'
+VERSION_PREFIX = 'crm:version:'
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,
+    'FIELDS': {},
+}
+
+
+def cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'CRM_RESPONSE_CACHE', {})}
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with hit/miss counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+
+def version_key(label):
+    return VERSION_PREFIX + label.lower()
+
+
+def invalidate_models(*models):
+    """Bump the cached-response version of each model (class or label)."""
+    backend = caches[cache_settings()['CACHE_ALIAS']]
+    for model in models:
+        label = model if isinstance(model, str) else model._meta.label
+        key = version_key(label)
+        if backend.add(key, 1, timeout=None):
+            continue
+        try:
+            backend.incr(key)
+        except ValueError:
+            # Evicted between add() and incr()
+            backend.set(key, 1, timeout=None)
+
+
+def invalidate_on_commit(*models):
+    # The data is committed by then: a failed bump is logged rather than
+    # raised, and stale responses expire after TIMEOUT
+    def invalidate():
+        invalidate_models(*models)
+
+    transaction.on_commit(invalidate, robust=True)
+
+
+def invalidate_instance(sender, **kwargs):
+    """post_save/post_delete receiver."""
+    invalidate_on_commit(sender)
+
+
+def invalidate_through(sender, **kwargs):
+    """
+    post_save/post_delete receiver for through models, which change both
+    ends of the relation.
+    """
+    invalidate_on_commit(sender, *{
+        field.related_model for field in sender._meta.concrete_fields if field.many_to_one
+    })
+
+
+def invalidate_relation(sender, instance, model, action, **kwargs):
+    """m2m_changed receiver: both ends of the relation change."""
+    if action.startswith('post_'):
+        invalidate_on_commit(type(instance), model)
+
+
+class _ModelCollector(Visitor):
+    """Collect the Django models behind every type in a selection set."""
+
+    def __init__(self, type_info):
+        super().__init__()
+        self.type_info = type_info
+        self.labels = set()
+
+    def enter_field(self, node, *args):
+        named_type = get_named_type(self.type_info.get_type())
+        graphene_type = getattr(named_type, 'graphene_type', None)
+        model = getattr(getattr(graphene_type, '_meta', None), 'model', None)
+        if model is not None:
+            self.labels.add(model._meta.label)
+
+
+class ResponseCache:
+    """Cache of ``ExecutionResult.data`` for cacheable query operations."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (query hash, operation name) -> (normalized hash, model labels) or None
+        self._plans = LRUCache(512)
+
+    def plan(self, schema, document, operation_ast, query_key):
+        """Return ``(normalized_hash, labels)``, or None if not cacheable."""
+        plan_key = (query_key, operation_ast.name.value if operation_ast.name else None)
+        entry = self._plans.get(plan_key)
+        if entry is None:
+            entry = (self._build_plan(schema, document, operation_ast),)
+            self._plans.set(plan_key, entry)
+        return entry[0]
+
+    def _build_plan(self, schema, document, operation_ast):
+        if operation_ast.operation != OperationType.QUERY:
+            return None
+        fields = cache_settings()['FIELDS']
+        labels = set()
+        for selection in operation_ast.selection_set.selections:
+            name = getattr(getattr(selection, 'name', None), 'value', None)
+            # Fragments at the root and fields not opted in are never cached
+            if name is None or (name not in fields and name != '__typename'):
+                return None
+            labels.update(apps.get_model(label)._meta.label for label in fields.get(name, []))
+        type_info = TypeInfo(schema)
+        collector = _ModelCollector(type_info)
+        visit(document, TypeInfoVisitor(type_info, collector))
+        labels.update(collector.labels)
+        normalized = hashlib.sha256(print_ast(document).encode('utf-8')).hexdigest()
+        return normalized, tuple(sorted(labels))
+
+    def key(self, schema, document, operation_ast, query_key, variables):
+        """Return the cache key for this request, or None if not cacheable."""
+        config = cache_settings()
+        if not config['ENABLED'] or operation_ast is None:
+            return None
+        plan = self.plan(schema, document, operation_ast, query_key)
+        if plan is None:
+            return None
+        normalized, labels = plan
+        backend = caches[config['CACHE_ALIAS']]
+        try:
+            stored = backend.get_many([version_key(label) for label in labels])
+        except Exception as e:
+            # Without the versions the key could serve stale responses
+            logger.warning("Response cache unavailable, not caching: %s", e)
+            return None
+        versions = [stored.get(version_key(label), 0) for label in labels]
+        operation_name = operation_ast.name.value if operation_ast.name else ''
+        payload = json.dumps(
+            [normalized, operation_name, variables or {}, versions],
+            sort_keys=True, default=str,
+        )
+        return RESPONSE_PREFIX + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        try:
+            data = caches[cache_settings()['CACHE_ALIAS']].get(key)
+        except Exception as e:
+            logger.warning("Response cache unavailable, treating as a miss: %s", e)
+            data = None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, key, data):
+        config = cache_settings()
+        try:
+            caches[config['CACHE_ALIAS']].set(key, data, timeout=config['TIMEOUT'])
+        except Exception as e:
+            logger.warning("Response cache unavailable, response not stored: %s", e)
+
+    def clear(self):
+        """Forget the memoized plans and reset the counters."""
+        self._plans.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+response_cache = ResponseCache()
+
+
+@receiver(setting_changed)
+def reset_response_cache(setting, **kwargs):
+    # Plans depend on FIELDS
+    if setting == 'CRM_RESPONSE_CACHE':
+        response_cache.clear()
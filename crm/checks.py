@@ -0,0 +1,53 @@
+"""
+System checks for state the CRM keeps in Django's cache.
+
+Cached responses and their model versions must live in a cache shared by
+all processes: with a per-process cache, a write bumps the versions of the
+process that made it only, and every other worker keeps serving stale
+responses until they expire. Persisted queries (in the default cache) are
+the same: a hash registered with one worker would be unknown to the others,
+and so are client cost budgets, which would let a client spend its budget
+once per worker.
+Run with ``manage.py check --deploy``.
+"""
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.core.checks import Error, Tags, register
+
+from .cache import cache_settings
+from .cost import cost_settings
+
+PROCESS_LOCAL_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+}
+
+
+def is_process_local(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_BACKENDS
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    errors = []
+    config = cache_settings()
+    if config['ENABLED'] and is_process_local(config['CACHE_ALIAS']):
+        errors.append(Error(
+            f"CRM_RESPONSE_CACHE uses the per-process cache '{config['CACHE_ALIAS']}'.",
+            hint="Point CACHES at a shared backend such as Redis, or set CRM_RESPONSE_CACHE['ENABLED'] to False.",
+            id='crm.E001',
+        ))
+    if is_process_local(DEFAULT_CACHE_ALIAS):
+        errors.append(Error(
+            "Persisted queries are stored in the per-process default cache.",
+            hint="Point CACHES['default'] at a shared backend such as Redis.",
+            id='crm.E002',
+        ))
+    config = cost_settings()
+    if config['ENABLED'] and config['CLIENT_BUDGET'] is not None and is_process_local(config['CACHE_ALIAS']):
+        errors.append(Error(
+            f"GRAPHENE['QUERY_COST'] counts client budgets in the per-process cache '{config['CACHE_ALIAS']}'.",
+            hint="Point CACHES at a shared backend such as Redis, or set GRAPHENE['QUERY_COST']['CLIENT_BUDGET'] to None.",
+            id='crm.E003',
+        ))
+    return errors
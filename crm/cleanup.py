@@ -0,0 +1,133 @@
+"""
+Batched deletion of inactive customers.
+
+A customer is inactive if it was created before the cutoff and has never
+placed an order. Candidates are found through the denormalized
+``order_count`` column and its index rather than an anti-join on the
+orders table. ``delete_inactive_customers`` walks them in primary key
+order, deleting at most ``BATCH_SIZE`` of them per short transaction and
+sleeping ``SLEEP`` seconds between batches, so order writes are only ever
+blocked for one batch. After each batch the last primary key and the
+running count are saved in a JobCheckpoint in the same transaction; an
+interrupted run resumes from there with the same cutoff.
+
+Inactive customers have no orders, so nothing cascades from them. As long
+as ``orders`` is the only relation pointing at Customer, each batch is
+removed with a single ``DELETE`` instead of going through the deletion
+collector, which would fetch every row and look for related orders first.
+The cached-response invalidation the post_delete signal would have done
+is done once per batch instead.
+"""
+
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import invalidate_on_commit
+from .models import Customer, JobCheckpoint, Order
+
+CHECKPOINT = 'clean_inactive_customers'
+
+DEFAULTS = {
+    'INACTIVE_DAYS': 365,
+    'BATCH_SIZE': 500,
+    'SLEEP': 0.1,
+}
+
+CleanupResult = namedtuple('CleanupResult', 'deleted batches complete resumed')
+
+
+def cleanup_settings():
+    return {**DEFAULTS, **getattr(settings, 'CRM_CUSTOMER_CLEANUP', {})}
+
+
+def inactive_customers(cutoff):
+    return Customer.objects.filter(created_at__lt=cutoff).filter(
+        ~Exists(Order.objects.filter(customer=OuterRef('pk')))
+    )
+
+
+def candidates(cutoff):
+    """
+    Customers whose totals say they are inactive. delete_batch() still
+    checks for orders, so a customer whose order_count is out of date is
+    never deleted with its orders.
+    """
+    return Customer.objects.filter(created_at__lt=cutoff, order_count=0)
+
+
+def can_raw_delete():
+    """True if no relation other than ``orders`` can reference a customer."""
+    return all(rel.name == 'orders' for rel in Customer._meta.related_objects)
+
+
+def delete_batch(cutoff, ids):
+    """
+    Delete the customers in ``ids`` that are still inactive and return how
+    many were deleted. The condition is checked again in the DELETE, so a
+    customer who ordered since the batch was selected is kept.
+    """
+    queryset = inactive_customers(cutoff).filter(pk__in=ids)
+    if can_raw_delete():
+        deleted = queryset._raw_delete(queryset.db)
+        if deleted:
+            invalidate_on_commit(Customer)
+        return deleted
+    return queryset.delete()[1].get(Customer._meta.label, 0)
+
+
+def delete_inactive_customers(days=None, batch_size=None, sleep=None, max_batches=None, restart=False):
+    """
+    Delete inactive customers in batches, resuming an unfinished run unless
+    ``restart`` is set. ``max_batches`` stops early, leaving the checkpoint
+    for the next run. Returns a CleanupResult with the totals of this run.
+    """
+    config = cleanup_settings()
+    days = config['INACTIVE_DAYS'] if days is None else days
+    batch_size = batch_size or config['BATCH_SIZE']
+    sleep = config['SLEEP'] if sleep is None else sleep
+    if batch_size < 1:
+        raise ValueError("Batch size must be positive")
+
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT)
+    state = checkpoint.state
+    resumed = bool(state) and not restart
+    if resumed:
+        cutoff = parse_datetime(state['cutoff'])
+        last_id = state['last_id']
+    else:
+        cutoff = timezone.now() - timedelta(days=days)
+        last_id = 0
+
+    previously_deleted = state.get('deleted', 0) if resumed else 0
+    deleted = batches = 0
+    while max_batches is None or batches < max_batches:
+        if batches and sleep:
+            time.sleep(sleep)
+        with transaction.atomic():
+            ids = list(
+                candidates(cutoff).filter(pk__gt=last_id)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            deleted += delete_batch(cutoff, ids)
+            batches += 1
+            last_id = ids[-1]
+            state = {
+                'cutoff': cutoff.isoformat(),
+                'last_id': last_id,
+                'deleted': previously_deleted + deleted,
+            }
+            JobCheckpoint.objects.filter(name=CHECKPOINT).update(state=state, updated_at=timezone.now())
+    else:
+        return CleanupResult(deleted, batches, complete=False, resumed=resumed)
+
+    JobCheckpoint.objects.filter(name=CHECKPOINT).update(state={}, updated_at=timezone.now())
+    return CleanupResult(deleted, batches, complete=True, resumed=resumed)
@@ -0,0 +1,210 @@
+"""
+Static cost analysis for GraphQL operations.
+
+The cost of an operation is estimated from the document and its variables
+before anything is executed::
+
+    field cost = weight + multiplier * cost of the field's selection set
+
+The multiplier of a connection field is its ``first``/``last`` argument, or
+``RELAY_CONNECTION_MAX_LIMIT`` when neither is given; a plain list field
+counts ``LIST_SIZE`` items, each costing 1 on top of its selection. Weights
+default to 1 for fields that return objects and 0 for scalars. The
+``edges``/``node``/``pageInfo`` plumbing of a connection is not multiplied
+again and does not count towards the depth.
+
+Everything is configured in ``GRAPHENE['QUERY_COST']``; per-field weights
+are keyed by ``"TypeName.fieldName"``, e.g. ``{"Query.crmStats": 50}``.
+"""
+
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from graphene.relay import Connection
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FragmentDefinitionNode,
+    GraphQLError,
+    SelectionSetNode,
+    get_named_type,
+    get_nullable_type,
+    is_abstract_type,
+    is_leaf_type,
+    is_list_type,
+)
+from graphql.execution.collect_fields import collect_fields
+from graphql.execution.values import get_argument_values
+
+BUDGET_PREFIX = 'crm:cost:'
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_COST': 5000,
+    'MAX_DEPTH': 10,
+    'LIST_SIZE': 100,
+    'FIELD_WEIGHTS': {},
+    # Total cost a single client may spend per window; None disables it
+    'CLIENT_BUDGET': None,
+    'CLIENT_BUDGET_WINDOW': 60,
+    # Budgets must be counted in a cache shared by all processes
+    'CACHE_ALIAS': 'default',
+}
+
+QueryCost = namedtuple('QueryCost', 'cost depth')
+
+
+def cost_settings():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHENE', {}).get('QUERY_COST', {})}
+
+
+def is_connection(graphql_type):
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    return isinstance(graphene_type, type) and issubclass(graphene_type, Connection)
+
+
+@lru_cache(maxsize=None)
+def plumbing_types(schema):
+    """Names of the connection and edge types in ``schema``."""
+    names = set()
+    for graphql_type in schema.type_map.values():
+        if is_connection(graphql_type):
+            names.add(graphql_type.name)
+            names.add(graphql_type.graphene_type.Edge._meta.name)
+    return frozenset(names)
+
+
+class CostAnalyzer:
+    def __init__(self, schema, document, variables=None, config=None):
+        config = config or cost_settings()
+        self.schema = schema
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+        self.variables = variables or {}
+        self.weights = config['FIELD_WEIGHTS']
+        self.list_size = config['LIST_SIZE']
+        self.page_size = graphene_settings.RELAY_CONNECTION_MAX_LIMIT or self.list_size
+        self.plumbing = plumbing_types(schema)
+
+    def analyze(self, operation):
+        root_type = self.schema.get_root_type(operation.operation)
+        return QueryCost(*self.selection_cost(root_type, operation.selection_set, 0))
+
+    def selection_cost(self, parent_type, selection_set, depth):
+        """Return ``(cost, depth)`` of ``selection_set`` on ``parent_type``."""
+        if is_abstract_type(parent_type):
+            # Charge for the most expensive concrete type
+            return max(
+                (self.selection_cost(t, selection_set, depth)
+                 for t in self.schema.get_possible_types(parent_type)),
+                default=(0, depth),
+            )
+
+        plumbing = parent_type.name in self.plumbing
+        fields = collect_fields(self.schema, self.fragments, self.variables, parent_type, selection_set)
+        total, deepest = 0, depth
+        for field_nodes in fields.values():
+            name = field_nodes[0].name.value
+            field_def = parent_type.fields.get(name)
+            if name.startswith('__') or field_def is None:
+                continue
+            return_type = get_named_type(field_def.type)
+            key = f"{parent_type.name}.{name}"
+            weight = self.weights.get(key, 0 if is_leaf_type(return_type) else 1)
+            if plumbing:
+                multiplier, item_cost, level = 1, 0, depth
+            else:
+                multiplier, item_cost = self.multiplier(field_def, field_nodes[0], return_type)
+                level = depth + 1
+
+            child_cost, child_depth = item_cost, level
+            selections = [
+                selection
+                for node in field_nodes if node.selection_set
+                for selection in node.selection_set.selections
+            ]
+            if selections:
+                cost, child_depth = self.selection_cost(
+                    return_type, SelectionSetNode(selections=tuple(selections)), level
+                )
+                child_cost += cost
+            total += weight + multiplier * child_cost
+            deepest = max(deepest, child_depth)
+        return total, deepest
+
+    def multiplier(self, field_def, node, return_type):
+        """Return ``(multiplier, cost of each item)`` for a field."""
+        if is_connection(return_type):
+            try:
+                args = get_argument_values(field_def, node, self.variables)
+            except GraphQLError:
+                args = {}
+            sizes = [args[name] for name in ('first', 'last') if args.get(name) is not None]
+            return (min(sizes) if sizes else self.page_size), 0
+        if is_list_type(get_nullable_type(field_def.type)):
+            return self.list_size, 0 if is_leaf_type(return_type) else 1
+        return 1, 0
+
+
+def charge_client(client, cost, config):
+    """
+    Add ``cost`` to ``client``'s spend in the current window and return the
+    new total.
+    """
+    cache = caches[config['CACHE_ALIAS']]
+    window = config['CLIENT_BUDGET_WINDOW']
+    key = f"{BUDGET_PREFIX}{client}:{int(time.time() // window)}"
+    if cache.add(key, cost, timeout=window):
+        return cost
+    try:
+        return cache.incr(key, cost)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.set(key, cost, timeout=window)
+        return cost
+
+
+def check_query_cost(schema, document, operation_ast, variables=None, client=None):
+    """
+    Estimate the cost of ``operation_ast`` and enforce the configured limits.
+
+    Returns ``(extensions, error)``: the ``cost`` entry to report in the
+    response extensions, and a GraphQLError if the operation must not run.
+    """
+    config = cost_settings()
+    if not config['ENABLED'] or operation_ast is None:
+        return {}, None
+    cost, depth = CostAnalyzer(schema, document, variables, config).analyze(operation_ast)
+    report = {
+        'requestedQueryCost': cost,
+        'maximumAvailable': config['MAX_COST'],
+        'depth': depth,
+        'maximumDepth': config['MAX_DEPTH'],
+    }
+    extensions = {'cost': report}
+
+    if config['MAX_DEPTH'] is not None and depth > config['MAX_DEPTH']:
+        return extensions, GraphQLError(
+            f"Query depth {depth} exceeds the maximum of {config['MAX_DEPTH']}",
+            extensions={'code': 'QUERY_TOO_DEEP', **extensions},
+        )
+    if config['MAX_COST'] is not None and cost > config['MAX_COST']:
+        return extensions, GraphQLError(
+            f"Query cost {cost} exceeds the maximum of {config['MAX_COST']}",
+            extensions={'code': 'QUERY_TOO_COMPLEX', **extensions},
+        )
+    if config['CLIENT_BUDGET'] is not None and client is not None:
+        spent = charge_client(client, cost, config)
+        report['budgetRemaining'] = max(config['CLIENT_BUDGET'] - spent, 0)
+        if spent > config['CLIENT_BUDGET']:
+            return extensions, GraphQLError(
+                f"Query cost budget of {config['CLIENT_BUDGET']} per "
+                f"{config['CLIENT_BUDGET_WINDOW']}s exceeded, retry later",
+                extensions={'code': 'QUERY_COST_THROTTLED', **extensions},
+            )
+    return extensions, None
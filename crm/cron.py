@@ -2,129 +2,71 @@
 Cron job functions for the CRM application.
 """
 
-import os
-import sys
-from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from crm.graphql_client import execute_graphql
+from crm.health import probe
+from crm.joblog import job_log
 
 
 def log_crm_heartbeat():
     """
-    Log a heartbeat message to confirm CRM application health.
-    Also optionally queries the GraphQL hello field to verify endpoint responsiveness.
+    Log a heartbeat message to confirm CRM application health, with the
+    readiness reported by the web server's /readyz (see crm/health.py) and
+    its latency.
     """
-    # Format: DD/MM/YYYY-HH:MM:SS CRM is alive
-    timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-    message = f"{timestamp} CRM is alive"
-    
-    # Log to file
-    log_file = "/tmp/crm_heartbeat_log.txt"
-    
-    try:
-        # Append to the log file (don't overwrite)
-        with open(log_file, "a") as f:
-            f.write(f"{message}\n")
-    except Exception as e:
-        # If we can't write to log file, at least print the error
-        print(f"Error writing to heartbeat log: {e}")
-    
-    # Optionally query GraphQL hello field to verify endpoint responsiveness
-    try:
-        # Create GraphQL client
-        transport = RequestsHTTPTransport(
-            url='http://localhost:8000/graphql',
-            timeout=10
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-        
-        # Simple hello query
-        query = gql("""
-        query {
-            hello
-        }
-        """)
-        
-        # Execute the query
-        result = client.execute(query)
+    with job_log("crm_heartbeat") as log:
+        try:
+            ready, checks, latency_ms = probe()
+        except Exception as e:
+            # The readiness endpoint is not reachable
+            log.error(f"Readiness probe error: {str(e)}")
+            return
         
-        if result and 'hello' in result:
-            # GraphQL endpoint is responsive
-            with open(log_file, "a") as f:
-                f.write(f"{timestamp} GraphQL endpoint responsive: {result['hello']}\n")
+        if ready:
+            log.info("CRM is alive", latency_ms=latency_ms, checks=checks)
         else:
-            # GraphQL endpoint returned unexpected result
-            with open(log_file, "a") as f:
-                f.write(f"{timestamp} GraphQL endpoint returned unexpected result\n")
-                
-    except Exception as e:
-        # GraphQL endpoint is not responsive or there's an error
-        try:
-            with open(log_file, "a") as f:
-                f.write(f"{timestamp} GraphQL endpoint error: {str(e)}\n")
-        except:
-            # Can't write to log file
-            pass
+            failed = ', '.join(name for name, check in checks.items() if not check['ok']) or 'unknown'
+            log.error(f"CRM is alive but not ready: {failed}", latency_ms=latency_ms, checks=checks)
 
 
 def update_low_stock():
     """
-    Execute the UpdateLowStockProducts mutation via GraphQL endpoint
-    and log updated product information.
+    Execute the UpdateLowStockProducts mutation and log updated product
+    information.
     """
-    timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-    log_file = "/tmp/low_stock_updates_log.txt"
-    
-    try:
-        # Create GraphQL client
-        transport = RequestsHTTPTransport(
-            url='http://localhost:8000/graphql',
-            timeout=30
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-        
-        # UpdateLowStockProducts mutation
-        mutation = gql("""
-        mutation {
-            updateLowStockProducts {
-                success
-                message
-                count
-                updatedProducts {
-                    id
-                    name
-                    stock
+    with job_log("low_stock_updates") as log:
+        try:
+            # UpdateLowStockProducts mutation
+            result = execute_graphql("""
+            mutation {
+                updateLowStockProducts {
+                    success
+                    message
+                    count
+                    updatedProducts {
+                        id
+                        name
+                        stock
+                    }
                 }
             }
-        }
-        """)
-        
-        # Execute the mutation
-        result = client.execute(mutation)
-        
-        if result and 'updateLowStockProducts' in result:
-            mutation_result = result['updateLowStockProducts']
+            """)
             
-            with open(log_file, "a") as f:
-                f.write(f"{timestamp}: {mutation_result['message']}\n")
+            if result and 'updateLowStockProducts' in result:
+                mutation_result = result['updateLowStockProducts']
+                log.info(mutation_result['message'], count=mutation_result['count'])
                 
                 if mutation_result['success'] and mutation_result['updatedProducts']:
                     for product in mutation_result['updatedProducts']:
-                        product_name = product['name']
-                        new_stock = product['stock']
-                        f.write(f"{timestamp}: Updated product '{product_name}' - New stock: {new_stock}\n")
+                        log.info(
+                            f"Updated product '{product['name']}' - New stock: {product['stock']}",
+                            product_id=product['id'], stock=product['stock'],
+                        )
                 elif mutation_result['count'] == 0:
-                    f.write(f"{timestamp}: No products required stock updates\n")
-        else:
-            # Unexpected GraphQL response
-            with open(log_file, "a") as f:
-                f.write(f"{timestamp}: GraphQL mutation returned unexpected result\n")
+                    log.info("No products required stock updates")
+            else:
+                # Unexpected GraphQL response
+                log.error("GraphQL mutation returned unexpected result")
                 
-    except Exception as e:
-        # GraphQL endpoint error or mutation failed
-        try:
-            with open(log_file, "a") as f:
-                f.write(f"{timestamp}: Error executing low stock update: {str(e)}\n")
-        except:
-            # Can't write to log file
-            pass
+        except Exception as e:
+            # GraphQL endpoint error or mutation failed
+            log.error(f"Error executing low stock update: {str(e)}")
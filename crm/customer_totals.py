@@ -0,0 +1,123 @@
+"""
+Maintenance of the denormalized order totals on Customer.
+
+``order_count``, ``lifetime_value`` and ``last_order_at`` let customers be
+filtered and sorted by activity without aggregating their orders.
+``record_customer_orders`` adds new orders to them inside the caller's
+transaction, with one ``UPDATE`` for all the customers involved whose
+arithmetic runs in the database, so concurrent orders of the same customer
+do not lose updates. Orders changed any other way (admin, deletes,
+imports) are corrected by ``reconcile``, which recomputes the totals from
+the orders table.
+"""
+
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DateTimeField, DecimalField, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+
+from crm.cache import invalidate_on_commit
+from crm.models import Customer, Order
+
+TOTAL_FIELDS = ('order_count', 'lifetime_value', 'last_order_at')
+
+ReconcileResult = namedtuple('ReconcileResult', 'checked fixed')
+
+
+def record_customer_orders(orders):
+    """
+    Add ``orders`` to their customers' totals and refresh the totals of the
+    Customer instances they reference.
+    """
+    totals = {}
+    for order in orders:
+        count, value, last = totals.get(order.customer_id, (0, Decimal('0'), None))
+        totals[order.customer_id] = (
+            count + 1,
+            value + order.total_amount,
+            order.order_date if last is None or order.order_date > last else last,
+        )
+    if not totals:
+        return
+
+    Customer.objects.filter(pk__in=totals).update(
+        order_count=F('order_count') + Case(
+            *[When(pk=pk, then=Value(count)) for pk, (count, _, _) in totals.items()],
+            output_field=IntegerField(),
+        ),
+        lifetime_value=F('lifetime_value') + Case(
+            *[When(pk=pk, then=Value(value)) for pk, (_, value, _) in totals.items()],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        last_order_at=Case(
+            *[
+                When(Q(pk=pk) & (Q(last_order_at__isnull=True) | Q(last_order_at__lt=last)), then=Value(last))
+                for pk, (_, _, last) in totals.items()
+            ],
+            default=F('last_order_at'),
+            output_field=DateTimeField(),
+        ),
+    )
+    # update() sends no signals
+    invalidate_on_commit(Customer)
+
+    current = {
+        row['pk']: row
+        for row in Customer.objects.filter(pk__in=totals).values('pk', *TOTAL_FIELDS)
+    }
+    for order in orders:
+        customer = order.customer
+        for field in TOTAL_FIELDS:
+            setattr(customer, field, current[customer.pk][field])
+
+
+def actual_totals():
+    """Expressions computing each customer's totals from the orders table."""
+    orders = Order.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+    return {
+        'order_count': Coalesce(
+            Subquery(orders.annotate(value=Count('pk')).values('value')), Value(0),
+        ),
+        'lifetime_value': Coalesce(
+            Subquery(orders.annotate(value=Sum('total_amount')).values('value')), Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        'last_order_at': Subquery(orders.annotate(value=Max('order_date')).values('value')),
+    }
+
+
+def reconcile(batch_size=1000):
+    """
+    Recompute the totals of every customer, ``batch_size`` customers per
+    transaction, writing only the rows that were out of date. Returns a
+    ReconcileResult.
+    """
+    if batch_size < 1:
+        raise ValueError("Batch size must be positive")
+    checked = fixed = 0
+    last_id = 0
+    expressions = actual_totals()
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Customer.objects.filter(pk__gt=last_id).order_by('pk')
+                .annotate(**{f'actual_{field}': expressions[field] for field in TOTAL_FIELDS})
+                .values('pk', *TOTAL_FIELDS, *(f'actual_{field}' for field in TOTAL_FIELDS))[:batch_size]
+            )
+            if not rows:
+                break
+            stale = [
+                row['pk'] for row in rows
+                if any(row[field] != row[f'actual_{field}'] for field in TOTAL_FIELDS)
+            ]
+            if stale:
+                Customer.objects.filter(pk__in=stale).update(**expressions)
+                invalidate_on_commit(Customer)
+        checked += len(rows)
+        fixed += len(stale)
+        last_id = rows[-1]['pk']
+    return ReconcileResult(checked, fixed)
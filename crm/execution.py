@@ -0,0 +1,45 @@
+"""
+Concurrent execution of root query fields for the async GraphQL view.
+
+The CRM resolvers are synchronous (graphene-django connection fields,
+lazy querysets, the batch loaders), so they cannot run on the event loop.
+``ConcurrentRootExecutionContext`` instead hands every root field of a query
+to a worker thread and completes the whole subtree there; graphql-core
+then gathers the root fields, so ``allCustomers`` and ``allOrders`` in the
+same document hit the database at the same time, each on its own
+connection. Mutations keep graphql-core's serial execution.
+"""
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from graphql import ExecutionContext, OperationType
+
+
+class ConcurrentRootExecutionContext(ExecutionContext):
+
+    def execute_field(self, parent_type, source, field_nodes, path):
+        if (
+            path.prev is not None
+            or self.operation.operation != OperationType.QUERY
+            or field_nodes[0].name.value.startswith('__')
+        ):
+            return super().execute_field(parent_type, source, field_nodes, path)
+        return self.execute_root_field(parent_type, source, field_nodes, path)
+
+    async def execute_root_field(self, parent_type, source, field_nodes, path):
+        result = await sync_to_async(self.execute_field_in_thread, thread_sensitive=False)(
+            parent_type, source, field_nodes, path
+        )
+        if self.is_awaitable(result):
+            # An async resolver below the root: finish it on the loop
+            result = await result
+        return result
+
+    def execute_field_in_thread(self, parent_type, source, field_nodes, path):
+        # Worker threads outlive requests, so manage their connections the
+        # way request_started/request_finished do for request threads.
+        close_old_connections()
+        try:
+            return super().execute_field(parent_type, source, field_nodes, path)
+        finally:
+            close_old_connections()
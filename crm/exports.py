@@ -0,0 +1,150 @@
+"""
+Streaming order exports.
+
+Orders matching an OrderFilter are read with ``QuerySet.iterator()`` (or
+``aiterator()`` under ASGI) in chunks of ``CRM_EXPORT_CHUNK_SIZE``, with the
+customer joined in and the items prefetched per chunk, and rendered one
+order at a time. Memory use depends on the chunk size, not on the number of
+orders; on PostgreSQL the rows come from a server-side cursor.
+
+* NDJSON: one JSON object per order, with nested ``customer`` and
+  ``items``.
+* CSV: one row per order item; an order without items gets a single row
+  with empty item columns.
+"""
+
+import csv
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from .filters import OrderFilter
+from .models import Order, OrderItem
+
+
+def export_chunk_size():
+    return getattr(settings, 'CRM_EXPORT_CHUNK_SIZE', 2000)
+
+
+def export_queryset(params):
+    """
+    Orders matching the OrderFilter arguments in ``params``, in primary key
+    order. Raises ValidationError for invalid arguments.
+    """
+    queryset = (
+        Order.objects.select_related('customer')
+        .only('id', 'order_date', 'total_amount', 'customer__id', 'customer__name', 'customer__email')
+        .prefetch_related(Prefetch(
+            'items',
+            queryset=OrderItem.objects.select_related('product')
+            .only('order', 'quantity', 'unit_price', 'product__id', 'product__name'),
+        ))
+        .order_by('pk')
+    )
+    filterset = OrderFilter(params, queryset=queryset)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    queryset = filterset.qs
+    # Filters through the products relation repeat an order per match
+    product_filters = [
+        name for name, f in filterset.filters.items() if f.field_name.startswith('products__')
+    ]
+    if any(filterset.form.cleaned_data.get(name) not in (None, '') for name in product_filters):
+        queryset = queryset.distinct()
+    return queryset
+
+
+class Echo:
+    """File-like object handing back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+class NDJSONRenderer:
+    content_type = 'application/x-ndjson'
+    extension = 'ndjson'
+
+    def header(self):
+        return ''
+
+    def render(self, order):
+        customer = order.customer
+        row = {
+            'id': order.pk,
+            'order_date': order.order_date,
+            'total_amount': order.total_amount,
+            'customer': {'id': customer.pk, 'name': customer.name, 'email': customer.email},
+            'items': [
+                {
+                    'product_id': item.product.pk,
+                    'product_name': item.product.name,
+                    'quantity': item.quantity,
+                    'unit_price': item.unit_price,
+                }
+                for item in order.items.all()
+            ],
+        }
+        return json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+class CSVRenderer:
+    content_type = 'text/csv'
+    extension = 'csv'
+    columns = [
+        'order_id', 'order_date', 'total_amount',
+        'customer_id', 'customer_name', 'customer_email',
+        'product_id', 'product_name', 'quantity', 'unit_price',
+    ]
+
+    def __init__(self):
+        self.writer = csv.writer(Echo())
+
+    def header(self):
+        return self.writer.writerow(self.columns)
+
+    def render(self, order):
+        customer = order.customer
+        prefix = [
+            order.pk, order.order_date.isoformat(), order.total_amount,
+            customer.pk, customer.name, customer.email,
+        ]
+        items = order.items.all() or [None]
+        return ''.join(
+            self.writer.writerow(
+                prefix + (
+                    [item.product.pk, item.product.name, item.quantity, item.unit_price]
+                    if item else ['', '', '', '']
+                )
+            )
+            for item in items
+        )
+
+
+RENDERERS = {renderer.extension: renderer for renderer in (NDJSONRenderer, CSVRenderer)}
+
+
+def get_renderer(format):
+    try:
+        return RENDERERS[format]()
+    except KeyError:
+        raise ValidationError(
+            f"Unknown export format '{format}', expected one of: {', '.join(RENDERERS)}"
+        )
+
+
+def stream_orders(queryset, renderer, chunk_size=None):
+    """Yield the rendered export of ``queryset`` piece by piece."""
+    yield renderer.header()
+    for order in queryset.iterator(chunk_size=chunk_size or export_chunk_size()):
+        yield renderer.render(order)
+
+
+async def astream_orders(queryset, renderer, chunk_size=None):
+    """stream_orders for ASGI, which cannot stream synchronous iterators."""
+    yield renderer.header()
+    async for order in queryset.aiterator(chunk_size=chunk_size or export_chunk_size()):
+        yield renderer.render(order)
@@ -0,0 +1,86 @@
+"""
+Connection fields used by the CRM GraphQL schema.
+"""
+
+from functools import partial
+
+import graphene
+from graphene_django.filter import DjangoFilterConnectionField
+
+from .loaders import get_loaders
+from .pagination import check_order, keyset_connection, ordering
+
+PAGINATION_ARGS = {'first', 'last', 'before', 'after', 'offset'}
+
+
+def has_filter_args(kwargs):
+    """Return True if any non-pagination argument was supplied."""
+    return any(v is not None for k, v in kwargs.items() if k not in PAGINATION_ARGS)
+
+
+class BatchedConnectionField(DjangoFilterConnectionField):
+    """
+    Filter connection field that primes the request's loaders with the
+    nodes of each page it returns, and accepts already-batched lists.
+    """
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        # Lists come from a loader and are only returned when no filters apply
+        if isinstance(iterable, list):
+            return iterable
+        return super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager, queryset_resolver,
+                            max_limit, enforce_first_or_last, root, info, **args):
+        result = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        get_loaders(info).prime(edge.node for edge in result.edges)
+        return result
+
+
+class KeysetConnectionField(BatchedConnectionField):
+    """
+    Root connection field with an ``orderBy`` argument and an opt-in
+    ``keyset`` mode whose cursors encode the last-seen sort key and id.
+
+    ``orderBy`` accepts only the columns in ``order_fields``, which should
+    be local and indexed; the primary key is always the tiebreaker.
+    """
+
+    def __init__(self, type_, *args, order_fields=(), **kwargs):
+        self.order_fields = tuple(order_fields)
+        super().__init__(type_, *args, **kwargs)
+        self._base_args = {
+            **(self._base_args or {}),
+            'order_by': graphene.String(),
+            'keyset': graphene.Boolean(default_value=False),
+        }
+
+    def wrap_resolve(self, parent_resolver):
+        return partial(self.ordered_resolver, super().wrap_resolve(parent_resolver), self.order_fields)
+
+    @staticmethod
+    def ordered_resolver(resolver, order_fields, root, info, **args):
+        if args.get('order_by'):
+            args['order_by'] = check_order(args['order_by'], order_fields)
+        return resolver(root, info, **args)
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        qs = super().resolve_queryset(connection, iterable, info, args, filtering_args, filterset_class)
+        # keyset_connection applies its own ordering
+        if isinstance(qs, list) or args.get('keyset') or not args.get('order_by'):
+            return qs
+        return qs.order_by(*ordering(args['order_by']))
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        if args.get('keyset'):
+            return keyset_connection(connection, args, iterable, max_limit)
+        return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
@@ -1,23 +1,44 @@
 import django_filters
 from .models import Customer, Product, Order
 from django.db.models import Q
+from .search import get_search_backend
 
-class CustomerFilter(django_filters.FilterSet):
-    name_icontains = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
-    email_icontains = django_filters.CharFilter(field_name='email', lookup_expr='icontains')
+
+class SearchFilterSet(django_filters.FilterSet):
+    """FilterSet whose substring filters go through the configured search backend."""
+
+    def filter_contains(self, queryset, name, value):
+        return get_search_backend(queryset.db).filter(queryset, name, value)
+
+class CustomerFilter(SearchFilterSet):
+    name_icontains = django_filters.CharFilter(field_name='name', method='filter_contains')
+    email_icontains = django_filters.CharFilter(field_name='email', method='filter_contains')
     created_at_gte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_at_lte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
+    order_count_gte = django_filters.NumberFilter(field_name='order_count', lookup_expr='gte')
+    order_count_lte = django_filters.NumberFilter(field_name='order_count', lookup_expr='lte')
+    lifetime_value_gte = django_filters.NumberFilter(field_name='lifetime_value', lookup_expr='gte')
+    lifetime_value_lte = django_filters.NumberFilter(field_name='lifetime_value', lookup_expr='lte')
+    last_order_at_gte = django_filters.DateTimeFilter(field_name='last_order_at', lookup_expr='gte')
+    last_order_at_lte = django_filters.DateTimeFilter(field_name='last_order_at', lookup_expr='lte')
 
     def filter_phone_pattern(self, queryset, name, value):
+        # LIKE 'value%' is served by crm_customer_phone_idx on PostgreSQL
+        # (varchar_pattern_ops); SQLite never uses an index for LIKE ... ESCAPE
+        # and scans the table
         return queryset.filter(phone__startswith=value)
 
     class Meta:
         model = Customer
-        fields = ['name_icontains', 'email_icontains', 'created_at_gte', 'created_at_lte', 'phone_pattern']
+        fields = [
+            'name_icontains', 'email_icontains', 'created_at_gte', 'created_at_lte', 'phone_pattern',
+            'order_count_gte', 'order_count_lte', 'lifetime_value_gte', 'lifetime_value_lte',
+            'last_order_at_gte', 'last_order_at_lte',
+        ]
 
-class ProductFilter(django_filters.FilterSet):
-    name_icontains = django_filters.CharFilter(field_name='name', lookup_expr='icontains')
+class ProductFilter(SearchFilterSet):
+    name_icontains = django_filters.CharFilter(field_name='name', method='filter_contains')
     price_gte = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     price_lte = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
     stock_gte = django_filters.NumberFilter(field_name='stock', lookup_expr='gte')
@@ -27,13 +48,13 @@ class ProductFilter(django_filters.FilterSet):
         model = Product
         fields = ['name_icontains', 'price_gte', 'price_lte', 'stock_gte', 'stock_lte']
 
-class OrderFilter(django_filters.FilterSet):
+class OrderFilter(SearchFilterSet):
     total_amount_gte = django_filters.NumberFilter(field_name='total_amount', lookup_expr='gte')
     total_amount_lte = django_filters.NumberFilter(field_name='total_amount', lookup_expr='lte')
     order_date_gte = django_filters.DateTimeFilter(field_name='order_date', lookup_expr='gte')
     order_date_lte = django_filters.DateTimeFilter(field_name='order_date', lookup_expr='lte')
-    customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
-    product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains')
+    customer_name = django_filters.CharFilter(field_name='customer__name', method='filter_contains')
+    product_name = django_filters.CharFilter(field_name='products__name', method='filter_contains')
     product_id = django_filters.NumberFilter(field_name='products__id')
 
     class Meta:
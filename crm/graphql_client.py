@@ -0,0 +1,121 @@
+"""
+GraphQL execution for scheduled jobs and tasks.
+
+``execute_graphql`` runs a document against the project schema and returns
+its ``data``, raising GraphQLClientError if the operation failed. By
+default the document runs in-process, so cron jobs and Celery workers need
+neither a running web server nor free web workers. With
+``CRM_GRAPHQL_CLIENT['MODE'] = 'http'`` it is posted to ``URL`` instead, on
+a keep-alive session shared by the process.
+"""
+
+import threading
+from contextlib import nullcontext
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpRequest
+from graphql import GraphQLError, OperationType, execute, get_operation_ast, parse, validate
+from requests.adapters import HTTPAdapter
+
+DEFAULTS = {
+    'MODE': 'local',  # 'local' or 'http'
+    'URL': 'http://localhost:8000/graphql',
+    'TIMEOUT': 30,
+    # Keep-alive connections kept open by the HTTP session
+    'POOL_SIZE': 4,
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class GraphQLClientError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(errors))
+
+
+def client_settings():
+    return {**DEFAULTS, **getattr(settings, 'CRM_GRAPHQL_CLIENT', {})}
+
+
+def execute_graphql(query, variables=None, operation_name=None, mode=None):
+    """Run ``query`` and return its ``data``."""
+    config = client_settings()
+    mode = mode or config['MODE']
+    if mode == 'local':
+        return execute_local(query, variables, operation_name)
+    if mode == 'http':
+        return execute_http(query, variables, operation_name, config)
+    raise ValueError(f"Unknown GraphQL client mode '{mode}', expected 'local' or 'http'")
+
+
+@lru_cache(maxsize=64)
+def get_document(query):
+    """Parse and validate ``query`` once per process."""
+    from alx_backend_graphql.schema import schema
+
+    try:
+        document = parse(query)
+    except GraphQLError as error:
+        raise GraphQLClientError([error.message])
+    errors = validate(schema.graphql_schema, document)
+    if errors:
+        raise GraphQLClientError([error.message for error in errors])
+    return document
+
+
+def execute_local(query, variables=None, operation_name=None):
+    from alx_backend_graphql.schema import schema
+
+    document = get_document(query)
+    operation_ast = get_operation_ast(document, operation_name)
+    # Same as ATOMIC_MUTATIONS on the view
+    atomic = operation_ast is not None and operation_ast.operation == OperationType.MUTATION
+    request = HttpRequest()
+    request.method = 'POST'
+    with transaction.atomic() if atomic else nullcontext():
+        result = execute(
+            schema.graphql_schema, document,
+            context_value=request,
+            variable_values=variables,
+            operation_name=operation_name,
+        )
+        if result.errors and atomic:
+            transaction.set_rollback(True)
+    if result.errors:
+        raise GraphQLClientError([error.message for error in result.errors])
+    return result.data
+
+
+def get_session():
+    """The process-wide HTTP session, created on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            size = client_settings()['POOL_SIZE']
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def execute_http(query, variables, operation_name, config):
+    payload = {'query': query, 'variables': variables or {}}
+    if operation_name:
+        payload['operationName'] = operation_name
+    response = get_session().post(config['URL'], json=payload, timeout=config['TIMEOUT'])
+    try:
+        body = response.json()
+    except ValueError:
+        response.raise_for_status()
+        raise GraphQLClientError([f"Invalid response from {config['URL']}"])
+    if body.get('errors'):
+        raise GraphQLClientError([error.get('message', str(error)) for error in body['errors']])
+    response.raise_for_status()
+    return body.get('data')
@@ -0,0 +1,192 @@
+"""
+Liveness and readiness probes.
+
+``/healthz`` answers as soon as the process can serve a request. ``/readyz``
+also checks that the database, the cache and the Celery broker are
+reachable, timing each of them::
+
+    {"status": "ok", "checks": {"database": {"ok": true, "latency_ms": 0.41}, ...}}
+
+and answers 503 when one of them is not. Both are answered by
+``HealthCheckWSGIApp``/``HealthCheckASGIApp``, wrapped around the Django
+application in ``alx_backend_graphql/wsgi.py`` and ``asgi.py``, so a probe
+never goes through URL resolution, middleware or GraphQL and is cheap
+enough to run every few seconds.
+"""
+
+import json
+import time
+import uuid
+from urllib.parse import urljoin
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, connection
+
+DEFAULTS = {
+    'CHECKS': ('database', 'cache', 'broker'),
+    'CACHE_ALIAS': 'default',
+    # Seconds to wait for the broker
+    'TIMEOUT': 2,
+    # How log_crm_heartbeat probes readiness: by getting URL from the
+    # running web server ('http'), or in-process ('local', which only checks
+    # the dependencies, not the server)
+    'MODE': 'http',
+    # None: /readyz on the server of CRM_GRAPHQL_CLIENT['URL']
+    'URL': None,
+}
+
+HEALTH_PATH = '/healthz'
+READY_PATH = '/readyz'
+
+
+def health_settings():
+    return {**DEFAULTS, **getattr(settings, 'CRM_HEALTH', {})}
+
+
+def check_database(config):
+    connection.ensure_connection()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def check_cache(config):
+    cache = caches[config['CACHE_ALIAS']]
+    key = 'crm:readyz'
+    value = uuid.uuid4().hex
+    cache.set(key, value, 10)
+    if cache.get(key) != value:
+        raise RuntimeError("Value written to the cache could not be read back")
+
+
+def check_broker(config):
+    from crm.celery import app
+
+    with app.connection_for_write() as conn:
+        # A single attempt: no retries, no back-off
+        conn.ensure_connection(max_retries=0, timeout=config['TIMEOUT'])
+
+
+CHECKS = {
+    'database': check_database,
+    'cache': check_cache,
+    'broker': check_broker,
+}
+
+
+def readiness():
+    """Run the configured checks and return ``(ready, checks)``."""
+    config = health_settings()
+    checks = {}
+    for name in config['CHECKS']:
+        start = time.perf_counter()
+        try:
+            CHECKS[name](config)
+        except Exception as e:
+            result = {'ok': False, 'error': str(e) or type(e).__name__}
+        else:
+            result = {'ok': True}
+        result['latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        checks[name] = result
+    return all(check['ok'] for check in checks.values()), checks
+
+
+def probe_response(path):
+    """``(status, body)`` for a probe path, or None for any other path."""
+    if path == HEALTH_PATH:
+        return 200, {'status': 'ok'}
+    if path == READY_PATH:
+        # Probes skip Django's request cycle, which would otherwise close
+        # connections past CONN_MAX_AGE before and after the request
+        close_old_connections()
+        try:
+            ready, checks = readiness()
+        finally:
+            close_old_connections()
+        return (200 if ready else 503), {'status': 'ok' if ready else 'unavailable', 'checks': checks}
+    return None
+
+
+def encode(body):
+    return json.dumps(body).encode('utf-8')
+
+
+class HealthCheckWSGIApp:
+    """Answer the probe paths before handing any other request to ``app``."""
+
+    REASONS = {200: '200 OK', 503: '503 Service Unavailable'}
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') not in (HEALTH_PATH, READY_PATH):
+            return self.app(environ, start_response)
+        status, body = probe_response(environ['PATH_INFO'])
+        content = encode(body)
+        start_response(self.REASONS[status], [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(content))),
+            ('Cache-Control', 'no-store'),
+        ])
+        return [content]
+
+
+class HealthCheckASGIApp:
+    """ASGI variant of HealthCheckWSGIApp; checks run in a worker thread."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in (HEALTH_PATH, READY_PATH):
+            return await self.app(scope, receive, send)
+        if scope['path'] == HEALTH_PATH:
+            status, body = probe_response(HEALTH_PATH)
+        else:
+            status, body = await sync_to_async(probe_response)(READY_PATH)
+        content = encode(body)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(content)).encode()),
+                (b'cache-control', b'no-store'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+
+def ready_url(config):
+    if config['URL']:
+        return config['URL']
+    from crm.graphql_client import client_settings
+
+    return urljoin(client_settings()['URL'], READY_PATH)
+
+
+def probe(mode=None):
+    """
+    Readiness as seen by a scheduled job: ``(ready, checks, latency_ms)``,
+    either fetched from the web server's ``/readyz`` or checked in-process.
+    """
+    config = health_settings()
+    mode = mode or config['MODE']
+    start = time.perf_counter()
+    if mode == 'local':
+        ready, checks = readiness()
+    elif mode == 'http':
+        from crm.graphql_client import get_session
+
+        response = get_session().get(ready_url(config), timeout=config['TIMEOUT'])
+        try:
+            checks = response.json().get('checks', {})
+        except ValueError:
+            checks = {}
+        ready = response.status_code == 200
+    else:
+        raise ValueError(f"Unknown health probe mode '{mode}', expected 'local' or 'http'")
+    return ready, checks, round((time.perf_counter() - start) * 1000, 2)
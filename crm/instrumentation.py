@@ -0,0 +1,276 @@
+"""
+Per-request instrumentation for the GraphQL endpoint.
+
+While a request executes, the active RequestTrace is kept in a context
+variable, which asgiref copies into the worker threads of the async view.
+
+* TracingMiddleware (listed in ``GRAPHENE['MIDDLEWARE']``) times every field
+  resolver. Children are resolved after their parent returns, so each
+  duration is the resolver's own time.
+* ``record_sql`` is installed as an execute wrapper on every database
+  connection and counts the queries issued for the active trace.
+
+Each finished trace feeds the in-process ``metrics`` registry that
+``/metrics`` renders in Prometheus text format (for staff users, under
+``DEBUG`` or with ``CRM_GRAPHQL_METRICS['METRICS_TOKEN']`` as a bearer
+token). When the request carries the debug header, the trace is also
+returned under ``extensions.tracing``.
+The header is honoured if ``DEBUG`` is on or if its value equals
+``CRM_GRAPHQL_METRICS['DEBUG_TOKEN']``.
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DEBUG_HEADER': 'X-CRM-Debug',
+    'DEBUG_TOKEN': None,
+    # Bearer token for /metrics; staff users and DEBUG need none
+    'METRICS_TOKEN': None,
+    # Recent samples kept per series to compute quantiles
+    'SAMPLE_SIZE': 1024,
+    'QUANTILES': (0.5, 0.9, 0.99),
+}
+
+current_trace = ContextVar('crm_trace', default=None)
+
+
+def metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'CRM_GRAPHQL_METRICS', {})}
+
+
+def debug_requested(request, config):
+    value = request.headers.get(config['DEBUG_HEADER'])
+    if not value or value == '0':
+        return False
+    return settings.DEBUG or (config['DEBUG_TOKEN'] is not None and value == config['DEBUG_TOKEN'])
+
+
+class Summary:
+    """Count, sum and a window of recent samples of one series."""
+
+    def __init__(self, size):
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=size)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantile(self, q):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return float('nan')
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+class MetricsRegistry:
+    """Thread-safe in-process summaries and counters."""
+
+    HELP = {
+        'crm_graphql_request_duration_seconds': ('summary', "Time to answer a GraphQL operation"),
+        'crm_graphql_sql_queries': ('summary', "SQL queries issued per GraphQL operation"),
+        'crm_graphql_sql_duration_seconds': ('summary', "Time spent in SQL per GraphQL operation"),
+        'crm_graphql_resolver_duration_seconds': ('summary', "Time spent in a field's resolver per operation"),
+        'crm_graphql_errors_total': ('counter', "GraphQL operations answered with errors"),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._summaries = {}
+        self._counters = defaultdict(int)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = Summary(metrics_settings()['SAMPLE_SIZE'])
+            summary.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def clear(self):
+        with self._lock:
+            self._summaries.clear()
+            self._counters.clear()
+
+    def get(self, name, **labels):
+        """The Summary or counter value of a series, or None."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self._summaries:
+                return self._summaries[key]
+            return self._counters.get(key)
+
+    def render(self, extra=()):
+        """
+        Prometheus text exposition of every series, followed by ``extra``
+        ``(name, type, help, value)`` samples taken by the caller.
+        """
+        quantiles = metrics_settings()['QUANTILES']
+        with self._lock:
+            series = defaultdict(list)
+            for (name, labels), summary in self._summaries.items():
+                series[name].append((labels, summary))
+            for (name, labels), value in self._counters.items():
+                series[name].append((labels, value))
+
+            lines = []
+            for name in sorted(series):
+                kind, help_text = self.HELP.get(name, ('untyped', name))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series[name], key=lambda item: item[0]):
+                    if kind != 'summary':
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+                        continue
+                    for q in quantiles:
+                        lines.append(
+                            f"{name}{format_labels(labels + (('quantile', q),))} {value.quantile(q)}"
+                        )
+                    lines.append(f"{name}_sum{format_labels(labels)} {value.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {value.count}")
+        for name, kind, help_text, value in extra:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+metrics = MetricsRegistry()
+
+
+class RequestTrace:
+    """Resolver and SQL timings of one GraphQL operation."""
+
+    def __init__(self, debug=False):
+        self.debug = debug
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.queries = []
+        # "Type.field" -> total resolver time
+        self.fields = defaultdict(float)
+        self.resolvers = []
+        self._lock = threading.Lock()
+
+    def record_field(self, info, duration):
+        field = f"{info.parent_type.name}.{info.field_name}"
+        with self._lock:
+            self.fields[field] += duration
+            if self.debug:
+                self.resolvers.append({
+                    'path': info.path.as_list(),
+                    'field': field,
+                    'duration': round(duration * 1000, 3),
+                })
+
+    def record_query(self, sql, duration):
+        with self._lock:
+            self.sql_count += 1
+            self.sql_time += duration
+            if self.debug:
+                self.queries.append({'sql': sql, 'duration': round(duration * 1000, 3)})
+
+    def finish(self, result):
+        """Publish the trace to ``metrics`` and, in debug mode, to ``result``."""
+        duration = time.perf_counter() - self.start
+        metrics.observe('crm_graphql_request_duration_seconds', duration)
+        metrics.observe('crm_graphql_sql_queries', self.sql_count)
+        metrics.observe('crm_graphql_sql_duration_seconds', self.sql_time)
+        for field, field_time in self.fields.items():
+            metrics.observe('crm_graphql_resolver_duration_seconds', field_time, field=field)
+        if result is not None and result.errors:
+            metrics.inc('crm_graphql_errors_total')
+
+        if self.debug and result is not None:
+            result.extensions = {
+                **(result.extensions or {}),
+                'tracing': {
+                    'duration': round(duration * 1000, 3),
+                    'sql': {
+                        'count': self.sql_count,
+                        'duration': round(self.sql_time * 1000, 3),
+                        'queries': self.queries,
+                    },
+                    'resolvers': self.resolvers,
+                },
+            }
+        return result
+
+
+@contextmanager
+def tracing(request):
+    """
+    Make a RequestTrace current for the block. Yields None when
+    instrumentation is disabled.
+    """
+    config = metrics_settings()
+    if not config['ENABLED']:
+        yield None
+        return
+    trace = RequestTrace(debug=debug_requested(request, config))
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+def finish_trace(trace, result):
+    return trace.finish(result) if trace is not None else result
+
+
+class TracingMiddleware:
+    """Graphene middleware timing each resolver of the current trace."""
+
+    def resolve(self, next, root, info, **args):
+        trace = current_trace.get()
+        if trace is None:
+            return next(root, info, **args)
+        start = time.perf_counter()
+        try:
+            return next(root, info, **args)
+        finally:
+            trace.record_field(info, time.perf_counter() - start)
+
+
+def record_sql(execute, sql, params, many, context):
+    trace = current_trace.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        trace.record_query(sql, time.perf_counter() - start)
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver. The wrapper goes first so that
+    ``execute_wrapper()`` blocks, which pop the last wrapper, keep working.
+    """
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_sql)
@@ -0,0 +1,208 @@
+"""
+Structured logs for cron jobs and Celery tasks.
+
+Each job writes JSON lines to ``<DIRECTORY>/<job>_log.txt``::
+
+    with job_log('crm_report') as log:
+        log.info("Report generated", customers=12, orders=40)
+
+Records are buffered in memory and written when the block exits, with one
+write and one flush per job run however many records it logged (or
+earlier, every ``BUFFER_SIZE`` records, for very chatty jobs). Files are
+rotated to ``.1`` .. ``.BACKUP_COUNT`` when they would grow past
+``MAX_BYTES`` and, with ``ROTATE_WHEN`` set to ``'daily'`` or
+``'hourly'``, when the last write happened in an earlier period. The file's
+modification time is used, so rotation also works for cron jobs that run in
+a new process every time.
+
+With ``BACKGROUND`` on, the writes are handed to a daemon thread through a
+queue, so the job does not wait for the disk; the queue is drained when the
+process exits.
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+DEFAULTS = {
+    'DIRECTORY': '/tmp',
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    'ROTATE_WHEN': None,  # None, 'daily' or 'hourly'
+    'BUFFER_SIZE': 1000,
+    'BACKGROUND': False,
+}
+
+PERIOD_FORMATS = {'daily': '%Y%m%d', 'hourly': '%Y%m%d%H'}
+
+
+def joblog_settings():
+    return {**DEFAULTS, **getattr(settings, 'CRM_JOB_LOGS', {})}
+
+
+def log_path(job, config=None):
+    config = config or joblog_settings()
+    return os.path.join(config['DIRECTORY'], f"{job}_log.txt")
+
+
+class RotatingFile:
+    """An append-only file rotated by size and/or period, written in blocks."""
+
+    def __init__(self, path, max_bytes=0, backup_count=0, when=None):
+        if when is not None and when not in PERIOD_FORMATS:
+            raise ValueError(f"Unknown rotation period '{when}', expected one of: {', '.join(PERIOD_FORMATS)}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.period_format = PERIOD_FORMATS.get(when)
+        self._lock = threading.Lock()
+
+    def should_rotate(self, size):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if not stat.st_size:
+            return False
+        if self.max_bytes and stat.st_size + size > self.max_bytes:
+            return True
+        if self.period_format:
+            written = time.strftime(self.period_format, time.localtime(stat.st_mtime))
+            return written != time.strftime(self.period_format)
+        return False
+
+    def rotate(self):
+        if self.backup_count < 1:
+            os.remove(self.path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        with self._lock:
+            if self.should_rotate(len(data)):
+                self.rotate()
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                f.flush()
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def get_file(path, config):
+    key = (path, config['MAX_BYTES'], config['BACKUP_COUNT'], config['ROTATE_WHEN'])
+    with _files_lock:
+        if key not in _files:
+            _files[key] = RotatingFile(path, config['MAX_BYTES'], config['BACKUP_COUNT'], config['ROTATE_WHEN'])
+        return _files[key]
+
+
+class BackgroundWriter:
+    """Daemon thread writing blocks queued by ``put``."""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self._lock = threading.Lock()
+
+    def put(self, target, text):
+        with self._lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='crm-joblog', daemon=True)
+                self.thread.start()
+        self.queue.put((target, text))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            target, text = item
+            try:
+                target.write(text)
+            except OSError:
+                pass
+
+    def stop(self):
+        """Write what is queued and stop the thread."""
+        with self._lock:
+            thread, self.thread = self.thread, None
+        if thread is not None and thread.is_alive():
+            self.queue.put(None)
+            thread.join()
+
+
+background_writer = BackgroundWriter()
+atexit.register(background_writer.stop)
+
+
+class JobLog:
+    """Buffered JSON-lines log of one job run."""
+
+    def __init__(self, job, config=None):
+        self.job = job
+        self.config = config or joblog_settings()
+        self.path = log_path(job, self.config)
+        self.records = []
+
+    def log(self, level, message, **fields):
+        self.records.append({
+            'time': timezone.now().isoformat(),
+            'job': self.job,
+            'level': level,
+            'message': message,
+            **fields,
+        })
+        if len(self.records) >= self.config['BUFFER_SIZE']:
+            self.flush()
+
+    def info(self, message, **fields):
+        self.log('info', message, **fields)
+
+    def error(self, message, **fields):
+        self.log('error', message, **fields)
+
+    def flush(self):
+        if not self.records:
+            return
+        text = ''.join(json.dumps(record, cls=DjangoJSONEncoder) + '\n' for record in self.records)
+        self.records = []
+        target = get_file(self.path, self.config)
+        if self.config['BACKGROUND']:
+            background_writer.put(target, text)
+        else:
+            target.write(text)
+
+
+@contextmanager
+def job_log(job):
+    """
+    A JobLog for ``job``, flushed when the block exits. An exception
+    escaping the block is logged before it propagates.
+    """
+    log = JobLog(job)
+    try:
+        yield log
+    except Exception as e:
+        log.error(f"Unhandled error: {e}", error=type(e).__name__)
+        raise
+    finally:
+        try:
+            log.flush()
+        except OSError:
+            # Logging must never break the job itself
+            pass
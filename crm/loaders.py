@@ -0,0 +1,150 @@
+"""
+Request-scoped batch loaders for the CRM GraphQL schema.
+
+Every GraphQL execution gets its own LoaderRegistry, stored on the execution
+context. Connection fields prime the registry with the page of nodes they
+return, so the first nested lookup of a relation fetches the keys of the
+whole page with a single ``IN (...)`` query instead of one query per node.
+"""
+
+import threading
+
+from crm.models import Customer, Product, Order, OrderItem
+
+LOADERS_ATTR = '_crm_loaders'
+
+
+class BatchLoader:
+    """
+    Batch and cache lookups for a single relation.
+
+    ``batch_load_fn`` receives a list of keys and returns a dict mapping each
+    key to its value. Keys queued with ``prime`` are fetched together with
+    the first ``load`` that misses the cache.
+    """
+
+    def __init__(self, batch_load_fn):
+        self.batch_load_fn = batch_load_fn
+        self._cache = {}
+        # dict used as an insertion-ordered set
+        self._pending = {}
+
+    def prime(self, keys):
+        for key in keys:
+            if key is not None and key not in self._cache:
+                self._pending[key] = None
+
+    def load(self, key):
+        if key is None:
+            return None
+        if key not in self._cache:
+            self._pending[key] = None
+            self.dispatch()
+        return self._cache.get(key)
+
+    def dispatch(self):
+        keys = list(self._pending)
+        self._pending.clear()
+        if not keys:
+            return
+        results = self.batch_load_fn(keys)
+        for key in keys:
+            self._cache[key] = results.get(key)
+
+
+class LoaderRegistry:
+    """The set of loaders shared by one GraphQL execution."""
+
+    def __init__(self):
+        self.customers = BatchLoader(self._load_customers)
+        self.products = BatchLoader(self._load_products)
+        self.order_products = BatchLoader(self._load_order_products)
+        self.order_items = BatchLoader(self._load_order_items)
+        self.customer_orders = BatchLoader(self._load_customer_orders)
+        self.product_orders = BatchLoader(self._load_product_orders)
+
+    def prime(self, instances):
+        """Queue the relation keys of freshly fetched model instances."""
+        for obj in instances:
+            if isinstance(obj, Order):
+                self.customers.prime([obj.customer_id])
+                self.order_products.prime([obj.pk])
+                self.order_items.prime([obj.pk])
+            elif isinstance(obj, Customer):
+                self.customer_orders.prime([obj.pk])
+            elif isinstance(obj, Product):
+                self.product_orders.prime([obj.pk])
+
+    def _load_customers(self, keys):
+        customers = Customer.objects.in_bulk(keys)
+        self.prime(customers.values())
+        return customers
+
+    def _load_products(self, keys):
+        products = Product.objects.in_bulk(keys)
+        self.prime(products.values())
+        return products
+
+    def _load_order_products(self, keys):
+        products = {key: [] for key in keys}
+        rows = (
+            OrderItem.objects
+            .filter(order_id__in=keys)
+            .select_related('product')
+            .order_by('product_id')
+        )
+        for row in rows:
+            products[row.order_id].append(row.product)
+            self.prime([row.product])
+        return products
+
+    def _load_order_items(self, keys):
+        items = {key: [] for key in keys}
+        for item in OrderItem.objects.filter(order_id__in=keys).select_related('product'):
+            items[item.order_id].append(item)
+            self.prime([item.product])
+        return items
+
+    def _load_customer_orders(self, keys):
+        orders = {key: [] for key in keys}
+        for order in Order.objects.filter(customer_id__in=keys).order_by('id'):
+            orders[order.customer_id].append(order)
+            self.prime([order])
+        return orders
+
+    def _load_product_orders(self, keys):
+        orders = {key: [] for key in keys}
+        rows = (
+            OrderItem.objects
+            .filter(product_id__in=keys)
+            .select_related('order')
+            .order_by('order_id')
+        )
+        for row in rows:
+            orders[row.product_id].append(row.order)
+            self.prime([row.order])
+        return orders
+
+
+def get_loaders(info):
+    """
+    Return the LoaderRegistry for the execution ``info`` belongs to.
+
+    The registry lives on ``info.context`` (the Django request under
+    GraphQLView), one per thread: the async view resolves root fields in
+    parallel worker threads and the loaders are not thread-safe. Contexts
+    that cannot carry attributes get a fresh registry per call, which is
+    still correct but does not batch.
+    """
+    context = info.context
+    scope = getattr(context, LOADERS_ATTR, None)
+    if scope is None:
+        scope = threading.local()
+        try:
+            setattr(context, LOADERS_ATTR, scope)
+        except AttributeError:
+            return LoaderRegistry()
+    registry = getattr(scope, 'registry', None)
+    if registry is None:
+        registry = scope.registry = LoaderRegistry()
+    return registry
@@ -0,0 +1,80 @@
+"""
+Benchmark BulkCreateCustomers against the previous row-by-row import loop.
+
+Every run happens inside a transaction that is rolled back, so the command
+leaves the database untouched.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from alx_backend_graphql.schema import schema
+from crm.models import Customer
+from crm.schema import CreateCustomer
+
+MUTATION = """
+mutation BulkCreate($input: [CustomerInput]!, $batchSize: Int) {
+    bulkCreateCustomers(input: $input, batchSize: $batchSize) {
+        errors
+    }
+}
+"""
+
+
+class Rollback(Exception):
+    pass
+
+
+def row_by_row(rows):
+    """The original BulkCreateCustomers loop: one exists() and one save() per row."""
+    for row in rows:
+        if Customer.objects.filter(email=row['email']).exists():
+            continue
+        if row['phone'] and not CreateCustomer.validate_phone(row['phone']):
+            continue
+        Customer(name=row['name'], email=row['email'], phone=row['phone']).save()
+
+
+def set_based(rows, batch_size):
+    result = schema.execute(MUTATION, variable_values={'input': rows, 'batchSize': batch_size})
+    if result.errors:
+        raise result.errors[0]
+
+
+class Command(BaseCommand):
+    help = "Compare rows/sec of the bulk customer import against the per-row loop"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def timed(self, func, *args):
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                func(*args)
+                raise Rollback
+        except Rollback:
+            pass
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        rows = [
+            {
+                'name': f"Bench Customer {i}",
+                'email': f"bench-{i}@example.com",
+                'phone': '+1234567890' if i % 2 else None,
+            }
+            for i in range(options['rows'])
+        ]
+        results = [
+            ('row-by-row loop', self.timed(row_by_row, rows)),
+            ('bulk_create', self.timed(set_based, rows, options['batch_size'])),
+        ]
+        for label, elapsed in results:
+            self.stdout.write(
+                f"{label:16} {len(rows)} rows in {elapsed:.3f}s ({len(rows) / elapsed:,.0f} rows/sec)"
+            )
+        self.stdout.write(f"speedup: {results[0][1] / results[1][1]:.1f}x")
@@ -0,0 +1,93 @@
+"""
+Load-test running GraphQL endpoints and compare their throughput, e.g. the
+sync view under WSGI against the async view under ASGI:
+
+    gunicorn alx_backend_graphql.wsgi -w 4 -b 127.0.0.1:8000
+    uvicorn alx_backend_graphql.asgi:application --workers 4 --port 8001
+    python manage.py benchmark_graphql_servers \\
+        --url wsgi=http://127.0.0.1:8000/graphql \\
+        --url asgi=http://127.0.0.1:8001/graphql/async --concurrency 200
+
+Start the servers with a response cache that is disabled or not shared
+with the benchmark, or every request after the first is a cache hit.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_QUERY = """
+query {
+    allCustomers(first: 20) { edges { node { name email } } }
+    allOrders(first: 20) { edges { node { totalAmount customer { name } } } }
+}
+"""
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Measure throughput and latency of one or more GraphQL endpoints under concurrent load"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', action='append', required=True, metavar='LABEL=URL',
+            help="Endpoint to benchmark; repeat to compare several",
+        )
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--query', default=DEFAULT_QUERY)
+
+    def parse_targets(self, values):
+        targets = []
+        for value in values:
+            label, sep, url = value.partition('=')
+            if not sep:
+                label, url = value, value
+            targets.append((label, url))
+        return targets
+
+    def run(self, url, query, total, concurrency):
+        local = threading.local()
+
+        def send(_):
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            start = time.perf_counter()
+            try:
+                response = session.post(url, json={'query': query}, timeout=60)
+                ok = response.status_code == 200 and not response.json().get('errors')
+            except (requests.RequestException, ValueError):
+                ok = False
+            return time.perf_counter() - start, ok
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            # Warm up connections, caches and the worker processes
+            list(pool.map(send, range(concurrency)))
+            start = time.perf_counter()
+            results = list(pool.map(send, range(total)))
+            elapsed = time.perf_counter() - start
+        return elapsed, results
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        concurrency = options['concurrency']
+        if total < 1 or concurrency < 1:
+            raise CommandError("--requests and --concurrency must be positive")
+
+        for label, url in self.parse_targets(options['url']):
+            elapsed, results = self.run(url, options['query'], total, concurrency)
+            latencies = sorted(latency for latency, _ in results)
+            errors = sum(1 for _, ok in results if not ok)
+            p50, p95, p99 = (percentile(latencies, f) for f in (0.5, 0.95, 0.99))
+            self.stdout.write(
+                f"{label:10} {total} requests, concurrency {concurrency}: "
+                f"{total / elapsed:.1f} req/s, p50 {p50 * 1000:.1f} ms, "
+                f"p95 {p95 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, {errors} errors"
+            )
@@ -0,0 +1,77 @@
+"""
+Benchmark the indexed search backend against plain ``icontains`` on a
+seeded dataset. Seeding happens inside a transaction that is rolled back.
+"""
+
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from crm.models import Customer
+from crm.search import IContainsSearch, get_search_backend
+
+
+class Rollback(Exception):
+    pass
+
+
+def random_word(rng, length):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+class Command(BaseCommand):
+    help = "Compare the configured search backend with icontains on seeded customers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def timed(self, backend, terms, repeat):
+        start = time.perf_counter()
+        matches = 0
+        for _ in range(repeat):
+            for field, term in terms:
+                matches += backend.filter(Customer.objects.all(), field, term).count()
+        return time.perf_counter() - start, matches
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if backend.name == IContainsSearch.name:
+            raise CommandError("No indexed search backend is available on this database")
+
+        rng = random.Random(options['seed'])
+        customers = [
+            Customer(
+                name=f"{random_word(rng, 6).title()} {random_word(rng, 8).title()}",
+                email=f"{random_word(rng, 10)}{i}@example.com",
+            )
+            for i in range(options['rows'])
+        ]
+        step = max(len(customers) // 5, 1)
+        terms = [('name', customers[i].name.split()[1][2:6]) for i in range(0, len(customers), step)]
+        terms += [('email', 'zzqx'), ('name', 'notfound')]
+
+        try:
+            with transaction.atomic():
+                Customer.objects.bulk_create(customers, batch_size=1000)
+                results = [
+                    ('icontains', self.timed(IContainsSearch(), terms, options['repeat'])),
+                    (backend.name, self.timed(backend, terms, options['repeat'])),
+                ]
+                raise Rollback
+        except Rollback:
+            pass
+
+        queries = len(terms) * options['repeat']
+        for label, (elapsed, matches) in results:
+            self.stdout.write(
+                f"{label:10} {queries} queries over {len(customers)} rows in {elapsed:.3f}s "
+                f"({elapsed / queries * 1000:.2f} ms/query, {matches} matches)"
+            )
+        if results[0][1][1] != results[1][1][1]:
+            self.stderr.write("Warning: backends returned different match counts")
+        self.stdout.write(f"speedup: {results[0][1][0] / results[1][1][0]:.1f}x")
@@ -0,0 +1,44 @@
+"""
+Delete customers created more than ``--days`` days ago who never placed an
+order, in small batches (see crm/cleanup.py). An interrupted run resumes
+where it stopped; ``--restart`` discards that progress. The outcome is also
+recorded in the customer_cleanup job log (see crm/joblog.py).
+
+    python manage.py clean_inactive_customers --batch-size 500 --sleep 0.1
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.cleanup import delete_inactive_customers
+from crm.joblog import job_log
+
+
+class Command(BaseCommand):
+    help = "Delete inactive customers in bounded, resumable batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Inactivity threshold (default: INACTIVE_DAYS)")
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--sleep', type=float, help="Seconds to pause between batches")
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches")
+        parser.add_argument('--restart', action='store_true', help="Ignore the progress of an unfinished run")
+
+    def handle(self, *args, **options):
+        with job_log('customer_cleanup') as log:
+            try:
+                result = delete_inactive_customers(
+                    days=options['days'],
+                    batch_size=options['batch_size'],
+                    sleep=options['sleep'],
+                    max_batches=options['max_batches'],
+                    restart=options['restart'],
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+            message = f"Deleted {result.deleted} inactive customers in {result.batches} batches"
+            if result.resumed:
+                message += " (resumed)"
+            if not result.complete:
+                message += "; stopped early, the next run resumes"
+            log.info(message, **result._asdict())
+        self.stdout.write(message)
@@ -0,0 +1,89 @@
+"""
+Run EXPLAIN for every combination of the CRM filter arguments and report
+which ones still scan a whole table instead of searching an index.
+"""
+
+from datetime import datetime, timezone
+from itertools import combinations
+
+import django_filters
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+
+FILTERSETS = [CustomerFilter, ProductFilter, OrderFilter]
+
+SAMPLE_VALUES = [
+    (django_filters.DateTimeFilter, datetime(2025, 1, 1, tzinfo=timezone.utc)),
+    (django_filters.NumberFilter, 10),
+    (django_filters.CharFilter, 'ab'),
+]
+
+
+def sample_value(filter_):
+    for filter_class, value in SAMPLE_VALUES:
+        if isinstance(filter_, filter_class):
+            return value
+    raise ValueError(f"No sample value for {type(filter_).__name__}")
+
+
+def full_scans(plan, vendor):
+    """Return the plan lines that read a whole table."""
+    lines = plan.splitlines()
+    if vendor == 'postgresql':
+        return [line.strip() for line in lines if 'Seq Scan' in line]
+    if vendor == 'sqlite':
+        # Rows are "<id> <parent> <notused> <detail>"; "SCAN <table>" is a
+        # full scan, "SCAN <table> USING [COVERING] INDEX" is not.
+        details = [line.split(' ', 3)[-1] for line in lines]
+        return [
+            detail for detail in details
+            if detail.startswith('SCAN ') and 'USING' not in detail
+        ]
+    return [line for line in lines if 'ALL' in line.split()]
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN every filter combination and report sequential scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-filters', type=int, default=None,
+            help="Only combine up to this many filters at once (default: all)",
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help="Print the full plan for every combination",
+        )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        checked = 0
+        scanning = 0
+        for filterset_class in FILTERSETS:
+            model = filterset_class._meta.model
+            names = list(filterset_class.base_filters)
+            max_filters = options['max_filters'] or len(names)
+            for size in range(1, min(max_filters, len(names)) + 1):
+                for combo in combinations(names, size):
+                    data = {
+                        name: sample_value(filterset_class.base_filters[name])
+                        for name in combo
+                    }
+                    filterset = filterset_class(data=data, queryset=model.objects.all())
+                    if not filterset.is_valid():
+                        self.stderr.write(f"{filterset_class.__name__} {combo}: {filterset.errors}")
+                        continue
+                    plan = filterset.qs.explain()
+                    scans = full_scans(plan, vendor)
+                    checked += 1
+                    label = f"{filterset_class.__name__}({', '.join(combo)})"
+                    if scans:
+                        scanning += 1
+                        self.stdout.write(self.style.WARNING(f"SCAN   {label}: {'; '.join(scans)}"))
+                    elif options['verbosity'] > 1:
+                        self.stdout.write(f"INDEX  {label}")
+                    if options['verbose_plans']:
+                        self.stdout.write(plan)
+        self.stdout.write(f"{scanning} of {checked} filter combinations still scan a full table")
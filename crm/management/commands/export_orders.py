@@ -0,0 +1,42 @@
+"""
+Stream orders to a file or stdout as NDJSON or CSV. Accepts the same
+filters as OrderFilter, e.g.
+
+    python manage.py export_orders --format csv --order-date-gte 2025-01-01 -o orders.csv
+"""
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.exports import RENDERERS, export_queryset, get_renderer, stream_orders
+from crm.filters import OrderFilter
+
+
+class Command(BaseCommand):
+    help = "Export orders with their customer and products as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(RENDERERS), default='ndjson')
+        parser.add_argument('-o', '--output', help="File to write to (default: stdout)")
+        parser.add_argument('--chunk-size', type=int)
+        for name in OrderFilter.base_filters:
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name)
+
+    def handle(self, *args, **options):
+        params = {
+            name: options[name] for name in OrderFilter.base_filters if options[name] is not None
+        }
+        try:
+            renderer = get_renderer(options['format'])
+            queryset = export_queryset(params)
+        except ValidationError as e:
+            raise CommandError('; '.join(e.messages))
+
+        pieces = stream_orders(queryset, renderer, options['chunk_size'])
+        if not options['output']:
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
+            return
+        with open(options['output'], 'w', newline='') as output:
+            output.writelines(pieces)
+        self.stderr.write(f"Orders exported to {options['output']}")
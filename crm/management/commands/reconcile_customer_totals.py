@@ -0,0 +1,30 @@
+"""
+Recompute the denormalized order totals of every customer (order_count,
+lifetime_value, last_order_at) from the orders table and fix the rows that
+drifted, e.g. after orders were deleted or edited outside of the GraphQL
+mutations (see crm/customer_totals.py).
+
+    python manage.py reconcile_customer_totals --batch-size 1000
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.customer_totals import reconcile
+from crm.joblog import job_log
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized customer order totals"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Customers per transaction")
+
+    def handle(self, *args, **options):
+        with job_log('customer_totals') as log:
+            try:
+                result = reconcile(batch_size=options['batch_size'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            message = f"Checked {result.checked} customers, fixed {result.fixed}"
+            log.info(message, **result._asdict())
+        self.stdout.write(message)
@@ -0,0 +1,113 @@
+# Replaces the auto-created Order.products table with the OrderItem model.
+# Existing order lines are copied with quantity 1 and the product's current
+# price as their unit price.
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def copy_order_products(apps, schema_editor):
+    Order = apps.get_model("crm", "Order")
+    OrderItem = apps.get_model("crm", "OrderItem")
+    db_alias = schema_editor.connection.alias
+    rows = (
+        Order.products.through.objects.using(db_alias)
+        .select_related("product")
+        .order_by("pk")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = []
+    for row in rows:
+        batch.append(
+            OrderItem(
+                order_id=row.order_id,
+                product_id=row.product_id,
+                quantity=1,
+                unit_price=row.product.price,
+            )
+        )
+        if len(batch) == BATCH_SIZE:
+            OrderItem.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    OrderItem.objects.using(db_alias).bulk_create(batch)
+
+
+def copy_order_items(apps, schema_editor):
+    Order = apps.get_model("crm", "Order")
+    OrderItem = apps.get_model("crm", "OrderItem")
+    Through = Order.products.through
+    db_alias = schema_editor.connection.alias
+    rows = (
+        OrderItem.objects.using(db_alias)
+        .order_by("pk")
+        .values_list("order_id", "product_id")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    Through.objects.using(db_alias).bulk_create(
+        (Through(order_id=order_id, product_id=product_id) for order_id, product_id in rows),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crm", "0005_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField(default=1)),
+                ("unit_price", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="crm.order",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="order_items",
+                        to="crm.product",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["order_id", "product_id"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("order", "product"), name="unique_order_item"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(copy_order_products, copy_order_items),
+        migrations.RemoveField(
+            model_name="order",
+            name="products",
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="products",
+            field=models.ManyToManyField(
+                related_name="orders", through="crm.OrderItem", to="crm.product"
+            ),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:11
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_customer_totals(apps, schema_editor):
+    Customer = apps.get_model("crm", "Customer")
+    Order = apps.get_model("crm", "Order")
+    db_alias = schema_editor.connection.alias
+    orders = (
+        Order.objects.using(db_alias)
+        .filter(customer=OuterRef("pk"))
+        .order_by()
+        .values("customer")
+    )
+    Customer.objects.using(db_alias).update(
+        order_count=Coalesce(Subquery(orders.annotate(value=Count("pk")).values("value")), Value(0)),
+        lifetime_value=Coalesce(
+            Subquery(orders.annotate(value=Sum("total_amount")).values("value")),
+            Value(Decimal("0")),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+        last_order_at=Subquery(orders.annotate(value=Max("order_date")).values("value")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crm", "0008_order_reminder"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customer",
+            name="last_order_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="lifetime_value",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="order_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_customer_totals, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["order_count", "created_at"],
+                name="crm_customer_order_count_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(fields=["lifetime_value"], name="crm_customer_ltv_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["last_order_at"], name="crm_customer_last_order_idx"
+            ),
+        ),
+    ]
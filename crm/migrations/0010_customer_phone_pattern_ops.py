@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crm", "0009_customer_totals"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="customer",
+            name="crm_customer_phone_idx",
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["phone"],
+                name="crm_customer_phone_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+    ]
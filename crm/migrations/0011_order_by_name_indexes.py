@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crm", "0010_customer_phone_pattern_ops"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(fields=["name"], name="crm_customer_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["name"], name="crm_product_name_idx"),
+        ),
+    ]
@@ -6,6 +6,22 @@ class Customer(models.Model):
 	email = models.EmailField(unique=True)
 	phone = models.CharField(max_length=20, blank=True, null=True)
 	created_at = models.DateTimeField(auto_now_add=True)
+	# Denormalized from the customer's orders, see crm/customer_totals.py
+	order_count = models.PositiveIntegerField(default=0)
+	lifetime_value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	last_order_at = models.DateTimeField(blank=True, null=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['name'], name='crm_customer_name_idx'),
+			models.Index(fields=['created_at'], name='crm_customer_created_idx'),
+			# Pattern ops so that PostgreSQL serves phone LIKE 'prefix%' whatever the collation
+			models.Index(fields=['phone'], name='crm_customer_phone_idx', opclasses=['varchar_pattern_ops']),
+			# Also serves the inactive customer cleanup (order_count = 0 AND created_at < cutoff)
+			models.Index(fields=['order_count', 'created_at'], name='crm_customer_order_count_idx'),
+			models.Index(fields=['lifetime_value'], name='crm_customer_ltv_idx'),
+			models.Index(fields=['last_order_at'], name='crm_customer_last_order_idx'),
+		]
 
 	def __str__(self):
 		return self.name
@@ -15,14 +31,98 @@ class Product(models.Model):
 	price = models.DecimalField(max_digits=10, decimal_places=2)
 	stock = models.PositiveIntegerField(default=0)
 
+	class Meta:
+		indexes = [
+			models.Index(fields=['name'], name='crm_product_name_idx'),
+			models.Index(fields=['price'], name='crm_product_price_idx'),
+			models.Index(fields=['stock'], name='crm_product_stock_idx'),
+		]
+
 	def __str__(self):
 		return self.name
 
 class Order(models.Model):
 	customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
-	products = models.ManyToManyField(Product, related_name='orders')
+	products = models.ManyToManyField(Product, through='OrderItem', related_name='orders')
 	order_date = models.DateTimeField(auto_now_add=True)
 	total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+	class Meta:
+		indexes = [
+			models.Index(fields=['order_date', 'total_amount'], name='crm_order_date_total_idx'),
+			models.Index(fields=['customer', 'order_date'], name='crm_order_customer_date_idx'),
+			models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+		]
+
 	def __str__(self):
 		return f"Order #{self.id} for {self.customer.name}"
+
+class OrderItem(models.Model):
+	"""
+	A product on an order, with the quantity ordered and the product's price
+	at the time of the order. Order.total_amount is the sum of
+	quantity * unit_price over the order's items.
+	"""
+	order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+	product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items')
+	quantity = models.PositiveIntegerField(default=1)
+	unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+	class Meta:
+		ordering = ['order_id', 'product_id']
+		constraints = [
+			models.UniqueConstraint(fields=['order', 'product'], name='unique_order_item'),
+		]
+
+	def __str__(self):
+		return f"{self.quantity} x {self.product_id} on order #{self.order_id}"
+
+	@staticmethod
+	def line_total(prefix=''):
+		"""Database expression for quantity * unit_price, optionally through a relation."""
+		return models.ExpressionWrapper(
+			models.F(f'{prefix}quantity') * models.F(f'{prefix}unit_price'),
+			output_field=models.DecimalField(max_digits=14, decimal_places=2),
+		)
+
+class OrderReminder(models.Model):
+	"""Records that the reminder for an order went out, so it is sent once."""
+	order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='reminder')
+	sent_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self):
+		return f"Reminder for order #{self.order_id}"
+
+class DailySalesRollup(models.Model):
+	"""
+	Order count and revenue per day, either for all products (product is
+	null) or for a single product. Maintained incrementally by CreateOrder
+	and rebuilt by the rebuild_daily_sales_rollup task.
+	"""
+	date = models.DateField()
+	product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales', null=True, blank=True)
+	order_count = models.PositiveIntegerField(default=0)
+	revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+	class Meta:
+		ordering = ['date', 'product_id']
+		constraints = [
+			models.UniqueConstraint(fields=['date'], condition=models.Q(product__isnull=True), name='unique_daily_sales_total'),
+			models.UniqueConstraint(fields=['date', 'product'], condition=models.Q(product__isnull=False), name='unique_daily_sales_product'),
+		]
+
+	def __str__(self):
+		return f"{self.date} {self.product or 'all products'}: {self.order_count} orders"
+
+class JobCheckpoint(models.Model):
+	"""
+	Progress of a resumable maintenance job, e.g. the last primary key a
+	batched cleanup got through, so that an interrupted run picks up where
+	it stopped.
+	"""
+	name = models.CharField(max_length=100, unique=True)
+	state = models.JSONField(default=dict)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	def __str__(self):
+		return self.name
@@ -0,0 +1,119 @@
+"""
+Selection-set aware queryset optimization for the CRM GraphQL schema.
+
+Walks the fields a client asked for and narrows the queryset backing a
+connection accordingly: ``only()`` for the requested columns,
+``select_related`` for forward foreign keys and ``prefetch_related`` with
+nested, equally optimized ``Prefetch`` querysets for to-many relations.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+def collect_fields(info, selection_set, fields=None):
+    """
+    Return the selection set as a nested dict of snake_case field names.
+
+    Fragments are inlined; ``@skip``/``@include`` are ignored, which can only
+    over-fetch.
+    """
+    if fields is None:
+        fields = {}
+    if selection_set is None:
+        return fields
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            name = selection.name.value
+            if name.startswith('__'):
+                continue
+            subfields = fields.setdefault(to_snake_case(name), {})
+            collect_fields(info, selection.selection_set, subfields)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments[selection.name.value]
+            collect_fields(info, fragment.selection_set, fields)
+        elif isinstance(selection, InlineFragmentNode):
+            collect_fields(info, selection.selection_set, fields)
+    return fields
+
+
+def connection_node_fields(fields):
+    """Return the fields requested on ``edges { node }`` of a connection."""
+    return fields.get('edges', {}).get('node', {})
+
+
+def item_fields(fields):
+    """Return the fields requested on each item of a connection or list field."""
+    if 'edges' in fields:
+        return connection_node_fields(fields)
+    return fields
+
+
+def optimize_queryset(queryset, info):
+    """Optimize ``queryset`` for the connection field currently resolving."""
+    fields = {}
+    for field_node in info.field_nodes:
+        collect_fields(info, field_node.selection_set, fields)
+    return apply_fields(queryset, connection_node_fields(fields))
+
+
+def apply_fields(queryset, fields):
+    """Apply ``only``/``select_related``/``prefetch_related`` for ``fields``."""
+    only, related, prefetches = plan_fields(queryset.model, fields)
+    queryset = queryset.only(*only)
+    if related:
+        queryset = queryset.select_related(*related)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset
+
+
+def plan_fields(model, fields, prefix=''):
+    """
+    Work out the ``only``, ``select_related`` and ``Prefetch`` arguments
+    needed to serve ``fields`` for ``model``.
+
+    Foreign key columns are always kept so the batch loaders can read them
+    without triggering deferred-field queries.
+    """
+    only = {prefix + model._meta.pk.name}
+    related = []
+    prefetches = []
+    for field in model._meta.concrete_fields:
+        if field.many_to_one:
+            only.add(prefix + field.name)
+
+    for name, subfields in fields.items():
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.many_to_many or field.one_to_many:
+            queryset = apply_fields(
+                field.related_model._default_manager.all(),
+                item_fields(subfields),
+            )
+            prefetches.append(Prefetch(prefix + name, queryset=queryset))
+        elif field.many_to_one or field.one_to_one:
+            if not field.concrete:
+                continue
+            rel_only, rel_related, rel_prefetches = plan_fields(
+                field.related_model, subfields, prefix=f"{prefix}{name}__"
+            )
+            only.update(rel_only)
+            related.append(prefix + name)
+            related.extend(rel_related)
+            prefetches.extend(rel_prefetches)
+        elif field.concrete:
+            only.add(prefix + name)
+    return only, related, prefetches
+
+
+def prefetched(instance, name):
+    """Return the prefetched objects for relation ``name``, or None."""
+    cache = getattr(instance, '_prefetched_objects_cache', {})
+    if name in cache:
+        return list(cache[name])
+    return None
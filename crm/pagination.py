@@ -0,0 +1,153 @@
+"""
+Keyset (seek) pagination for Relay connections.
+
+Cursors encode the last-seen sort key plus the primary key, so fetching the
+page after a cursor is a ``WHERE (key, id) > (value, id) ORDER BY key, id
+LIMIT n`` that an index can serve, however deep the page is. No ``COUNT``
+query is issued. Nullable sort keys put NULLs first in ascending order and
+last in descending order.
+"""
+
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from graphene.relay import PageInfo
+from graphene.utils.str_converters import to_camel_case, to_snake_case
+from graphql import GraphQLError
+
+CURSOR_PREFIX = 'keyset'
+
+
+def check_order(order_by, order_fields):
+    """
+    Return ``order_by`` (``"name"``, ``"-lastOrderAt"``, ...) in snake case
+    if it names ``id`` or one of ``order_fields``, else raise a GraphQLError.
+    """
+    name = to_snake_case(order_by.lstrip('-'))
+    if name not in ('id', 'pk', *order_fields):
+        allowed = ', '.join(to_camel_case(f) for f in ('id', *order_fields))
+        raise GraphQLError(f"Cannot order by '{order_by.lstrip('-')}'; orderBy must be one of {allowed}")
+    return to_snake_case(order_by)
+
+
+def ordering(order_by):
+    """``order_by`` followed by the primary key in the same direction."""
+    name = order_by.lstrip('-')
+    sign = '-' if order_by.startswith('-') else ''
+    return [order_by, f"{sign}pk"] if name not in ('id', 'pk') else [f"{sign}pk"]
+
+
+def parse_order(model, order_by):
+    """
+    Return the model field and direction for ``order_by`` (``"name"`` or
+    ``"-name"``), or ``(None, False)`` to paginate by primary key only.
+    """
+    if not order_by:
+        return None, False
+    descending = order_by.startswith('-')
+    name = order_by.lstrip('-')
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        raise GraphQLError(f"Unknown orderBy field '{name}'")
+    if not field.concrete or field.is_relation:
+        raise GraphQLError(f"Cannot use keyset pagination ordered by '{name}'")
+    if field.primary_key:
+        return None, descending
+    return field, descending
+
+
+def encode_cursor(obj, field):
+    key = field.value_to_string(obj) if field and field.value_from_object(obj) is not None else None
+    payload = json.dumps([CURSOR_PREFIX, key, obj.pk])
+    return base64.b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, field):
+    try:
+        prefix, key, pk = json.loads(base64.b64decode(cursor.encode()))
+        if prefix != CURSOR_PREFIX:
+            raise ValueError(prefix)
+        return (field.to_python(key) if field and key is not None else None), pk
+    except (TypeError, ValueError, ValidationError):
+        raise GraphQLError(f"Invalid keyset cursor '{cursor}'")
+
+
+def seek(field, descending, cursor_values):
+    """Filter for the rows that come strictly after the cursor in the ordering."""
+    key, pk = cursor_values
+    op = 'lt' if descending else 'gt'
+    after_pk = Q(**{f"pk__{op}": pk})
+    if field is None:
+        return after_pk
+    is_null = Q(**{f"{field.name}__isnull": True})
+    if key is None:
+        after = is_null & after_pk
+        return after if descending else after | ~is_null
+    after = Q(**{f"{field.name}__{op}": key}) | (Q(**{field.name: key}) & after_pk)
+    if field.null and descending:
+        after |= is_null
+    return after
+
+
+def sort_key(field, descending):
+    if not field.null:
+        return f"-{field.name}" if descending else field.name
+    if descending:
+        return F(field.name).desc(nulls_last=True)
+    return F(field.name).asc(nulls_first=True)
+
+
+def keyset_connection(connection_type, args, queryset, max_limit=None):
+    """Build a Relay connection for ``queryset`` using keyset pagination."""
+    if args.get('offset'):
+        raise GraphQLError("offset cannot be combined with keyset pagination")
+    model = queryset.model
+    field, descending = parse_order(model, args.get('order_by'))
+    first = args.get('first')
+    last = args.get('last')
+    if first is None and last is None:
+        first = max_limit
+
+    # The cursor needs the sort key even if the selection set deferred it
+    deferred, defer = queryset.query.deferred_loading
+    if field and deferred and not defer:
+        queryset = queryset.only(*deferred, field.name)
+
+    sign = '-' if descending else ''
+    ordering = ([sort_key(field, descending)] if field else []) + [f"{sign}pk"]
+    queryset = queryset.order_by(*ordering)
+    if args.get('after'):
+        queryset = queryset.filter(seek(field, descending, decode_cursor(args['after'], field)))
+    if args.get('before'):
+        queryset = queryset.filter(seek(field, not descending, decode_cursor(args['before'], field)))
+
+    has_previous = has_next = False
+    if first is None and last is not None:
+        # last without first: read backwards from the end (or ``before``)
+        rows = list(queryset.reverse()[:last + 1])
+        has_previous = len(rows) > last
+        rows = rows[:last][::-1]
+    else:
+        rows = list(queryset[:first + 1] if first is not None else queryset)
+        if first is not None:
+            has_next = len(rows) > first
+            rows = rows[:first]
+        if last is not None and len(rows) > last:
+            has_previous = True
+            rows = rows[len(rows) - last:]
+
+    edges = [connection_type.Edge(node=row, cursor=encode_cursor(row, field)) for row in rows]
+    result = connection_type(
+        edges=edges,
+        page_info=PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_previous,
+            has_next_page=has_next,
+        ),
+    )
+    result.iterable = queryset
+    return result
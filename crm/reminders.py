@@ -0,0 +1,228 @@
+"""
+Incremental order reminders.
+
+Each run only looks at orders placed since the previous one. The id of the
+last order handled (the high-water mark) is kept in a JobCheckpoint; the
+first run starts with the orders of the last ``LOOKBACK_DAYS`` days. New
+orders are read in id order, ``BATCH_SIZE`` at a time, and every batch is
+committed together with an OrderReminder row per order and the new
+high-water mark:
+
+* an order is never reminded twice, even when runs overlap or a batch is
+  retried. A batch claims its orders by inserting their OrderReminder rows
+  (unique per order) before sending anything, and only sends the reminders
+  of the rows it inserted itself; a run inserting the same rows
+  concurrently waits for the first one to commit and then skips them;
+* the mark only moves past orders placed more than ``GRACE_SECONDS`` ago.
+  Order ids are assigned before the order's transaction commits, so an
+  order can become visible after orders with higher ids; it is picked up
+  by a later run as long as its transaction took less than the grace
+  window;
+* a run that fails part-way leaves the mark at the last committed batch
+  and the next run continues from there. The reminders of the failed batch
+  may have gone out already and are sent again (at-least-once).
+
+``remind_range`` handles one id range without touching the mark; the
+``send_order_reminders_parallel`` Celery task runs it for several ranges at
+once and moves the mark once all of them are done.
+"""
+
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .joblog import job_log
+from .models import JobCheckpoint, Order, OrderReminder
+
+CHECKPOINT = 'order_reminders'
+JOB_LOG = 'order_reminders'
+
+DEFAULTS = {
+    'BATCH_SIZE': 500,
+    # How far back the first run (without a high-water mark) looks
+    'LOOKBACK_DAYS': 7,
+    # Orders placed more recently are left for a later run
+    'GRACE_SECONDS': 60,
+}
+
+ReminderResult = namedtuple('ReminderResult', 'sent batches high_water_mark')
+
+
+def reminder_settings():
+    return {**DEFAULTS, **getattr(settings, 'CRM_ORDER_REMINDERS', {})}
+
+
+def initial_high_water_mark(lookback_days):
+    """The id just below the first order of the lookback window."""
+    since = timezone.now() - timedelta(days=lookback_days)
+    first = (
+        Order.objects.filter(order_date__gte=since)
+        .order_by('pk').values_list('pk', flat=True).first()
+    )
+    if first is not None:
+        return first - 1
+    return Order.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def settled_up_to(after_id, grace_seconds):
+    """
+    The id of the last order above ``after_id`` placed more than
+    ``grace_seconds`` ago, or ``after_id`` when there is none.
+    """
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    last = (
+        Order.objects.filter(pk__gt=after_id, order_date__lt=cutoff)
+        .order_by('-pk').values_list('pk', flat=True).first()
+    )
+    return after_id if last is None else last
+
+
+def new_orders(after_id, batch_size, up_to_id=None):
+    """
+    Yield lists of up to ``batch_size`` orders with an id above ``after_id``
+    (and at most ``up_to_id``).
+    """
+    while True:
+        orders = Order.objects.filter(pk__gt=after_id)
+        if up_to_id is not None:
+            orders = orders.filter(pk__lte=up_to_id)
+        batch = list(
+            orders.select_related('customer')
+            .only('id', 'order_date', 'customer__name', 'customer__email')
+            .order_by('pk')[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        after_id = batch[-1].pk
+
+
+def get_high_water_mark(lookback_days):
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT)
+    mark = checkpoint.state.get('order_id')
+    return initial_high_water_mark(lookback_days) if mark is None else mark
+
+
+def set_high_water_mark(mark):
+    """Move the high-water mark forward to ``mark``; it never goes back."""
+    with transaction.atomic():
+        checkpoint, _ = JobCheckpoint.objects.select_for_update().get_or_create(name=CHECKPOINT)
+        if mark > checkpoint.state.get('order_id', 0):
+            checkpoint.state = {'order_id': mark}
+            checkpoint.save(update_fields=['state', 'updated_at'])
+
+
+def supports_insert_returning(connection):
+    """Return True if the backend accepts ``INSERT ... ON CONFLICT DO NOTHING RETURNING``."""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+def claim_reminders(order_ids):
+    """
+    Insert the missing OrderReminder rows of ``order_ids`` and return the ids
+    of the orders whose row this transaction inserted.
+    """
+    if not order_ids:
+        return set()
+    if not supports_insert_returning(connection):
+        # One savepoint per order: the unique constraint tells which rows
+        # another run inserted first
+        claimed = set()
+        for order_id in order_ids:
+            try:
+                with transaction.atomic():
+                    OrderReminder.objects.create(order_id=order_id)
+            except IntegrityError:
+                continue
+            claimed.add(order_id)
+        return claimed
+    meta = OrderReminder._meta
+    quote = connection.ops.quote_name
+    sent_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    # bulk_create(ignore_conflicts=True) does not tell which rows it inserted
+    sql = (
+        f"INSERT INTO {quote(meta.db_table)} "
+        f"({quote(meta.get_field('order').column)}, {quote(meta.get_field('sent_at').column)}) "
+        f"VALUES {', '.join(['(%s, %s)'] * len(order_ids))} "
+        f"ON CONFLICT ({quote(meta.get_field('order').column)}) DO NOTHING "
+        f"RETURNING {quote(meta.get_field('order').column)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for order_id in order_ids for value in (order_id, sent_at)])
+        return {row[0] for row in cursor.fetchall()}
+
+
+def remind_batch(batch, send):
+    """
+    Claim the orders of ``batch`` not reminded yet and call ``send(order)``
+    for them. Returns how many were sent.
+    """
+    with transaction.atomic():
+        claimed = claim_reminders([order.pk for order in batch])
+        pending = [order for order in batch if order.pk in claimed]
+        for order in pending:
+            send(order)
+    return len(pending)
+
+
+def remind_range(send, after_id, up_to_id, batch_size=None):
+    """
+    Remind the orders with an id in ``(after_id, up_to_id]``, leaving the
+    high-water mark alone. Returns how many were sent.
+    """
+    batch_size = batch_size or reminder_settings()['BATCH_SIZE']
+    return sum(remind_batch(batch, send) for batch in new_orders(after_id, batch_size, up_to_id))
+
+
+def format_reminder(order):
+    customer = order.customer
+    return f"Order ID: {order.pk}, Customer: {customer.name} ({customer.email}), Date: {order.order_date.isoformat()}"
+
+
+def send_order_reminders(send, batch_size=None, max_batches=None):
+    """
+    Call ``send(order)`` once for every order placed since the last run (and
+    before the grace window) and return a ReminderResult.
+    """
+    config = reminder_settings()
+    batch_size = batch_size or config['BATCH_SIZE']
+    mark = get_high_water_mark(config['LOOKBACK_DAYS'])
+    up_to_id = settled_up_to(mark, config['GRACE_SECONDS'])
+
+    sent = batches = 0
+    for batch in new_orders(mark, batch_size, up_to_id):
+        with transaction.atomic():
+            sent += remind_batch(batch, send)
+            mark = batch[-1].pk
+            set_high_water_mark(mark)
+        batches += 1
+        if max_batches is not None and batches >= max_batches:
+            break
+    return ReminderResult(sent, batches, mark)
+
+
+def log_reminder(log):
+    """A ``send`` function recording reminders in the JobLog ``log``."""
+    return lambda order: log.info(format_reminder(order), order_id=order.pk, customer_email=order.customer.email)
+
+
+def log_sent(log, sent):
+    if sent:
+        log.info(f"Processed {sent} new orders", sent=sent)
+    else:
+        log.info("No new orders found", sent=0)
+
+
+def log_order_reminders(**kwargs):
+    """Send the pending reminders by recording them in the order_reminders job log."""
+    with job_log(JOB_LOG) as log:
+        result = send_order_reminders(log_reminder(log), **kwargs)
+        log_sent(log, result.sent)
+    return result
@@ -0,0 +1,164 @@
+"""
+Maintenance of the DailySalesRollup table.
+
+``record_order`` and ``record_orders`` fold new orders into the rollup rows
+for their days once the caller's transaction commits; ``rebuild`` recomputes
+a date range from the orders table with set-based aggregate queries.
+
+Every order of a day updates the same all-products row, so writing it inside
+the order's transaction would make all of that day's orders wait for each
+other's row lock. The increments are applied afterwards instead, in a short
+transaction per day. An increment that fails after the order committed is
+logged and lost until the nightly ``rebuild_daily_sales_rollup`` recomputes
+the day.
+"""
+
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, PositiveIntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from crm.cache import invalidate_on_commit
+from crm.models import DailySalesRollup, Order, OrderItem
+
+
+def record_order(order, items):
+    """Add ``order`` and its OrderItems to the rollup for the order's day."""
+    record_orders([(order, items)])
+
+
+def record_orders(orders):
+    """
+    Add ``(order, items)`` pairs to the rollups when the current
+    transaction commits, with one round of queries per day rather than per
+    order.
+    """
+    days = {}
+    for order, items in orders:
+        day = timezone.localdate(order.order_date)
+        totals, lines = days.setdefault(day, ([0, Decimal('0')], {}))
+        totals[0] += 1
+        totals[1] += order.total_amount
+        amounts = {}
+        for item in items:
+            amounts[item.product_id] = amounts.get(item.product_id, 0) + item.quantity * item.unit_price
+        for pk, amount in amounts.items():
+            line = lines.setdefault(pk, [0, Decimal('0')])
+            line[0] += 1
+            line[1] += amount
+
+    if days:
+        def record_days():
+            _record_days(days)
+
+        # A named function: a robust callback that fails is logged by its
+        # __qualname__
+        transaction.on_commit(record_days, robust=True)
+
+
+def _record_days(days):
+    for day, ((order_count, revenue), lines) in days.items():
+        try:
+            with transaction.atomic():
+                _record(day, order_count, revenue, lines)
+        except IntegrityError:
+            # A concurrent order created one of the day's rows first; the
+            # rows now exist, so the retry only takes the update path.
+            with transaction.atomic():
+                _record(day, order_count, revenue, lines)
+    invalidate_on_commit(DailySalesRollup)
+
+
+def _record(day, order_count, revenue, lines):
+    """``lines`` maps product pks to ``[order count, revenue]``."""
+    updated = DailySalesRollup.objects.filter(date=day, product__isnull=True).update(
+        order_count=F('order_count') + order_count,
+        revenue=F('revenue') + revenue,
+    )
+    if not updated:
+        DailySalesRollup.objects.create(date=day, order_count=order_count, revenue=revenue)
+
+    if not lines:
+        return
+    existing = set(
+        DailySalesRollup.objects.select_for_update()
+        .filter(date=day, product_id__in=lines)
+        .values_list('product_id', flat=True)
+    )
+    if existing:
+        DailySalesRollup.objects.filter(date=day, product_id__in=existing).update(
+            order_count=F('order_count') + Case(
+                *[When(product_id=pk, then=Value(lines[pk][0])) for pk in existing],
+                output_field=PositiveIntegerField(),
+            ),
+            revenue=F('revenue') + Case(
+                *[When(product_id=pk, then=Value(lines[pk][1])) for pk in existing],
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+    DailySalesRollup.objects.bulk_create([
+        DailySalesRollup(date=day, product_id=pk, order_count=count, revenue=amount)
+        for pk, (count, amount) in lines.items()
+        if pk not in existing
+    ])
+
+
+def day_bounds(start=None, end=None):
+    """Return aware datetime bounds covering the ``start``..``end`` dates."""
+    tz = timezone.get_current_timezone()
+    lower = datetime.combine(start, time.min, tzinfo=tz) if start else None
+    upper = datetime.combine(end, time.max, tzinfo=tz) if end else None
+    return lower, upper
+
+
+def rebuild(start=None, end=None):
+    """
+    Recompute the rollup rows for the dates between ``start`` and ``end``
+    (inclusive, open-ended when omitted). Returns the number of rows written.
+    """
+    lower, upper = day_bounds(start, end)
+    rollups = DailySalesRollup.objects.all()
+    orders = Order.objects.all()
+    lines = OrderItem.objects.all()
+    if start:
+        rollups = rollups.filter(date__gte=start)
+        orders = orders.filter(order_date__gte=lower)
+        lines = lines.filter(order__order_date__gte=lower)
+    if end:
+        rollups = rollups.filter(date__lte=end)
+        orders = orders.filter(order_date__lte=upper)
+        lines = lines.filter(order__order_date__lte=upper)
+
+    totals = (
+        orders.annotate(day=TruncDate('order_date'))
+        .values('day')
+        .annotate(order_count=Count('id'), revenue=Sum('total_amount'))
+        .order_by('day')
+    )
+    per_product = (
+        lines.annotate(day=TruncDate('order__order_date'))
+        .values('day', 'product_id')
+        .annotate(order_count=Count('order_id'), revenue=Sum(OrderItem.line_total()))
+        .order_by('day', 'product_id')
+    )
+    with transaction.atomic():
+        rows = [
+            DailySalesRollup(
+                date=row['day'], order_count=row['order_count'],
+                revenue=row['revenue'] or Decimal('0'),
+            )
+            for row in totals
+        ] + [
+            DailySalesRollup(
+                date=row['day'], product_id=row['product_id'],
+                order_count=row['order_count'], revenue=row['revenue'] or Decimal('0'),
+            )
+            for row in per_product
+        ]
+        rollups.delete()
+        DailySalesRollup.objects.bulk_create(rows, batch_size=1000)
+        invalidate_on_commit(DailySalesRollup)
+    return len(rows)
@@ -1,37 +1,107 @@
 import graphene
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
 from graphene import relay
-from crm.models import Customer, Product, Order
+from crm.models import Customer, Product, Order, OrderItem, DailySalesRollup
 from crm.models import Product
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .cache import invalidate_on_commit
+from .fields import BatchedConnectionField, KeysetConnectionField, has_filter_args
+from .loaders import get_loaders
+from .optimizer import optimize_queryset, prefetched
+from .customer_totals import record_customer_orders
+from .rollups import record_order, record_orders
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDay, TruncWeek
+from django.utils.functional import cached_property
 from django.utils import timezone
 import re
+from decimal import Decimal
 
 # GraphQL Types
 class CustomerType(DjangoObjectType):
+    orders = BatchedConnectionField(lambda: OrderType)
+
     class Meta:
         model = Customer
-        fields = ("id", "name", "email", "phone", "created_at")
+        fields = (
+            "id", "name", "email", "phone", "created_at",
+            "order_count", "lifetime_value", "last_order_at", "orders",
+        )
         filterset_class = CustomerFilter
         interfaces = (relay.Node,)
 
+    def resolve_orders(root, info, **kwargs):
+        if has_filter_args(kwargs):
+            return root.orders.all()
+        orders = prefetched(root, 'orders')
+        if orders is not None:
+            return orders
+        return get_loaders(info).customer_orders.load(root.pk)
+
 class ProductType(DjangoObjectType):
+    orders = BatchedConnectionField(lambda: OrderType)
+
     class Meta:
         model = Product
-        fields = ("id", "name", "price", "stock")
+        fields = ("id", "name", "price", "stock", "orders")
         filterset_class = ProductFilter
         interfaces = (relay.Node,)
 
+    def resolve_orders(root, info, **kwargs):
+        if has_filter_args(kwargs):
+            return root.orders.all()
+        orders = prefetched(root, 'orders')
+        if orders is not None:
+            return orders
+        return get_loaders(info).product_orders.load(root.pk)
+
+class OrderItemType(DjangoObjectType):
+    class Meta:
+        model = OrderItem
+        fields = ("product", "quantity", "unit_price")
+
+    def resolve_product(root, info):
+        if OrderItem.product.is_cached(root):
+            return root.product
+        return get_loaders(info).products.load(root.product_id)
+
 class OrderType(DjangoObjectType):
+    products = BatchedConnectionField(ProductType)
+    items = graphene.List(graphene.NonNull(OrderItemType))
+
     class Meta:
         model = Order
-        fields = ("id", "customer", "products", "order_date", "total_amount")
+        fields = ("id", "customer", "products", "items", "order_date", "total_amount")
         filterset_class = OrderFilter
         interfaces = (relay.Node,)
 
+    def resolve_customer(root, info):
+        if Order.customer.is_cached(root):
+            return root.customer
+        return get_loaders(info).customers.load(root.customer_id)
+
+    def resolve_products(root, info, **kwargs):
+        if has_filter_args(kwargs):
+            return root.products.all()
+        products = prefetched(root, 'products')
+        if products is not None:
+            return products
+        return get_loaders(info).order_products.load(root.pk)
+
+    def resolve_items(root, info):
+        items = prefetched(root, 'items')
+        if items is not None:
+            return items
+        return get_loaders(info).order_items.load(root.pk)
+
+class DailySalesRollupType(DjangoObjectType):
+    class Meta:
+        model = DailySalesRollup
+        fields = ("date", "product", "order_count", "revenue")
+
 # Input Types
 class CustomerInput(graphene.InputObjectType):
     name = graphene.String(required=True)
@@ -43,9 +113,15 @@ class ProductInput(graphene.InputObjectType):
     price = graphene.Decimal(required=True)
     stock = graphene.Int()
 
+class OrderItemInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    quantity = graphene.Int(default_value=1)
+
 class OrderInput(graphene.InputObjectType):
     customer_id = graphene.ID(required=True)
-    product_ids = graphene.List(graphene.ID, required=True)
+    # Either product_ids (one of each) or items
+    product_ids = graphene.List(graphene.ID)
+    items = graphene.List(graphene.NonNull(OrderItemInput))
     order_date = graphene.DateTime()
 
 # Mutations
@@ -75,32 +151,61 @@ class CreateCustomer(graphene.Mutation):
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
         input = graphene.List(CustomerInput, required=True)
+        batch_size = graphene.Int()
 
     customers = graphene.List(CustomerType)
     errors = graphene.List(graphene.String)
 
+    @staticmethod
+    def existing_emails(emails, batch_size):
+        """Return the subset of ``emails`` already in use, one query per batch."""
+        emails = list(emails)
+        existing = set()
+        for start in range(0, len(emails), batch_size):
+            chunk = emails[start:start + batch_size]
+            existing.update(
+                Customer.objects.filter(email__in=chunk).values_list('email', flat=True)
+            )
+        return existing
+
     @classmethod
-    def mutate(cls, root, info, input):
-        created = []
+    def mutate(cls, root, info, input, batch_size=None):
+        batch_size = batch_size or getattr(settings, 'CRM_BULK_CREATE_BATCH_SIZE', 500)
+        if batch_size < 1:
+            raise ValidationError("Batch size must be positive")
+        pending = []
         errors = []
+        for idx, customer_data in enumerate(input):
+            if not customer_data.name or not customer_data.email:
+                errors.append((idx, f"Row {idx+1}: Name and email required"))
+                continue
+            pending.append((idx, customer_data))
+
+        created = []
         with transaction.atomic():
-            for idx, customer_data in enumerate(input):
-                name = customer_data.name
-                email = customer_data.email
-                phone = customer_data.phone
-                if not name or not email:
-                    errors.append(f"Row {idx+1}: Name and email required")
-                    continue
-                if Customer.objects.filter(email=email).exists():
-                    errors.append(f"Row {idx+1}: Email already exists")
+            # Rows claim their email in input order, so a duplicate within the
+            # batch is reported against every row after the first valid one.
+            claimed = cls.existing_emails(
+                {data.email for _, data in pending}, batch_size
+            )
+            for idx, customer_data in pending:
+                if customer_data.email in claimed:
+                    errors.append((idx, f"Row {idx+1}: Email already exists"))
                     continue
-                if phone and not CreateCustomer.validate_phone(phone):
-                    errors.append(f"Row {idx+1}: Invalid phone format")
+                if customer_data.phone and not CreateCustomer.validate_phone(customer_data.phone):
+                    errors.append((idx, f"Row {idx+1}: Invalid phone format"))
                     continue
-                customer = Customer(name=name, email=email, phone=phone)
-                customer.save()
-                created.append(customer)
-        return cls(customers=created, errors=errors)
+                claimed.add(customer_data.email)
+                created.append(Customer(
+                    name=customer_data.name,
+                    email=customer_data.email,
+                    phone=customer_data.phone,
+                ))
+            created = Customer.objects.bulk_create(created, batch_size=batch_size)
+            if created:
+                invalidate_on_commit(Customer)
+        errors.sort(key=lambda error: error[0])
+        return cls(customers=created, errors=[message for _, message in errors])
 
 class CreateProduct(graphene.Mutation):
     class Arguments:
@@ -125,55 +230,310 @@ class CreateOrder(graphene.Mutation):
     order = graphene.Field(OrderType)
     message = graphene.String()
 
+    @staticmethod
+    def requested_quantities(input):
+        """
+        Return ``{product pk: quantity}`` for the order, adding up repeated
+        products. Raises ValidationError for malformed IDs and quantities.
+        """
+        if input.items is not None:
+            lines = [(item.product_id, item.quantity) for item in input.items]
+        else:
+            lines = [(product_id, 1) for product_id in input.product_ids or []]
+        quantities = {}
+        for product_id, quantity in lines:
+            if quantity is None or quantity < 1:
+                raise ValidationError("Quantities must be positive")
+            try:
+                pk = Product._meta.pk.to_python(product_id)
+            except ValidationError:
+                raise ValidationError("One or more product IDs are invalid")
+            quantities[pk] = quantities.get(pk, 0) + quantity
+        return quantities
+
+    @staticmethod
+    def lock_products(pks):
+        """
+        Return the products with primary keys ``pks`` by pk, locked until the
+        end of the transaction.
+
+        The rows are locked in primary key order, so concurrent orders that
+        share products queue up instead of deadlocking. Orders for other
+        products are not blocked: the daily rollup rows every order adds to
+        are only written after the order commits (see crm/rollups.py).
+        """
+        return {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(pk__in=pks).order_by('pk')
+        }
+
+    @staticmethod
+    def check_stock(products, quantities, taken=None):
+        """
+        Raise ValidationError unless every product in ``quantities`` is in
+        ``products`` with enough stock, after what ``taken`` (also by pk) has
+        already claimed.
+        """
+        if any(pk not in products for pk in quantities):
+            raise ValidationError("One or more product IDs are invalid")
+        taken = taken or {}
+        short = [
+            (products[pk], quantity, products[pk].stock - taken.get(pk, 0))
+            for pk, quantity in quantities.items()
+            if products[pk].stock - taken.get(pk, 0) < quantity
+        ]
+        if short:
+            raise ValidationError("Insufficient stock for " + ", ".join(
+                f"{product.name} ({quantity} requested, {available} available)"
+                for product, quantity, available in short
+            ))
+
+    @staticmethod
+    def take_stock(products, quantities):
+        """
+        Take ``quantities`` out of the stock of ``products`` in one
+        conditional UPDATE.
+        """
+        requested = Case(
+            *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+            output_field=IntegerField(),
+        )
+        # The stock condition only matters where the backend ignores
+        # SELECT ... FOR UPDATE; the rows are locked everywhere else.
+        updated = Product.objects.filter(pk__in=quantities, stock__gte=requested).update(
+            stock=F('stock') - requested
+        )
+        if updated != len(quantities):
+            raise ValidationError("Insufficient stock")
+        for pk, quantity in quantities.items():
+            products[pk].stock -= quantity
+
+    @classmethod
+    def reserve_stock(cls, quantities):
+        """
+        Take ``quantities`` (``{product pk: quantity}``) out of stock and
+        return the products by pk. Must run inside a transaction. Raises
+        ValidationError if a product does not exist or has too little stock.
+        """
+        products = cls.lock_products(quantities)
+        cls.check_stock(products, quantities)
+        cls.take_stock(products, quantities)
+        return products
+
     @classmethod
     def mutate(cls, root, info, input):
+        if input.items is not None and input.product_ids is not None:
+            return cls(order=None, message="Provide either product IDs or items, not both")
         try:
             customer = Customer.objects.get(pk=input.customer_id)
         except Customer.DoesNotExist:
             return cls(order=None, message="Invalid customer ID")
-        products = Product.objects.filter(pk__in=input.product_ids)
-        if products.count() != len(input.product_ids):
-            return cls(order=None, message="One or more product IDs are invalid")
-        if not products:
+        try:
+            quantities = cls.requested_quantities(input)
+        except ValidationError as e:
+            return cls(order=None, message=e.messages[0])
+        if not quantities:
             return cls(order=None, message="At least one product must be selected")
-        order = Order(customer=customer, order_date=input.order_date or timezone.now())
-        order.save()
-        order.products.set(products)
-        total = sum([p.price for p in products])
-        order.total_amount = total
-        order.save()
+        try:
+            with transaction.atomic():
+                products = cls.reserve_stock(quantities)
+                order = Order.objects.create(customer=customer, order_date=input.order_date or timezone.now())
+                items = OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product=product, quantity=quantities[pk], unit_price=product.price)
+                    for pk, product in products.items()
+                ])
+                total = order.items.aggregate(total=Sum(OrderItem.line_total()))['total']
+                # SQLite computes the sum in floating point, with 12 decimals
+                order.total_amount = total.quantize(Decimal('0.01'))
+                Order.objects.filter(pk=order.pk).update(total_amount=order.total_amount)
+                record_order(order, items)
+                record_customer_orders([order])
+                # bulk_create() and update() send no signals
+                invalidate_on_commit(Order, OrderItem, Product)
+        except ValidationError as e:
+            return cls(order=None, message=e.messages[0])
         return cls(order=order, message="Order created successfully")
 
+class BulkOrderResult(graphene.ObjectType):
+    index = graphene.Int()
+    order = graphene.Field(OrderType)
+    message = graphene.String()
+
+class BulkCreateOrders(graphene.Mutation):
+    """
+    Create many orders at once. Customers and products are fetched with one
+    query each, every order is validated in memory and the orders and their
+    items are inserted with bulk_create. An invalid order is reported in its
+    result and does not prevent the others from being created.
+    """
+    class Arguments:
+        input = graphene.List(graphene.NonNull(OrderInput), required=True)
+        batch_size = graphene.Int()
+
+    results = graphene.List(BulkOrderResult)
+    count = graphene.Int()
+
+    @staticmethod
+    def parse(order_data):
+        """Return ``(customer pk, quantities)`` or raise ValidationError."""
+        if order_data.items is not None and order_data.product_ids is not None:
+            raise ValidationError("Provide either product IDs or items, not both")
+        try:
+            customer_pk = Customer._meta.pk.to_python(order_data.customer_id)
+        except ValidationError:
+            raise ValidationError("Invalid customer ID")
+        quantities = CreateOrder.requested_quantities(order_data)
+        if not quantities:
+            raise ValidationError("At least one product must be selected")
+        return customer_pk, quantities
+
+    @classmethod
+    def mutate(cls, root, info, input, batch_size=None):
+        batch_size = batch_size or getattr(settings, 'CRM_BULK_CREATE_BATCH_SIZE', 500)
+        if batch_size < 1:
+            raise ValidationError("Batch size must be positive")
+        messages = {}
+        parsed = []
+        for idx, order_data in enumerate(input):
+            try:
+                parsed.append((idx, order_data, *cls.parse(order_data)))
+            except ValidationError as e:
+                messages[idx] = e.messages[0]
+
+        created = {}
+        pending = []
+        # Stock is claimed in input order
+        taken = {}
+        customers = Customer.objects.in_bulk({customer_pk for _, _, customer_pk, _ in parsed})
+        try:
+            with transaction.atomic():
+                products = CreateOrder.lock_products(
+                    {pk for _, _, _, quantities in parsed for pk in quantities}
+                )
+                for idx, order_data, customer_pk, quantities in parsed:
+                    if customer_pk not in customers:
+                        messages[idx] = "Invalid customer ID"
+                        continue
+                    try:
+                        CreateOrder.check_stock(products, quantities, taken)
+                    except ValidationError as e:
+                        messages[idx] = e.messages[0]
+                        continue
+                    for pk, quantity in quantities.items():
+                        taken[pk] = taken.get(pk, 0) + quantity
+                    order = Order(
+                        customer=customers[customer_pk],
+                        order_date=order_data.order_date or timezone.now(),
+                        total_amount=sum(
+                            quantity * products[pk].price for pk, quantity in quantities.items()
+                        ),
+                    )
+                    pending.append((idx, order, quantities))
+
+                if pending:
+                    CreateOrder.take_stock(products, taken)
+                    Order.objects.bulk_create([order for _, order, _ in pending], batch_size=batch_size)
+                    items = {
+                        idx: [
+                            OrderItem(
+                                order=order, product=products[pk],
+                                quantity=quantity, unit_price=products[pk].price,
+                            )
+                            for pk, quantity in quantities.items()
+                        ]
+                        for idx, order, quantities in pending
+                    }
+                    OrderItem.objects.bulk_create(
+                        [item for order_items in items.values() for item in order_items],
+                        batch_size=batch_size,
+                    )
+                    record_orders([(order, items[idx]) for idx, order, _ in pending])
+                    record_customer_orders([order for _, order, _ in pending])
+                    invalidate_on_commit(Order, OrderItem, Product)
+                    created = {idx: order for idx, order, _ in pending}
+        except ValidationError as e:
+            # Only raised by take_stock() on backends without row locks
+            for idx, _, _ in pending:
+                messages[idx] = e.messages[0]
+            created = {}
+
+        get_loaders(info).prime(created.values())
+        results = [
+            BulkOrderResult(
+                index=idx,
+                order=created.get(idx),
+                message=messages.get(idx, "Order created successfully"),
+            )
+            for idx in range(len(input))
+        ]
+        return cls(results=results, count=len(created))
+
+def supports_update_returning(connection):
+    """Return True if the backend accepts ``UPDATE ... RETURNING``."""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
 class UpdateLowStockProducts(graphene.Mutation):
     class Arguments:
-        pass
+        threshold = graphene.Int(default_value=10)
+        increment = graphene.Int(default_value=10)
 
     updated_products = graphene.List(ProductType)
     success = graphene.Boolean()
     message = graphene.String()
     count = graphene.Int()
 
+    @staticmethod
+    def restock(threshold, increment):
+        """
+        Add ``increment`` to the stock of every product below ``threshold``
+        in a single UPDATE and return the updated products.
+        """
+        if supports_update_returning(connection):
+            quote = connection.ops.quote_name
+            columns = ", ".join(quote(f.column) for f in Product._meta.concrete_fields)
+            stock = quote(Product._meta.get_field('stock').column)
+            sql = (
+                f"UPDATE {quote(Product._meta.db_table)} SET {stock} = {stock} + %s "
+                f"WHERE {stock} < %s RETURNING {columns}"
+            )
+            products = sorted(Product.objects.raw(sql, [increment, threshold]), key=lambda p: p.pk)
+        else:
+            with transaction.atomic():
+                ids = list(
+                    Product.objects.select_for_update()
+                    .filter(stock__lt=threshold)
+                    .values_list('pk', flat=True)
+                )
+                Product.objects.filter(pk__in=ids).update(stock=F('stock') + increment)
+                products = list(Product.objects.filter(pk__in=ids).order_by('pk'))
+        if products:
+            invalidate_on_commit(Product)
+        return products
+
     @classmethod
-    def mutate(cls, root, info):
+    def mutate(cls, root, info, threshold, increment):
+        if increment <= 0:
+            return cls(
+                updated_products=[],
+                success=False,
+                message="Increment must be positive",
+                count=0
+            )
         try:
-            # Query products with stock < 10
-            low_stock_products = Product.objects.filter(stock__lt=10)
-            
-            if not low_stock_products.exists():
+            updated_products = cls.restock(threshold, increment)
+
+            if not updated_products:
                 return cls(
                     updated_products=[],
                     success=True,
                     message="No low stock products found",
                     count=0
                 )
-            
-            # Update products by incrementing stock by 10
-            updated_products = []
-            for product in low_stock_products:
-                product.stock += 10
-                product.save()
-                updated_products.append(product)
-            
+
             return cls(
                 updated_products=updated_products,
                 success=True,
@@ -189,32 +549,120 @@ class UpdateLowStockProducts(graphene.Mutation):
                 count=0
             )
 
+# Report Types
+class StatsBucket(graphene.Enum):
+    DAY = 'day'
+    WEEK = 'week'
+
+BUCKET_FUNCTIONS = {
+    StatsBucket.DAY.value: TruncDay,
+    StatsBucket.WEEK.value: TruncWeek,
+}
+
+class CRMStats:
+    """Order statistics aggregated in the database, computed on first access."""
+
+    def __init__(self, orders, bucket=None):
+        self.orders = orders
+        self.bucket = bucket
+
+    @cached_property
+    def totals(self):
+        totals = self.orders.aggregate(order_count=Count('id'), revenue=Sum('total_amount'))
+        # SQLite sums decimals in floating point, with 12 decimals
+        totals['revenue'] = (totals['revenue'] or Decimal('0')).quantize(Decimal('0.01'))
+        return totals
+
+    @cached_property
+    def buckets(self):
+        if not self.bucket:
+            return []
+        trunc = BUCKET_FUNCTIONS[self.bucket]
+        rows = (
+            self.orders
+            .annotate(period_start=trunc('order_date'))
+            .values('period_start')
+            .annotate(order_count=Count('id'), revenue=Sum('total_amount'))
+            .order_by('period_start')
+        )
+        return [
+            SalesBucketType(**{**row, 'revenue': row['revenue'].quantize(Decimal('0.01'))})
+            for row in rows
+        ]
+
+class SalesBucketType(graphene.ObjectType):
+    period_start = graphene.DateTime()
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+
+class CRMStatsType(graphene.ObjectType):
+    customer_count = graphene.Int()
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+    buckets = graphene.List(SalesBucketType)
+
+    def resolve_customer_count(root, info):
+        return Customer.objects.count()
+
+    def resolve_order_count(root, info):
+        return root.totals['order_count']
+
+    def resolve_revenue(root, info):
+        return root.totals['revenue']
+
+    def resolve_buckets(root, info):
+        return root.buckets
+
 # Query class
 class Query(graphene.ObjectType):
-    all_customers = DjangoFilterConnectionField(CustomerType)
-    all_products = DjangoFilterConnectionField(ProductType)
-    all_orders = DjangoFilterConnectionField(OrderType)
+    all_customers = KeysetConnectionField(
+        CustomerType,
+        order_fields=['name', 'created_at', 'order_count', 'lifetime_value', 'last_order_at'],
+    )
+    all_products = KeysetConnectionField(ProductType, order_fields=['name', 'price', 'stock'])
+    all_orders = KeysetConnectionField(OrderType, order_fields=['order_date', 'total_amount'])
+    crm_stats = graphene.Field(
+        CRMStatsType,
+        bucket=StatsBucket(),
+        order_date_gte=graphene.DateTime(),
+        order_date_lte=graphene.DateTime(),
+    )
 
-    def resolve_all_customers(root, info, **kwargs):
-        qs = Customer.objects.all()
-        order_by = kwargs.get('order_by')
-        if order_by:
-            qs = qs.order_by(order_by)
+    daily_sales = graphene.List(
+        DailySalesRollupType,
+        date_gte=graphene.Date(),
+        date_lte=graphene.Date(),
+        product_id=graphene.ID(),
+    )
+
+    def resolve_daily_sales(root, info, date_gte=None, date_lte=None, product_id=None):
+        qs = DailySalesRollup.objects.select_related('product')
+        if product_id:
+            qs = qs.filter(product_id=product_id)
+        else:
+            qs = qs.filter(product__isnull=True)
+        if date_gte:
+            qs = qs.filter(date__gte=date_gte)
+        if date_lte:
+            qs = qs.filter(date__lte=date_lte)
         return qs
 
+    def resolve_crm_stats(root, info, bucket=None, order_date_gte=None, order_date_lte=None):
+        orders = Order.objects.all()
+        if order_date_gte:
+            orders = orders.filter(order_date__gte=order_date_gte)
+        if order_date_lte:
+            orders = orders.filter(order_date__lte=order_date_lte)
+        return CRMStats(orders, bucket=bucket.value if bucket else None)
+
+    def resolve_all_customers(root, info, **kwargs):
+        return optimize_queryset(Customer.objects.all(), info)
+
     def resolve_all_products(root, info, **kwargs):
-        qs = Product.objects.all()
-        order_by = kwargs.get('order_by')
-        if order_by:
-            qs = qs.order_by(order_by)
-        return qs
+        return optimize_queryset(Product.objects.all(), info)
 
     def resolve_all_orders(root, info, **kwargs):
-        qs = Order.objects.all()
-        order_by = kwargs.get('order_by')
-        if order_by:
-            qs = qs.order_by(order_by)
-        return qs
+        return optimize_queryset(Order.objects.all(), info)
 
 # Mutation class
 class Mutation(graphene.ObjectType):
@@ -222,4 +670,5 @@ class Mutation(graphene.ObjectType):
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
@@ -0,0 +1,204 @@
+"""
+Pluggable substring search for the ``*_icontains`` style CRM filters.
+
+``LIKE '%x%'`` cannot use a B-tree index, so where the database offers
+something better the filters go through an indexed backend instead:
+
+* SQLite: FTS5 virtual tables with the trigram tokenizer, kept in sync with
+  ``crm_customer``/``crm_product`` by triggers.
+* PostgreSQL: ``ILIKE`` served by ``pg_trgm`` GIN indexes.
+* Anything else (or indexes unavailable): plain ``icontains``.
+
+The backend is picked by the ``CRM_SEARCH_BACKEND`` setting: ``"auto"``
+(default), ``"icontains"``, ``"fts5"`` or ``"trigram"``. The indexes are
+(re)installed after every ``migrate`` by ``install_search_indexes``.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connections, models, transaction
+from django.db.models.expressions import RawSQL
+
+from crm.models import Customer, Product
+
+logger = logging.getLogger(__name__)
+
+# Model -> the text columns that get a search index
+SEARCH_FIELDS = {
+    Customer: ['name', 'email'],
+    Product: ['name'],
+}
+
+# The trigram tokenizer cannot match fewer than three characters
+MIN_TRIGRAM_LENGTH = 3
+
+
+@models.CharField.register_lookup
+class TrigramContains(models.Lookup):
+    """Case-insensitive substring match compiled to ``ILIKE`` (PostgreSQL)."""
+
+    lookup_name = 'trigram_contains'
+
+    def get_db_prep_lookup(self, value, connection):
+        return '%s', [f"%{connection.ops.prep_for_like_query(value)}%"]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} ILIKE {rhs}", [*lhs_params, *rhs_params]
+
+
+def split_field_path(model, field_path):
+    """
+    Split ``customer__name`` into the relation prefix, the model owning the
+    final field and that field.
+    """
+    *relations, field_name = field_path.split('__')
+    for name in relations:
+        model = model._meta.get_field(name).related_model
+    return '__'.join(relations), model, model._meta.get_field(field_name)
+
+
+def fts_table(model):
+    return f"{model._meta.db_table}_fts"
+
+
+class IContainsSearch:
+    """Portable fallback: ``LIKE '%value%'``."""
+
+    name = 'icontains'
+
+    def filter(self, queryset, field_path, value):
+        return queryset.filter(**{f"{field_path}__icontains": value})
+
+
+class TrigramSearch(IContainsSearch):
+    """PostgreSQL ``ILIKE`` backed by ``gin_trgm_ops`` indexes."""
+
+    name = 'trigram'
+
+    def filter(self, queryset, field_path, value):
+        return queryset.filter(**{f"{field_path}__trigram_contains": value})
+
+
+class FTS5Search(IContainsSearch):
+    """SQLite FTS5 trigram tables queried with ``MATCH``."""
+
+    name = 'fts5'
+
+    def filter(self, queryset, field_path, value):
+        prefix, model, field = split_field_path(queryset.model, field_path)
+        if len(value) < MIN_TRIGRAM_LENGTH or field.name not in SEARCH_FIELDS.get(model, []):
+            return super().filter(queryset, field_path, value)
+        table = fts_table(model)
+        phrase = value.replace('"', '""')
+        ids = RawSQL(
+            f'SELECT rowid FROM "{table}" WHERE "{table}" MATCH %s',
+            [f'{field.column} : "{phrase}"'],
+        )
+        lookup = f"{prefix}__pk__in" if prefix else "pk__in"
+        return queryset.filter(**{lookup: ids})
+
+
+BACKENDS = {backend.name: backend for backend in (IContainsSearch, TrigramSearch, FTS5Search)}
+
+# (alias, database name) -> whether the FTS5 tables are installed
+_fts_available = {}
+
+
+def fts_installed(connection):
+    key = (connection.alias, str(connection.settings_dict['NAME']))
+    if key not in _fts_available:
+        tables = set(connection.introspection.table_names())
+        _fts_available[key] = all(fts_table(model) in tables for model in SEARCH_FIELDS)
+    return _fts_available[key]
+
+
+def get_search_backend(using='default'):
+    connection = connections[using]
+    name = getattr(settings, 'CRM_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        if connection.vendor == 'sqlite' and fts_installed(connection):
+            name = FTS5Search.name
+        elif connection.vendor == 'postgresql':
+            name = TrigramSearch.name
+        else:
+            name = IContainsSearch.name
+    return BACKENDS[name]()
+
+
+def _install_sqlite(connection):
+    with connection.cursor() as cursor:
+        for model, fields in SEARCH_FIELDS.items():
+            source = model._meta.db_table
+            table = fts_table(model)
+            columns = [model._meta.get_field(name).column for name in fields]
+            column_list = ', '.join(columns)
+            new_values = ', '.join(f"new.{c}" for c in columns)
+            old_values = ', '.join(f"old.{c}" for c in columns)
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+                f"{column_list}, content='{source}', content_rowid='id', tokenize='trigram')"
+            )
+            triggers = {
+                f"{table}_ai": (
+                    f"AFTER INSERT ON {source} BEGIN "
+                    f"INSERT INTO {table}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+                ),
+                f"{table}_ad": (
+                    f"AFTER DELETE ON {source} BEGIN "
+                    f"INSERT INTO {table}({table}, rowid, {column_list}) "
+                    f"VALUES ('delete', old.id, {old_values}); END"
+                ),
+                f"{table}_au": (
+                    f"AFTER UPDATE OF {column_list} ON {source} BEGIN "
+                    f"INSERT INTO {table}({table}, rowid, {column_list}) "
+                    f"VALUES ('delete', old.id, {old_values}); "
+                    f"INSERT INTO {table}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+                ),
+            }
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                [source],
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [name for name in triggers if name not in existing]
+            # Table rebuilds during migrations drop triggers; resync the index
+            # whenever any of them had to be recreated.
+            for name in missing:
+                cursor.execute(f"CREATE TRIGGER {name} {triggers[name]}")
+            if missing:
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+
+def _install_postgresql(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for model, fields in SEARCH_FIELDS.items():
+            source = model._meta.db_table
+            for name in fields:
+                column = model._meta.get_field(name).column
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{source}_{column}_trgm" '
+                    f'ON "{source}" USING gin ("{column}" gin_trgm_ops)'
+                )
+
+
+def install_search_indexes(using='default', **kwargs):
+    """
+    Create the search indexes for the ``using`` database if the backend
+    supports them. Safe to run repeatedly; connected to ``post_migrate``.
+    """
+    connection = connections[using]
+    installers = {'sqlite': _install_sqlite, 'postgresql': _install_postgresql}
+    installer = installers.get(connection.vendor)
+    if installer is None:
+        return
+    try:
+        with transaction.atomic(using=using):
+            installer(connection)
+    except DatabaseError as e:
+        # e.g. SQLite built without FTS5, or no privilege to create pg_trgm
+        logger.warning("Search indexes not installed, falling back to icontains: %s", e)
+    _fts_available.clear()
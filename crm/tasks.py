@@ -3,10 +3,6 @@ Celery tasks for the CRM application.
 """
 
 from celery import shared_task
-from datetime import datetime
-import requests
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
 import django
 import os
 
@@ -21,81 +17,39 @@ def generate_crm_report():
     Generate a weekly CRM report with total customers, orders, and revenue.
     Uses GraphQL queries to fetch the data and logs the report.
     """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_file = "/tmp/crm_report_log.txt"
+    from crm.graphql_client import execute_graphql
+    from crm.joblog import job_log
     
-    try:
-        # Create GraphQL client
-        transport = RequestsHTTPTransport(
-            url='http://localhost:8000/graphql',
-            timeout=30
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-        
-        # GraphQL query to get CRM statistics
-        query = gql("""
-        query {
-            allCustomers {
-                edges {
-                    node {
-                        id
-                    }
-                }
-            }
-            allOrders {
-                edges {
-                    node {
-                        id
-                        totalAmount
-                    }
+    with job_log("crm_report") as log:
+        try:
+            # GraphQL query to get CRM statistics, aggregated in the database
+            result = execute_graphql("""
+            query {
+                crmStats {
+                    customerCount
+                    orderCount
+                    revenue
                 }
             }
-        }
-        """)
-        
-        # Execute the query
-        result = client.execute(query)
-        
-        if result:
-            # Calculate statistics
-            customers = result.get('allCustomers', {}).get('edges', [])
-            orders = result.get('allOrders', {}).get('edges', [])
-            
-            total_customers = len(customers)
-            total_orders = len(orders)
-            
-            # Calculate total revenue
-            total_revenue = 0
-            for order_edge in orders:
-                order = order_edge.get('node', {})
-                amount = order.get('totalAmount', 0)
-                if amount:
-                    total_revenue += float(amount)
-            
-            # Format the report
-            report_message = f"{timestamp} - Report: {total_customers} customers, {total_orders} orders, ${total_revenue:.2f} revenue"
+            """)
             
-            # Log the report
-            with open(log_file, "a") as f:
-                f.write(f"{report_message}\n")
+            if result and result.get('crmStats'):
+                stats = result['crmStats']
+                total_customers = stats['customerCount']
+                total_orders = stats['orderCount']
+                total_revenue = float(stats['revenue'] or 0)
             
-            return f"CRM report generated successfully: {total_customers} customers, {total_orders} orders, ${total_revenue:.2f} revenue"
+                log_report(log, total_customers, total_orders, total_revenue)
+                return f"CRM report generated successfully: {total_customers} customers, {total_orders} orders, ${total_revenue:.2f} revenue"
             
-        else:
-            error_message = f"{timestamp} - Error: Failed to fetch data from GraphQL endpoint"
-            with open(log_file, "a") as f:
-                f.write(f"{error_message}\n")
-            return "Failed to generate CRM report: No data received"
+            else:
+                log.error("Failed to fetch data from GraphQL endpoint")
+                return "Failed to generate CRM report: No data received"
             
-    except Exception as e:
-        # Handle any errors
-        error_message = f"{timestamp} - Error generating CRM report: {str(e)}"
-        try:
-            with open(log_file, "a") as f:
-                f.write(f"{error_message}\n")
-        except:
-            pass
-        return f"Failed to generate CRM report: {str(e)}"
+        except Exception as e:
+            # Handle any errors
+            log.error(f"Error generating CRM report: {str(e)}")
+            return f"Failed to generate CRM report: {str(e)}"
 
 
 @shared_task
@@ -104,34 +58,195 @@ def generate_crm_report_fallback():
     Fallback CRM report generation using Django ORM directly.
     This can be used when the GraphQL endpoint is not available.
     """
+    from django.db.models import Count, Sum
+    from crm.joblog import job_log
     from crm.models import Customer, Order
     
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_file = "/tmp/crm_report_log.txt"
+    with job_log("crm_report") as log:
+        try:
+            # Get statistics using Django ORM
+            total_customers = Customer.objects.count()
+            totals = Order.objects.aggregate(order_count=Count('id'), revenue=Sum('total_amount'))
+            total_orders = totals['order_count']
+            total_revenue = float(totals['revenue'] or 0)
+            
+            log_report(log, total_customers, total_orders, total_revenue)
+            return f"CRM report generated successfully (fallback): {total_customers} customers, {total_orders} orders, ${total_revenue:.2f} revenue"
+            
+        except Exception as e:
+            log.error(f"Error generating CRM report (fallback): {str(e)}")
+            return f"Failed to generate CRM report (fallback): {str(e)}"
+
+
+def log_report(log, total_customers, total_orders, total_revenue):
+    log.info(
+        f"Report: {total_customers} customers, {total_orders} orders, ${total_revenue:.2f} revenue",
+        customers=total_customers, orders=total_orders, revenue=total_revenue,
+    )
+
+
+@shared_task
+def rebuild_daily_sales_rollup(days=None):
+    """
+    Backfill or reconcile the DailySalesRollup table from the orders table.
+    With ``days`` set, only the last ``days`` days are recomputed; otherwise
+    the whole history is rebuilt.
+    """
+    from datetime import timedelta
+    from django.utils import timezone
+    from crm.joblog import job_log
+    from crm.rollups import rebuild
     
-    try:
-        # Get statistics using Django ORM
-        total_customers = Customer.objects.count()
-        total_orders = Order.objects.count()
-        
-        # Calculate total revenue
-        orders = Order.objects.all()
-        total_revenue = sum(float(order.total_amount) for order in orders if order.total_amount)
-        
-        # Format the report
-        report_message = f"{timestamp} - Report: {total_customers} customers, {total_orders} orders, ${total_revenue:.2f} revenue"
-        
-        # Log the report
-        with open(log_file, "a") as f:
-            f.write(f"{report_message}\n")
+    with job_log("sales_rollup") as log:
+        try:
+            start = timezone.localdate() - timedelta(days=days) if days else None
+            rows = rebuild(start=start)
+            message = f"Rebuilt {rows} daily sales rollup rows" + (f" for the last {days} days" if days else "")
+            log.info(message, rows=rows, days=days)
+            return message
         
-        return f"CRM report generated successfully (fallback): {total_customers} customers, {total_orders} orders, ${total_revenue:.2f} revenue"
+        except Exception as e:
+            log.error(f"Error rebuilding daily sales rollup: {str(e)}")
+            return f"Failed to rebuild daily sales rollup: {str(e)}"
+
+
+@shared_task
+def clean_inactive_customers(days=None, batch_size=None, max_batches=None):
+    """
+    Delete customers who never ordered and were created more than ``days``
+    days ago, in short batches. An unfinished run (stopped by
+    ``max_batches`` or a worker restart) is resumed by the next one.
+    """
+    from crm.cleanup import delete_inactive_customers
+    from crm.joblog import job_log
+    
+    with job_log("customer_cleanup") as log:
+        try:
+            result = delete_inactive_customers(days=days, batch_size=batch_size, max_batches=max_batches)
+            message = f"Deleted {result.deleted} inactive customers in {result.batches} batches"
+            if not result.complete:
+                message += " (unfinished, will resume)"
+            log.info(message, **result._asdict())
+            return message
         
-    except Exception as e:
-        error_message = f"{timestamp} - Error generating CRM report (fallback): {str(e)}"
+        except Exception as e:
+            log.error(f"Error cleaning inactive customers: {str(e)}")
+            return f"Failed to clean inactive customers: {str(e)}"
+
+
+@shared_task
+def reconcile_customer_totals(batch_size=1000):
+    """
+    Recompute the denormalized order totals of every customer from the
+    orders table, fixing the ones that drifted (see crm/customer_totals.py).
+    """
+    from crm.customer_totals import reconcile
+    from crm.joblog import job_log
+    
+    with job_log("customer_totals") as log:
         try:
-            with open(log_file, "a") as f:
-                f.write(f"{error_message}\n")
-        except:
-            pass
-        return f"Failed to generate CRM report (fallback): {str(e)}"
+            result = reconcile(batch_size=batch_size)
+            message = f"Checked {result.checked} customers, fixed {result.fixed}"
+            log.info(message, **result._asdict())
+            return message
+        
+        except Exception as e:
+            log.error(f"Error reconciling customer totals: {str(e)}")
+            return f"Failed to reconcile customer totals: {str(e)}"
+
+
+# Partitioned jobs: the dispatcher splits the order ids into ranges of
+# CRM_TASK_PARTITION_SIZE (see crm/partitions.py) and runs one subtask per
+# range as a chord; the callback merges the partial results. Subtasks let
+# errors propagate, so that a failed partition keeps the callback from
+# running on incomplete results.
+
+@shared_task
+def crm_report_partition(after_id, up_to_id):
+    """Order count and revenue of the orders with an id in ``(after_id, up_to_id]``."""
+    from django.db.models import Count, Sum
+    from crm.models import Order
+    
+    totals = Order.objects.filter(pk__gt=after_id, pk__lte=up_to_id).aggregate(
+        order_count=Count('id'), revenue=Sum('total_amount')
+    )
+    return {'order_count': totals['order_count'], 'revenue': str(totals['revenue'] or 0)}
+
+
+@shared_task
+def merge_crm_report(partials):
+    """Chord callback adding up the crm_report_partition results and logging the report."""
+    from decimal import Decimal
+    from crm.joblog import job_log
+    from crm.models import Customer
+    
+    total_customers = Customer.objects.count()
+    total_orders = sum(partial['order_count'] for partial in partials)
+    total_revenue = float(sum((Decimal(partial['revenue']) for partial in partials), Decimal('0')))
+    
+    with job_log("crm_report") as log:
+        log_report(log, total_customers, total_orders, total_revenue)
+    return f"CRM report generated successfully: {total_customers} customers, {total_orders} orders, ${total_revenue:.2f} revenue"
+
+
+@shared_task
+def generate_crm_report_parallel(partition_size=None):
+    """
+    The weekly CRM report of generate_crm_report, computed by one
+    crm_report_partition subtask per range of order ids.
+    """
+    from celery import chord, group
+    from crm.models import Order
+    from crm.partitions import id_partitions
+    
+    partitions = id_partitions(Order.objects.all(), partition_size)
+    chord(group(crm_report_partition.s(*bounds) for bounds in partitions))(merge_crm_report.s())
+    return f"CRM report dispatched over {len(partitions)} partitions"
+
+
+@shared_task
+def send_order_reminders_partition(after_id, up_to_id):
+    """Send the reminders of the orders with an id in ``(after_id, up_to_id]``."""
+    from crm.joblog import job_log
+    from crm.reminders import JOB_LOG, log_reminder, remind_range
+    
+    with job_log(JOB_LOG) as log:
+        return remind_range(log_reminder(log), after_id, up_to_id)
+
+
+@shared_task
+def merge_order_reminders(counts, up_to_id):
+    """Chord callback moving the reminder high-water mark past every partition."""
+    from crm.joblog import job_log
+    from crm.reminders import JOB_LOG, log_sent, set_high_water_mark
+    
+    set_high_water_mark(up_to_id)
+    sent = sum(counts)
+    with job_log(JOB_LOG) as log:
+        log_sent(log, sent)
+    return f"Processed {sent} new orders" if sent else "No new orders found"
+
+
+@shared_task
+def send_order_reminders_parallel(partition_size=None):
+    """
+    Send the reminders of the orders placed since the last run (see
+    crm/reminders.py) with one send_order_reminders_partition subtask per
+    range of order ids. Orders placed within the grace window are left for
+    the next run. The high-water mark only moves once every partition has
+    succeeded; after a failure the next run redoes the ranges, skipping the
+    orders already reminded.
+    """
+    from celery import chord, group
+    from crm.models import Order
+    from crm.partitions import id_partitions
+    from crm.reminders import get_high_water_mark, reminder_settings, settled_up_to
+    
+    config = reminder_settings()
+    mark = get_high_water_mark(config['LOOKBACK_DAYS'])
+    up_to_id = settled_up_to(mark, config['GRACE_SECONDS'])
+    partitions = id_partitions(Order.objects.filter(pk__lte=up_to_id), partition_size, after_id=mark)
+    chord(group(send_order_reminders_partition.s(*bounds) for bounds in partitions))(
+        merge_order_reminders.s(up_to_id)
+    )
+    return f"Order reminders dispatched over {len(partitions)} partitions"
@@ -0,0 +1,40 @@
+"""
+Test runner for the CRM project.
+
+The settings point the cache at Redis, which is shared between processes.
+The test suite runs in one process and must not depend on (or pollute) a
+Redis server, so it runs against an in-process cache instead.
+
+A SQLite test database is a file rather than Django's shared in-memory
+database, whose table locks fail at once instead of waiting, so that the
+concurrency tests can run several threads against it.
+"""
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'crm-tests',
+    },
+}
+
+
+class CRMTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_override = override_settings(CACHES=TEST_CACHES)
+        self._cache_override.enable()
+
+    def setup_databases(self, **kwargs):
+        settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+        if settings_dict['ENGINE'] == 'django.db.backends.sqlite3' and not settings_dict['TEST']['NAME']:
+            settings_dict['TEST']['NAME'] = settings.BASE_DIR / 'test_db.sqlite3'
+        return super().setup_databases(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,1786 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from importlib import import_module
+from unittest import skipUnless
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils.module_loading import import_string
+from django.db import DatabaseError, connection, transaction
+from django.http import StreamingHttpResponse
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphql_relay import from_global_id
+import requests
+
+from alx_backend_graphql.schema import schema
+from crm import cleanup, cron, customer_totals, graphql_client, health, reminders, rollups, tasks
+from crm.celery import app as celery_app
+from crm.cache import response_cache
+from crm.checks import PROCESS_LOCAL_BACKENDS, check_shared_cache
+from crm.execution import ConcurrentRootExecutionContext
+from crm.exports import NDJSONRenderer, export_queryset, stream_orders
+from crm.instrumentation import metrics
+from crm.joblog import JobLog, RotatingFile, background_writer, job_log
+from crm.partitions import id_partitions
+from crm.models import Customer, Product, Order, OrderItem, OrderReminder, DailySalesRollup, JobCheckpoint
+from crm.search import get_search_backend
+from crm.views import document_cache
+
+
+def execute(query, variables=None):
+    """Run ``query`` against the schema with a fresh request as context."""
+    request = RequestFactory().post('/graphql')
+    return schema.execute(query, variable_values=variables, context_value=request)
+
+
+def create_orders(count, products_per_order=2):
+    products = [
+        Product.objects.create(name=f"Product {i}", price=Decimal('10.00'), stock=5)
+        for i in range(products_per_order)
+    ]
+    orders = []
+    for i in range(count):
+        customer = Customer.objects.create(name=f"Customer {i}", email=f"c{i}@example.com")
+        order = Order.objects.create(customer=customer, total_amount=Decimal('20.00'))
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, unit_price=product.price) for product in products
+        ])
+        orders.append(order)
+    customer_totals.record_customer_orders(orders)
+    return products
+
+
+def temporary_job_logs(test):
+    """Write the job logs to a temporary directory for the rest of ``test``."""
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory)
+    override = override_settings(CRM_JOB_LOGS={'DIRECTORY': directory})
+    override.enable()
+    test.addCleanup(override.disable)
+    return directory
+
+
+def read_job_log(directory, job):
+    with open(os.path.join(directory, f"{job}_log.txt")) as f:
+        return [json.loads(line) for line in f]
+
+
+class DataLoaderTests(TestCase):
+    ORDERS_QUERY = """
+    query {
+        allOrders {
+            edges {
+                node {
+                    id
+                    customer { name }
+                    products { edges { node { name } } }
+                }
+            }
+        }
+    }
+    """
+
+    def test_order_relations_use_bounded_query_count(self):
+        # count + page joined to customer + prefetched products
+        for page_size in (3, 15):
+            Order.objects.all().delete()
+            Customer.objects.all().delete()
+            Product.objects.all().delete()
+            create_orders(page_size)
+            with self.assertNumQueries(3):
+                result = execute(self.ORDERS_QUERY)
+            self.assertIsNone(result.errors)
+            edges = result.data['allOrders']['edges']
+            self.assertEqual(len(edges), page_size)
+            for edge in edges:
+                self.assertTrue(edge['node']['customer']['name'].startswith('Customer'))
+                self.assertEqual(len(edge['node']['products']['edges']), 2)
+
+    def test_nested_orders_are_batched(self):
+        create_orders(5)
+        query = """
+        query {
+            allProducts {
+                edges { node { name orders { edges { node { customer { email } } } } } }
+            }
+        }
+        """
+        # count + page + prefetched orders joined to customer
+        with self.assertNumQueries(3):
+            result = execute(query)
+        self.assertIsNone(result.errors)
+        for edge in result.data['allProducts']['edges']:
+            self.assertEqual(len(edge['node']['orders']['edges']), 5)
+
+    def test_filtered_nested_connection_falls_back_to_queryset(self):
+        create_orders(2)
+        query = """
+        query {
+            allOrders {
+                edges { node { products(nameIcontains: "Product 1") { edges { node { name } } } } }
+            }
+        }
+        """
+        result = execute(query)
+        self.assertIsNone(result.errors)
+        for edge in result.data['allOrders']['edges']:
+            names = [e['node']['name'] for e in edge['node']['products']['edges']]
+            self.assertEqual(names, ['Product 1'])
+
+
+class QueryOptimizerTests(TestCase):
+    def test_only_requested_columns_are_selected(self):
+        create_orders(2)
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute("query { allOrders { edges { node { id customer { name } } } } }")
+        self.assertIsNone(result.errors)
+        page_sql = ctx.captured_queries[1]['sql']
+        self.assertIn('"crm_customer"."name"', page_sql)
+        self.assertNotIn('total_amount', page_sql)
+        self.assertNotIn('"crm_customer"."email"', page_sql)
+
+    def test_fragments_are_followed(self):
+        create_orders(2)
+        query = """
+        query {
+            allOrders { edges { node { ...OrderFields } } }
+        }
+        fragment OrderFields on OrderType {
+            totalAmount
+            products { edges { node { ... on ProductType { price } } } }
+        }
+        """
+        # count + page + prefetched products
+        with self.assertNumQueries(3):
+            result = execute(query)
+        self.assertIsNone(result.errors)
+        node = result.data['allOrders']['edges'][0]['node']
+        self.assertEqual(node['totalAmount'], '20.00')
+        self.assertEqual(len(node['products']['edges']), 2)
+
+
+class BulkCreateCustomersTests(TestCase):
+    MUTATION = """
+    mutation BulkCreate($input: [CustomerInput]!, $batchSize: Int) {
+        bulkCreateCustomers(input: $input, batchSize: $batchSize) {
+            customers { email }
+            errors
+        }
+    }
+    """
+
+    def test_errors_keep_row_order_and_format(self):
+        Customer.objects.create(name="Existing", email="taken@example.com")
+        rows = [
+            {'name': "A", 'email': "a@example.com", 'phone': "+1234567890"},
+            {'name': "B", 'email': "taken@example.com"},
+            {'name': "C", 'email': "c@example.com", 'phone': "bad"},
+            {'name': "", 'email': "d@example.com"},
+            {'name': "A again", 'email': "a@example.com"},
+            {'name': "C retry", 'email': "c@example.com", 'phone': "123-456-7890"},
+        ]
+        result = execute(self.MUTATION, {'input': rows, 'batchSize': 2})
+        self.assertIsNone(result.errors)
+        payload = result.data['bulkCreateCustomers']
+        self.assertEqual(
+            [c['email'] for c in payload['customers']],
+            ["a@example.com", "c@example.com"],
+        )
+        self.assertEqual(payload['errors'], [
+            "Row 2: Email already exists",
+            "Row 3: Invalid phone format",
+            "Row 4: Name and email required",
+            "Row 5: Email already exists",
+        ])
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_query_count_is_per_batch(self):
+        rows = [{'name': f"N{i}", 'email': f"n{i}@example.com"} for i in range(40)]
+        # email lookup + insert per batch of 20, plus savepoint bookkeeping
+        with self.assertNumQueries(6):
+            result = execute(self.MUTATION, {'input': rows, 'batchSize': 20})
+        self.assertIsNone(result.errors)
+        self.assertEqual(Customer.objects.count(), 40)
+
+
+class UpdateLowStockProductsTests(TestCase):
+    MUTATION = """
+    mutation Restock($threshold: Int, $increment: Int) {
+        updateLowStockProducts(threshold: $threshold, increment: $increment) {
+            success
+            message
+            count
+            updatedProducts { name stock price }
+        }
+    }
+    """
+
+    def test_updates_low_stock_in_one_statement(self):
+        Product.objects.create(name="Low", price=Decimal('5.50'), stock=2)
+        Product.objects.create(name="Edge", price=Decimal('1.00'), stock=10)
+        Product.objects.create(name="Plenty", price=Decimal('1.00'), stock=50)
+        with self.assertNumQueries(1):
+            result = execute(self.MUTATION)
+        self.assertIsNone(result.errors)
+        payload = result.data['updateLowStockProducts']
+        self.assertTrue(payload['success'])
+        self.assertEqual(payload['count'], 1)
+        self.assertEqual(payload['updatedProducts'], [{'name': "Low", 'stock': 12, 'price': '5.50'}])
+        self.assertEqual(Product.objects.get(name="Low").stock, 12)
+
+    def test_threshold_and_increment_arguments(self):
+        Product.objects.create(name="Edge", price=Decimal('1.00'), stock=10)
+        result = execute(self.MUTATION, {'threshold': 11, 'increment': 5})
+        payload = result.data['updateLowStockProducts']
+        self.assertEqual(payload['count'], 1)
+        self.assertEqual(Product.objects.get(name="Edge").stock, 15)
+
+    def test_nothing_to_update(self):
+        Product.objects.create(name="Plenty", price=Decimal('1.00'), stock=50)
+        payload = execute(self.MUTATION).data['updateLowStockProducts']
+        self.assertEqual(payload['message'], "No low stock products found")
+        self.assertEqual(payload['count'], 0)
+
+
+class CRMStatsTests(TestCase):
+    QUERY = """
+    query Stats($bucket: StatsBucket) {
+        crmStats(bucket: $bucket) {
+            customerCount
+            orderCount
+            revenue
+            buckets { periodStart orderCount revenue }
+        }
+    }
+    """
+
+    def test_totals_are_aggregated_in_sql(self):
+        create_orders(4)
+        # customer count + one aggregate over orders
+        with self.assertNumQueries(2):
+            result = execute(self.QUERY)
+        self.assertIsNone(result.errors)
+        stats = result.data['crmStats']
+        self.assertEqual(stats['customerCount'], 4)
+        self.assertEqual(stats['orderCount'], 4)
+        self.assertEqual(stats['revenue'], '80.00')
+        self.assertEqual(stats['buckets'], [])
+
+    def test_daily_buckets(self):
+        create_orders(3)
+        first = Order.objects.order_by('id').first()
+        Order.objects.filter(pk=first.pk).update(order_date=first.order_date - timedelta(days=2))
+        stats = execute(self.QUERY, {'bucket': 'DAY'}).data['crmStats']
+        self.assertEqual([b['orderCount'] for b in stats['buckets']], [1, 2])
+        self.assertEqual([b['revenue'] for b in stats['buckets']], ['20.00', '40.00'])
+
+    def test_empty_revenue_is_zero(self):
+        stats = execute(self.QUERY).data['crmStats']
+        self.assertEqual(stats['orderCount'], 0)
+        self.assertEqual(stats['revenue'], '0.00')
+
+
+class DailySalesRollupTests(TestCase):
+    CREATE_ORDER = """
+    mutation CreateOrder($input: OrderInput!) {
+        createOrder(input: $input) { message order { totalAmount } }
+    }
+    """
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price=Decimal('999.99'), stock=10)
+        self.phone = Product.objects.create(name="Phone", price=Decimal('499.99'), stock=10)
+
+    def create_order(self, *products):
+        # Rollups are written once the order commits
+        with self.captureOnCommitCallbacks(execute=True):
+            result = execute(self.CREATE_ORDER, {'input': {
+                'customerId': self.customer.pk,
+                'productIds': [p.pk for p in products],
+            }})
+        self.assertIsNone(result.errors)
+        return result
+
+    def test_failed_rollup_does_not_fail_the_order(self):
+        with patch.object(rollups, '_record', side_effect=DatabaseError("database is locked")), \
+                self.assertLogs('django', 'ERROR'):
+            result = self.create_order(self.laptop)
+        self.assertEqual(result.data['createOrder']['message'], "Order created successfully")
+        self.assertFalse(DailySalesRollup.objects.exists())
+
+    def test_rollups_are_written_after_the_order_commits(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            result = execute(self.CREATE_ORDER, {'input': {
+                'customerId': self.customer.pk, 'productIds': [self.laptop.pk],
+            }})
+            self.assertIsNone(result.errors)
+            self.assertFalse(DailySalesRollup.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(DailySalesRollup.objects.get(product__isnull=True).order_count, 1)
+
+    def test_create_order_updates_rollup_incrementally(self):
+        self.create_order(self.laptop, self.phone)
+        self.create_order(self.phone)
+        total = DailySalesRollup.objects.get(product__isnull=True)
+        self.assertEqual(total.order_count, 2)
+        self.assertEqual(total.revenue, Decimal('1999.97'))
+        phone = DailySalesRollup.objects.get(product=self.phone)
+        self.assertEqual((phone.order_count, phone.revenue), (2, Decimal('999.98')))
+        laptop = DailySalesRollup.objects.get(product=self.laptop)
+        self.assertEqual((laptop.order_count, laptop.revenue), (1, Decimal('999.99')))
+
+    def test_rebuild_matches_incremental_rows(self):
+        self.create_order(self.laptop, self.phone)
+        self.create_order(self.phone)
+        incremental = list(DailySalesRollup.objects.values_list('date', 'product_id', 'order_count', 'revenue'))
+        DailySalesRollup.objects.all().delete()
+        self.assertEqual(rollups.rebuild(), 3)
+        rebuilt = list(DailySalesRollup.objects.values_list('date', 'product_id', 'order_count', 'revenue'))
+        self.assertEqual(rebuilt, incremental)
+
+    def test_daily_sales_query(self):
+        self.create_order(self.laptop)
+        query = """
+        query Sales($productId: ID) {
+            dailySales(productId: $productId) { date orderCount revenue }
+        }
+        """
+        totals = execute(query).data['dailySales']
+        self.assertEqual(len(totals), 1)
+        self.assertEqual(totals[0]['orderCount'], 1)
+        per_product = execute(query, {'productId': self.phone.pk}).data['dailySales']
+        self.assertEqual(per_product, [])
+
+
+class OrderItemTests(TestCase):
+    CREATE_ORDER = """
+    mutation CreateOrder($input: OrderInput!) {
+        createOrder(input: $input) {
+            message
+            order { totalAmount items { quantity unitPrice product { name } } }
+        }
+    }
+    """
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price=Decimal('999.99'), stock=10)
+        self.phone = Product.objects.create(name="Phone", price=Decimal('499.99'), stock=10)
+
+    def create_order(self, **input):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = execute(self.CREATE_ORDER, {'input': {'customerId': self.customer.pk, **input}})
+        self.assertIsNone(result.errors)
+        return result.data['createOrder']
+
+    def test_items_with_quantities(self):
+        payload = self.create_order(items=[
+            {'productId': self.laptop.pk, 'quantity': 2},
+            {'productId': self.phone.pk},
+        ])
+        self.assertEqual(payload['message'], "Order created successfully")
+        self.assertEqual(payload['order']['totalAmount'], '2499.97')
+        self.assertEqual(
+            [(i['product']['name'], i['quantity'], i['unitPrice']) for i in payload['order']['items']],
+            [("Laptop", 2, '999.99'), ("Phone", 1, '499.99')],
+        )
+        self.assertEqual(Order.objects.get().total_amount, Decimal('2499.97'))
+        self.assertEqual(Customer.objects.get().lifetime_value, Decimal('2499.97'))
+        self.assertEqual(str(DailySalesRollup.objects.get(product=None).revenue), '2499.97')
+
+    def test_repeated_products_are_merged(self):
+        self.create_order(productIds=[self.phone.pk, self.phone.pk])
+        item = OrderItem.objects.get()
+        self.assertEqual((item.quantity, item.order.total_amount), (2, Decimal('999.98')))
+
+    def test_unit_price_is_a_snapshot(self):
+        self.create_order(productIds=[self.laptop.pk])
+        Product.objects.filter(pk=self.laptop.pk).update(price=Decimal('1299.00'))
+        result = execute("query { allOrders { edges { node { totalAmount items { unitPrice } } } } }")
+        node = result.data['allOrders']['edges'][0]['node']
+        self.assertEqual((node['totalAmount'], node['items'][0]['unitPrice']), ('999.99', '999.99'))
+
+    def test_invalid_input(self):
+        for input, message in [
+            ({'items': [{'productId': self.laptop.pk, 'quantity': 0}]}, "Quantities must be positive"),
+            ({'items': [{'productId': 'x'}]}, "One or more product IDs are invalid"),
+            ({'productIds': [self.laptop.pk], 'items': []}, "Provide either product IDs or items, not both"),
+            ({'items': []}, "At least one product must be selected"),
+        ]:
+            with self.subTest(input=input):
+                self.assertEqual(self.create_order(**input)['message'], message)
+        self.assertFalse(Order.objects.exists())
+
+    def test_query_count_does_not_grow_with_items(self):
+        products = [Product.objects.create(name=f"P{i}", price=Decimal('1.00'), stock=5) for i in range(10)]
+        query = "mutation Create($input: OrderInput!) { createOrder(input: $input) { message } }"
+        counts = []
+        for chosen in (products[:1], products):
+            with CaptureQueriesContext(connection) as ctx:
+                execute(query, {'input': {'customerId': self.customer.pk, 'productIds': [p.pk for p in chosen]}})
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Order.objects.last().total_amount, Decimal('10.00'))
+
+    def test_rollups_use_line_totals(self):
+        self.create_order(items=[{'productId': self.phone.pk, 'quantity': 3}])
+        phone = DailySalesRollup.objects.get(product=self.phone)
+        self.assertEqual((phone.order_count, phone.revenue), (1, Decimal('1499.97')))
+        incremental = list(DailySalesRollup.objects.values_list('date', 'product_id', 'order_count', 'revenue'))
+        rollups.rebuild()
+        rebuilt = list(DailySalesRollup.objects.values_list('date', 'product_id', 'order_count', 'revenue'))
+        self.assertEqual(rebuilt, incremental)
+
+    def test_nested_items_are_batched(self):
+        create_orders(5)
+        query = "query { allOrders { edges { node { items { quantity product { name } } } } } }"
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute(query)
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(result.data['allOrders']['edges'][0]['node']['items']), 2)
+        self.assertLessEqual(len(ctx), 3)
+
+
+class StockReservationTests(TestCase):
+    CREATE_ORDER = """
+    mutation CreateOrder($input: OrderInput!) {
+        createOrder(input: $input) { message order { id } }
+    }
+    """
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price=Decimal('999.99'), stock=3)
+        self.phone = Product.objects.create(name="Phone", price=Decimal('499.99'), stock=1)
+
+    def create_order(self, *items):
+        result = execute(self.CREATE_ORDER, {'input': {
+            'customerId': self.customer.pk,
+            'items': [{'productId': product.pk, 'quantity': quantity} for product, quantity in items],
+        }})
+        self.assertIsNone(result.errors)
+        return result.data['createOrder']['message']
+
+    def test_order_takes_stock(self):
+        self.assertEqual(self.create_order((self.laptop, 2), (self.phone, 1)), "Order created successfully")
+        self.laptop.refresh_from_db()
+        self.phone.refresh_from_db()
+        self.assertEqual((self.laptop.stock, self.phone.stock), (1, 0))
+
+    def test_insufficient_stock_rolls_back_the_order(self):
+        message = self.create_order((self.laptop, 2), (self.phone, 2))
+        self.assertEqual(message, "Insufficient stock for Phone (2 requested, 1 available)")
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.stock, 3)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(DailySalesRollup.objects.exists())
+
+    def test_stock_is_taken_in_one_update(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.create_order((self.laptop, 1), (self.phone, 1))
+        self.assertEqual(len([q for q in ctx if q['sql'].startswith('UPDATE "crm_product"')]), 1)
+
+
+class ConcurrentStockReservationTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite':
+            # SQLite locks the whole database: make the order threads take
+            # the write lock when their transaction begins and wait for it,
+            # instead of failing when two transactions that started by
+            # reading both try to write
+            patcher = patch.dict(connection.settings_dict['OPTIONS'], transaction_mode='IMMEDIATE', timeout=20)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_parallel_orders_never_oversell(self):
+        hot = Product.objects.create(name="Hot", price=Decimal('5.00'), stock=10)
+        customers = [
+            Customer.objects.create(name=f"Customer {i}", email=f"c{i}@example.com") for i in range(25)
+        ]
+        query = "mutation Create($input: OrderInput!) { createOrder(input: $input) { message } }"
+        start = threading.Barrier(len(customers), timeout=10)
+        messages = []
+
+        def place_order(customer):
+            try:
+                start.wait()
+                result = execute(query, {'input': {'customerId': customer.pk, 'productIds': [hot.pk]}})
+                messages.append(result.errors or result.data['createOrder']['message'])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=place_order, args=(c,)) for c in customers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(messages.count("Order created successfully"), 10)
+        self.assertEqual(messages.count("Insufficient stock for Hot (1 requested, 0 available)"), 15)
+        hot.refresh_from_db()
+        self.assertEqual(hot.stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=hot).count(), 10)
+        self.assertEqual(DailySalesRollup.objects.get(product=hot).order_count, 10)
+
+
+class BulkCreateOrdersTests(TestCase):
+    MUTATION = """
+    mutation Bulk($input: [OrderInput!]!) {
+        bulkCreateOrders(input: $input) {
+            count
+            results { index message order { totalAmount items { quantity product { name } } } }
+        }
+    }
+    """
+
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price=Decimal('999.99'), stock=3)
+        self.phone = Product.objects.create(name="Phone", price=Decimal('499.99'), stock=10)
+
+    def bulk_create(self, orders):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = execute(self.MUTATION, {'input': orders})
+        self.assertIsNone(result.errors)
+        return result.data['bulkCreateOrders']
+
+    def test_valid_orders_are_created_and_invalid_ones_reported(self):
+        payload = self.bulk_create([
+            {'customerId': self.alice.pk, 'items': [{'productId': self.laptop.pk, 'quantity': 2}]},
+            {'customerId': 999, 'productIds': [self.phone.pk]},
+            {'customerId': self.bob.pk, 'items': [{'productId': self.laptop.pk, 'quantity': 2}]},
+            {'customerId': self.bob.pk, 'productIds': [self.laptop.pk, self.phone.pk]},
+            {'customerId': self.alice.pk, 'productIds': []},
+        ])
+        self.assertEqual(payload['count'], 2)
+        self.assertEqual([r['message'] for r in payload['results']], [
+            "Order created successfully",
+            "Invalid customer ID",
+            "Insufficient stock for Laptop (2 requested, 1 available)",
+            "Order created successfully",
+            "At least one product must be selected",
+        ])
+        self.assertEqual(payload['results'][0]['order']['totalAmount'], '1999.98')
+        self.assertEqual(
+            [(i['product']['name'], i['quantity']) for i in payload['results'][3]['order']['items']],
+            [("Laptop", 1), ("Phone", 1)],
+        )
+        self.assertIsNone(payload['results'][2]['order'])
+        self.laptop.refresh_from_db()
+        self.phone.refresh_from_db()
+        self.assertEqual((self.laptop.stock, self.phone.stock), (0, 9))
+        self.assertEqual(OrderItem.objects.count(), 3)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        # Both measured runs then update the day's existing rollup rows
+        self.bulk_create([{'customerId': self.alice.pk, 'productIds': [self.phone.pk]}])
+        counts = []
+        for size in (2, 20):
+            orders = [{'customerId': self.alice.pk, 'productIds': [self.phone.pk]}] * (size // 2) + [
+                {'customerId': self.bob.pk, 'items': [{'productId': self.phone.pk, 'quantity': 0}]}
+            ] * (size // 2)
+            Product.objects.filter(pk=self.phone.pk).update(stock=100)
+            with CaptureQueriesContext(connection) as ctx:
+                payload = execute(
+                    "mutation Bulk($input: [OrderInput!]!) { bulkCreateOrders(input: $input) { count } }",
+                    {'input': orders},
+                ).data['bulkCreateOrders']
+            self.assertEqual(payload['count'], size // 2)
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_rollups_match_rebuild(self):
+        self.bulk_create([
+            {'customerId': self.alice.pk, 'items': [{'productId': self.phone.pk, 'quantity': 3}]},
+            {'customerId': self.bob.pk, 'productIds': [self.phone.pk, self.laptop.pk]},
+        ])
+        total = DailySalesRollup.objects.get(product__isnull=True)
+        self.assertEqual((total.order_count, total.revenue), (2, Decimal('2999.95')))
+        incremental = list(DailySalesRollup.objects.values_list('date', 'product_id', 'order_count', 'revenue'))
+        rollups.rebuild()
+        rebuilt = list(DailySalesRollup.objects.values_list('date', 'product_id', 'order_count', 'revenue'))
+        self.assertEqual(rebuilt, incremental)
+
+
+class ExplainFiltersCommandTests(TestCase):
+    def test_reports_scanning_combinations(self):
+        out = StringIO()
+        call_command('explain_filters', max_filters=1, stdout=out)
+        output = out.getvalue()
+        self.assertIn("filter combinations still scan a full table", output)
+        # Range filters are served by the new indexes
+        self.assertNotIn("OrderFilter(order_date_gte)", output)
+        self.assertNotIn("ProductFilter(stock_lte)", output)
+
+    def test_phone_pattern_matches_prefixes(self):
+        for name, phone in [("A", "+1234567890"), ("B", "+1239999999"), ("C", "+2234567890"), ("D", "+123")]:
+            Customer.objects.create(name=name, email=f"{name}@example.com", phone=phone)
+        result = execute('{ allCustomers(phonePattern: "+123", orderBy: "name") { edges { node { name } } } }')
+        self.assertEqual([e['node']['name'] for e in result.data['allCustomers']['edges']], ["A", "B", "D"])
+        # LIKE 'prefix%' can only use a PostgreSQL index built with pattern ops
+        [index] = [index for index in Customer._meta.indexes if index.fields == ['phone']]
+        self.assertEqual(index.opclasses, ['varchar_pattern_ops'])
+
+
+class SearchBackendTests(TestCase):
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice Smith", email="alice@example.com")
+        self.bob = Customer.objects.create(name="Bob Jones", email="bob@sample.org")
+        self.laptop = Product.objects.create(name="Gaming Laptop", price=Decimal('10.00'))
+        order = Order.objects.create(customer=self.bob, total_amount=Decimal('10.00'))
+        order.products.set([self.laptop], through_defaults={'unit_price': self.laptop.price})
+
+    def names(self, query, field):
+        result = execute(query)
+        self.assertIsNone(result.errors)
+        return [edge['node'][field] for edge in result.data[next(iter(result.data))]['edges']]
+
+    def test_sqlite_uses_fts5_index(self):
+        self.assertEqual(get_search_backend().name, 'fts5')
+        with CaptureQueriesContext(connection) as ctx:
+            names = self.names('{ allCustomers(nameIcontains: "SMI") { edges { node { name } } } }', 'name')
+        self.assertEqual(names, ["Alice Smith"])
+        self.assertIn('MATCH', ctx.captured_queries[-1]['sql'])
+
+    def test_index_follows_updates_and_deletes(self):
+        Customer.objects.filter(pk=self.alice.pk).update(name="Alicia Brown")
+        query = '{ allCustomers(nameIcontains: "%s") { edges { node { name } } } }'
+        self.assertEqual(self.names(query % "smith", 'name'), [])
+        self.assertEqual(self.names(query % "brown", 'name'), ["Alicia Brown"])
+        self.bob.delete()
+        self.assertEqual(self.names(query % "jones", 'name'), [])
+
+    def test_related_and_short_values(self):
+        query = '{ allOrders(productName: "laptop", customerName: "bob") { edges { node { id } } } }'
+        self.assertEqual(len(self.names(query, 'id')), 1)
+        # Shorter than a trigram: falls back to icontains
+        query = '{ allCustomers(emailIcontains: "@s") { edges { node { email } } } }'
+        self.assertEqual(self.names(query, 'email'), ["bob@sample.org"])
+
+
+class KeysetPaginationTests(TestCase):
+    QUERY = """
+    query Page($first: Int, $last: Int, $after: String, $before: String, $orderBy: String) {
+        allOrders(keyset: true, first: $first, last: $last, after: $after, before: $before, orderBy: $orderBy) {
+            edges { cursor node { id totalAmount } }
+            pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+        }
+    }
+    """
+
+    def setUp(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        # Duplicate amounts exercise the id tie-breaker
+        for amount in ['5.00', '7.00', '7.00', '3.00', '9.00', '7.00', '1.00']:
+            Order.objects.create(customer=customer, total_amount=Decimal(amount))
+        self.expected = list(
+            Order.objects.order_by('-total_amount', '-pk').values_list('pk', flat=True)
+        )
+
+    def page(self, **variables):
+        result = execute(self.QUERY, variables)
+        self.assertIsNone(result.errors)
+        return result.data['allOrders']
+
+    def test_walks_every_row_once_without_counting(self):
+        seen = []
+        after = None
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                page = self.page(first=2, after=after, orderBy="-totalAmount")
+            self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+            seen += [edge['node']['id'] for edge in page['edges']]
+            if not page['pageInfo']['hasNextPage']:
+                break
+            after = page['pageInfo']['endCursor']
+        ids = [int(from_global_id(node_id)[1]) for node_id in seen]
+        self.assertEqual(ids, self.expected)
+
+    def test_last_before_reads_backwards(self):
+        forward = self.page(first=5, orderBy="-totalAmount")
+        cursor = forward['edges'][4]['cursor']
+        page = self.page(last=2, before=cursor, orderBy="-totalAmount")
+        ids = [int(from_global_id(e['node']['id'])[1]) for e in page['edges']]
+        self.assertEqual(ids, self.expected[2:4])
+        self.assertTrue(page['pageInfo']['hasPreviousPage'])
+        self.assertFalse(page['pageInfo']['hasNextPage'])
+
+    def test_rejects_relation_sort_key(self):
+        result = execute(self.QUERY, {'first': 2, 'orderBy': 'customer'})
+        self.assertIn("Cannot order by 'customer'", str(result.errors[0]))
+
+    def test_order_by_is_limited_to_local_indexed_columns(self):
+        for keyset in ('true', 'false'):
+            result = execute(
+                '{ allOrders(keyset: %s, orderBy: "customer__name") { edges { node { id } } } }' % keyset
+            )
+            self.assertIn(
+                "Cannot order by 'customer__name'; orderBy must be one of id, orderDate, totalAmount",
+                str(result.errors[0]),
+            )
+
+    def test_primary_key_breaks_ties(self):
+        Order.objects.update(total_amount=Decimal('5.00'))
+        result = execute('{ allOrders(orderBy: "-totalAmount") { edges { node { id } } } }')
+        ids = [int(from_global_id(e['node']['id'])[1]) for e in result.data['allOrders']['edges']]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+
+class GraphQLViewCacheTests(TestCase):
+    QUERY = "query { hello }"
+
+    def setUp(self):
+        document_cache.clear()
+        cache.clear()
+
+    def post(self, payload):
+        response = self.client.post('/graphql', json.dumps(payload), content_type='application/json')
+        return response.json()
+
+    def apq(self, sha256_hash):
+        return {'persistedQuery': {'version': 1, 'sha256Hash': sha256_hash}}
+
+    def test_documents_are_parsed_once(self):
+        for _ in range(3):
+            body = self.post({'query': self.QUERY})
+            self.assertEqual(body['data'], {'hello': "Hello, GraphQL!"})
+        self.assertEqual(document_cache.stats()['misses'], 1)
+        self.assertEqual(document_cache.stats()['hits'], 2)
+
+    def test_validation_errors_are_cached_too(self):
+        for _ in range(2):
+            body = self.post({'query': "query { nope }"})
+            self.assertIn("Cannot query field 'nope'", body['errors'][0]['message'])
+        self.assertEqual(document_cache.stats()['hits'], 1)
+
+    def test_automatic_persisted_query_flow(self):
+        sha = hashlib.sha256(self.QUERY.encode()).hexdigest()
+        body = self.post({'extensions': self.apq(sha)})
+        self.assertEqual(body['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+
+        body = self.post({'query': self.QUERY, 'extensions': self.apq(sha)})
+        self.assertEqual(body['data'], {'hello': "Hello, GraphQL!"})
+
+        response = self.client.get('/graphql', {'extensions': json.dumps(self.apq(sha))},
+                                   HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['data'], {'hello': "Hello, GraphQL!"})
+
+    def test_hash_mismatch_is_rejected(self):
+        body = self.post({'query': self.QUERY, 'extensions': self.apq('0' * 64)})
+        self.assertEqual(body['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_HASH_MISMATCH')
+
+
+class ResponseCacheTests(TestCase):
+    PRODUCTS = "query { allProducts(stockLte: 5) { edges { node { name stock } } } }"
+
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        self.product = Product.objects.create(name="Laptop", price=Decimal('10.00'), stock=2)
+
+    def post(self, query):
+        response = self.client.post('/graphql', json.dumps({'query': query}), content_type='application/json')
+        return response.json()
+
+    def test_repeated_query_is_served_from_cache(self):
+        first = self.post(self.PRODUCTS)
+        with self.assertNumQueries(0):
+            second = self.post(self.PRODUCTS)
+        self.assertEqual(first, second)
+        self.assertEqual(response_cache.stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_model_signals_invalidate(self):
+        self.post(self.PRODUCTS)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 4
+            self.product.save()
+        body = self.post(self.PRODUCTS)
+        self.assertEqual(body['data']['allProducts']['edges'][0]['node']['stock'], 4)
+
+    def test_set_based_writes_invalidate(self):
+        self.post(self.PRODUCTS)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post("mutation { updateLowStockProducts { count } }")
+        body = self.post(self.PRODUCTS)
+        self.assertEqual(body['data']['allProducts']['edges'], [])
+
+    def test_nested_types_add_dependencies(self):
+        query = "query { allProducts(first: 10) { edges { node { orders(first: 10) { edges { node { id } } } } } } }"
+        self.post(query)
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer=customer)
+            order.products.set([self.product], through_defaults={'unit_price': self.product.price})
+        body = self.post(query)
+        self.assertEqual(len(body['data']['allProducts']['edges'][0]['node']['orders']['edges']), 1)
+
+    def test_unreachable_cache_is_a_miss(self):
+        backend = Mock(**{
+            'get_many.side_effect': ConnectionError("Connection refused"),
+            'get.side_effect': ConnectionError("Connection refused"),
+            'set.side_effect': ConnectionError("Connection refused"),
+        })
+        with patch('crm.cache.caches', {'default': backend}), self.assertLogs('crm.cache', 'WARNING'):
+            body = self.post(self.PRODUCTS)
+            self.assertEqual(body['data']['allProducts']['edges'][0]['node']['name'], "Laptop")
+            backend.get_many.side_effect = None
+            backend.get_many.return_value = {}
+            body = self.post(self.PRODUCTS)
+        self.assertEqual(body['data']['allProducts']['edges'][0]['node']['name'], "Laptop")
+        backend.set.assert_called_once()
+        self.assertEqual(response_cache.stats()['misses'], 1)
+
+    def test_failed_invalidation_does_not_fail_the_write(self):
+        backend = Mock(**{
+            'add.side_effect': ConnectionError("Connection refused"),
+            'get_many.return_value': {},
+            'get.return_value': None,
+        })
+        with patch('crm.cache.caches', {'default': backend}), \
+                self.assertLogs('django', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            body = self.post("mutation { updateLowStockProducts { count } }")
+        self.assertEqual(body['data']['updateLowStockProducts']['count'], 1)
+        self.assertEqual(Product.objects.get().stock, 12)
+
+    def test_project_settings_use_a_shared_cache(self):
+        for module in ('alx_backend_graphql.settings', 'crm.settings'):
+            with self.subTest(module=module):
+                config = import_module(module).CACHES['default']
+                self.assertNotIn(config['BACKEND'], PROCESS_LOCAL_BACKENDS)
+
+    def test_process_local_cache_is_refused(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['crm.E001', 'crm.E002'])
+        redis = {'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://cache:6379/1',
+        }}
+        with self.settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+        with self.settings(CRM_RESPONSE_CACHE={**settings.CRM_RESPONSE_CACHE, 'ENABLED': False}):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['crm.E002'])
+        budget = {**settings.GRAPHENE['QUERY_COST'], 'CLIENT_BUDGET': 1000}
+        with self.settings(GRAPHENE={**settings.GRAPHENE, 'QUERY_COST': budget}):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['crm.E001', 'crm.E002', 'crm.E003'])
+
+    def test_fields_not_opted_in_are_not_cached(self):
+        config = {**settings.CRM_RESPONSE_CACHE, 'FIELDS': {'hello': []}}
+        with self.settings(CRM_RESPONSE_CACHE=config):
+            self.post(self.PRODUCTS)
+            self.post(self.PRODUCTS)
+            self.post("query { hello }")
+            self.post("query { hello }")
+            self.assertEqual(response_cache.stats()['hits'], 1)
+
+
+# The cache configured in the project settings, which the test runner
+# replaces with a per-process one
+PROJECT_CACHES = import_module(os.environ['DJANGO_SETTINGS_MODULE']).CACHES
+
+
+def project_cache_available():
+    config = PROJECT_CACHES['default']
+    if config['BACKEND'] in PROCESS_LOCAL_BACKENDS:
+        return False
+    backend = import_string(config['BACKEND'])(config['LOCATION'], {'OPTIONS': {'socket_connect_timeout': 1}})
+    try:
+        backend.get('crm:ping')
+    except Exception:
+        return False
+    return True
+
+
+def run_in_new_process(code):
+    """Run ``code`` in a separate Python process with the same settings module."""
+    subprocess.run(
+        [sys.executable, '-c', "import django\ndjango.setup()\n" + textwrap.dedent(code)],
+        cwd=settings.BASE_DIR, check=True, capture_output=True, timeout=60,
+    )
+
+
+@skipUnless(project_cache_available(), "Needs the shared cache configured in CACHES")
+@override_settings(CACHES=PROJECT_CACHES)
+class SharedCacheTests(TestCase):
+    """What one process writes to the cache is seen by the others."""
+
+    def post(self, payload):
+        response = self.client.post('/graphql', json.dumps(payload), content_type='application/json')
+        return response.json()
+
+    def test_versions_are_bumped_across_processes(self):
+        product = Product.objects.create(name="Laptop", price=Decimal('10.00'), stock=2)
+        # A fresh alias, so no earlier run has cached this response
+        alias = f"products_{uuid.uuid4().hex}"
+        query = "query { %s: allProducts(stockLte: 5) { edges { node { stock } } } }" % alias
+        self.post({'query': query})
+        Product.objects.filter(pk=product.pk).update(stock=4)
+        run_in_new_process("""
+            from crm.cache import invalidate_models
+            invalidate_models('crm.Product')
+        """)
+        body = self.post({'query': query})
+        self.assertEqual(body['data'][alias]['edges'][0]['node']['stock'], 4)
+
+    def test_persisted_queries_are_shared_across_processes(self):
+        query = "query { hello_%s: hello }" % uuid.uuid4().hex
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': hashlib.sha256(query.encode()).hexdigest()}}
+        # Registered with another web worker
+        run_in_new_process("""
+            import json
+            from django.test import Client
+            response = Client().post(
+                '/graphql', json.dumps(%r), content_type='application/json', HTTP_HOST='localhost',
+            )
+            assert 'errors' not in response.json(), response.content
+        """ % {'query': query, 'extensions': extensions})
+        body = self.post({'extensions': extensions})
+        self.assertEqual(list(body['data'].values()), ["Hello, GraphQL!"])
+
+    def test_client_budget_is_shared_across_processes(self):
+        # One window for the whole test, and a client no earlier run charged
+        config = {
+            **settings.GRAPHENE['QUERY_COST'], 'CLIENT_BUDGET': 30, 'CLIENT_BUDGET_WINDOW': 10 ** 9,
+        }
+        client = f"ip:{uuid.uuid4().hex}"
+        # Spent with another web worker
+        run_in_new_process("""
+            from crm.cost import charge_client, cost_settings
+            charge_client(%r, 25, {**cost_settings(), 'CLIENT_BUDGET_WINDOW': 10 ** 9})
+        """ % client)
+        query = "query { allCustomers(first: 10) { edges { node { name } } } }"
+        with self.settings(GRAPHENE={**settings.GRAPHENE, 'QUERY_COST': config}), \
+                patch('crm.views.CRMGraphQLView.get_client_id', return_value=client):
+            body = self.post({'query': query})
+        self.assertEqual(body['errors'][0]['extensions']['code'], 'QUERY_COST_THROTTLED')
+
+
+class AsyncGraphQLViewTests(TransactionTestCase):
+    QUERY = """
+        query {
+            allCustomers(orderBy: "name") { edges { node { name } } }
+            allOrders { edges { node { totalAmount customer { name } } } }
+        }
+    """
+
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        create_orders(3)
+
+    async def post(self, query, path='/graphql/async'):
+        response = await self.async_client.post(
+            path, json.dumps({'query': query}), content_type='application/json'
+        )
+        return response.status_code, response.json()
+
+    async def test_matches_sync_view_and_resolves_root_fields_in_parallel(self):
+        # Each root field waits for the other: this only completes if both
+        # are in flight at the same time. (Counting worker threads is not
+        # enough: a pool thread that finished the first field may be reused
+        # for the second.)
+        barrier = threading.Barrier(2, timeout=5)
+        execute_field = ConcurrentRootExecutionContext.execute_field_in_thread
+
+        def wait_for_sibling(self, *args):
+            barrier.wait()
+            return execute_field(self, *args)
+
+        with patch.object(ConcurrentRootExecutionContext, 'execute_field_in_thread', wait_for_sibling):
+            status, body = await self.post(self.QUERY)
+        self.assertEqual(status, 200)
+        self.assertNotIn('errors', body)
+        self.assertEqual(len(body['data']['allOrders']['edges']), 3)
+
+        cache.clear()
+        self.assertEqual(body, (await self.post(self.QUERY, path='/graphql'))[1])
+
+    @override_settings(DEBUG=True)
+    async def test_trace_counts_sql_from_worker_threads(self):
+        response = await self.async_client.post(
+            '/graphql/async', json.dumps({'query': self.QUERY}),
+            content_type='application/json', headers={'X-CRM-Debug': '1'},
+        )
+        tracing = response.json()['extensions']['tracing']
+        fields = {entry['field'] for entry in tracing['resolvers']}
+        self.assertTrue({'Query.allCustomers', 'Query.allOrders'} <= fields)
+        # One page query per root field plus the batched customer lookup
+        self.assertGreaterEqual(tracing['sql']['count'], 3)
+
+    async def test_error_in_one_root_field_keeps_the_others(self):
+        status, body = await self.post("""
+            query {
+                allCustomers(orderBy: "-customer") { edges { node { name } } }
+                allProducts { edges { node { name } } }
+            }
+        """)
+        self.assertEqual(status, 200)
+        self.assertIsNone(body['data']['allCustomers'])
+        self.assertEqual(len(body['data']['allProducts']['edges']), 2)
+        self.assertEqual(body['errors'][0]['path'], ['allCustomers'])
+
+    async def test_mutations_use_the_sync_path(self):
+        status, body = await self.post("""
+            mutation { createCustomer(input: {name: "Zoe", email: "zoe@example.com"}) { customer { name } } }
+        """)
+        self.assertEqual(status, 200)
+        self.assertEqual(body['data']['createCustomer']['customer']['name'], 'Zoe')
+        self.assertTrue(await Customer.objects.filter(email='zoe@example.com').aexists())
+
+
+class QueryCostTests(TestCase):
+    NESTED = """
+        query {
+            allOrders {
+                edges { node { products { edges { node {
+                    orders { edges { node { totalAmount } } }
+                } } } } }
+            }
+        }
+    """
+
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+
+    def post(self, query, variables=None):
+        response = self.client.post(
+            '/graphql', json.dumps({'query': query, 'variables': variables}),
+            content_type='application/json',
+        )
+        return response.status_code, response.json()
+
+    def test_cost_is_reported_in_extensions(self):
+        create_orders(2)
+        status, body = self.post(
+            "query ($n: Int) { allOrders(first: $n) { edges { node { totalAmount customer { name } } } } }",
+            {'n': 10},
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(len(body['data']['allOrders']['edges']), 2)
+        # allOrders + 10 * (edges + node + customer)
+        self.assertEqual(body['extensions']['cost']['requestedQueryCost'], 31)
+        self.assertEqual(body['extensions']['cost']['depth'], 3)
+
+    def test_expensive_query_is_rejected_before_execution(self):
+        with self.assertNumQueries(0):
+            status, body = self.post(self.NESTED)
+        self.assertEqual(status, 400)
+        self.assertEqual(body['errors'][0]['extensions']['code'], 'QUERY_TOO_COMPLEX')
+        self.assertGreater(body['extensions']['cost']['requestedQueryCost'], 5000)
+
+    def test_page_sizes_bring_the_cost_down(self):
+        status, body = self.post(self.NESTED.replace('allOrders', 'allOrders(first: 5)')
+                                 .replace('products', 'products(first: 5)')
+                                 .replace('orders {', 'orders(first: 5) {'))
+        self.assertEqual(status, 200)
+        self.assertNotIn('errors', body)
+
+    async def test_async_view_checks_the_cost(self):
+        response = await self.async_client.post(
+            '/graphql/async', json.dumps({'query': "query { hello }"}), content_type='application/json',
+        )
+        body = response.json()
+        self.assertNotIn('errors', body)
+        self.assertEqual(body['extensions']['cost']['requestedQueryCost'], 0)
+
+    def test_depth_limit(self):
+        config = {**settings.GRAPHENE['QUERY_COST'], 'MAX_DEPTH': 2}
+        with self.settings(GRAPHENE={**settings.GRAPHENE, 'QUERY_COST': config}):
+            status, body = self.post(
+                "query { allOrders(first: 1) { edges { node { customer { name } } } } }"
+            )
+        self.assertEqual(status, 400)
+        self.assertEqual(body['errors'][0]['extensions']['code'], 'QUERY_TOO_DEEP')
+
+    def test_client_budget_throttles(self):
+        config = {**settings.GRAPHENE['QUERY_COST'], 'CLIENT_BUDGET': 30}
+        query = "query { allCustomers(first: 10) { edges { node { name } } } }"
+        with self.settings(GRAPHENE={**settings.GRAPHENE, 'QUERY_COST': config}), \
+                patch('crm.cost.time.time', return_value=1_000_000):
+            status, body = self.post(query)
+            self.assertEqual(status, 200)
+            self.assertEqual(body['extensions']['cost']['budgetRemaining'], 9)
+            status, body = self.post(query)
+        self.assertEqual(body['errors'][0]['extensions']['code'], 'QUERY_COST_THROTTLED')
+
+
+class InstrumentationTests(TestCase):
+    QUERY = "query { allOrders(first: 10) { edges { node { totalAmount customer { name } } } } }"
+
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        metrics.clear()
+        create_orders(3)
+
+    def post(self, query, **headers):
+        response = self.client.post(
+            '/graphql', json.dumps({'query': query}), content_type='application/json', headers=headers
+        )
+        return response.json()
+
+    @override_settings(DEBUG=True)
+    def test_debug_header_returns_the_trace(self):
+        with CaptureQueriesContext(connection) as queries:
+            body = self.post(self.QUERY, **{'X-CRM-Debug': '1'})
+        tracing = body['extensions']['tracing']
+        self.assertEqual(tracing['sql']['count'], len(queries))
+        self.assertEqual(len(tracing['sql']['queries']), len(queries))
+        fields = {entry['field'] for entry in tracing['resolvers']}
+        self.assertIn('Query.allOrders', fields)
+        self.assertIn('OrderType.customer', fields)
+        self.assertEqual(tracing['resolvers'][0]['path'], ['allOrders'])
+
+    def test_debug_header_needs_debug_or_token(self):
+        body = self.post(self.QUERY, **{'X-CRM-Debug': '1'})
+        self.assertNotIn('tracing', body.get('extensions', {}))
+
+        config = {**settings.CRM_GRAPHQL_METRICS, 'DEBUG_TOKEN': 's3cret'}
+        with self.settings(CRM_GRAPHQL_METRICS=config):
+            body = self.post(self.QUERY, **{'X-CRM-Debug': 's3cret'})
+        self.assertIn('tracing', body['extensions'])
+
+    def test_metrics_endpoint(self):
+        self.post(self.QUERY)
+        self.post(self.QUERY)
+        self.post("query { allOrders(first: 1) { edges { node { bogus } } } }")
+        self.assertEqual(metrics.get('crm_graphql_request_duration_seconds').count, 3)
+
+        config = {**settings.CRM_GRAPHQL_METRICS, 'METRICS_TOKEN': 's3cret'}
+        with self.settings(CRM_GRAPHQL_METRICS=config):
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE crm_graphql_request_duration_seconds summary', body)
+        self.assertIn('crm_graphql_request_duration_seconds_count 3', body)
+        # The repeated query was answered from the response cache
+        self.assertIn('crm_graphql_resolver_duration_seconds_count{field="Query.allOrders"} 1', body)
+        self.assertIn('crm_graphql_response_cache_hits_total 1', body)
+        self.assertIn('crm_graphql_sql_queries{quantile="0.5"}', body)
+        self.assertIn('crm_graphql_errors_total 1', body)
+
+    def test_metrics_endpoint_needs_token_staff_or_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        config = {**settings.CRM_GRAPHQL_METRICS, 'METRICS_TOKEN': 's3cret'}
+        with self.settings(CRM_GRAPHQL_METRICS=config):
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 403)
+
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+        user = User.objects.create_user('ops', password='x')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.products = create_orders(3)
+        self.lonely = Order.objects.create(
+            customer=Customer.objects.create(name="Nobody", email="nobody@example.com"),
+            total_amount=Decimal('0.00'),
+        )
+        self.client.force_login(User.objects.create_user('ops', password='x', is_staff=True))
+
+    def stream(self, response):
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        response = self.client.get('/exports/orders')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.stream(response).splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]['customer']['name'], 'Customer 0')
+        self.assertEqual(rows[0]['total_amount'], '20.00')
+        self.assertEqual([i['product_name'] for i in rows[0]['items']], ['Product 0', 'Product 1'])
+        self.assertEqual(rows[0]['items'][0]['quantity'], 1)
+        self.assertEqual(rows[3]['items'], [])
+
+    def test_csv_export_has_a_row_per_item(self):
+        response = self.client.get('/exports/orders', {'format': 'csv'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.csv"')
+        rows = list(csv.DictReader(StringIO(self.stream(response))))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual((rows[0]['quantity'], rows[0]['unit_price']), ('1', '10.00'))
+        self.assertEqual(rows[-1]['customer_email'], 'nobody@example.com')
+        self.assertEqual(rows[-1]['product_id'], '')
+
+    def test_order_filter_arguments(self):
+        response = self.client.get('/exports/orders', {'total_amount_gte': '10', 'product_id': self.products[0].pk})
+        self.assertEqual(len(self.stream(response).splitlines()), 3)
+
+        response = self.client.get('/exports/orders', {'total_amount_gte': 'lots'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('total_amount_gte', response.json()['errors'])
+
+    def test_queries_are_chunked(self):
+        with CaptureQueriesContext(connection) as queries:
+            lines = list(stream_orders(export_queryset({}), NDJSONRenderer(), chunk_size=2))
+        self.assertEqual(len(lines), 5)
+        # Per chunk of two orders: the orders page and the items prefetch
+        self.assertEqual(len([q for q in queries if 'crm_orderitem' in q['sql']]), 2)
+
+    def test_needs_token_staff_or_debug(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/exports/orders').status_code, 403)
+        with self.settings(CRM_EXPORT_TOKEN='s3cret'):
+            response = self.client.get('/exports/orders', headers={'Authorization': 'Bearer wrong'})
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get('/exports/orders', headers={'Authorization': 'Bearer s3cret'})
+            self.assertEqual(response.status_code, 200)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/exports/orders').status_code, 200)
+
+    @override_settings(CRM_EXPORT_TOKEN='s3cret')
+    async def test_asgi_streams_asynchronously(self):
+        response = await self.async_client.get('/exports/orders', headers={'Authorization': 'Bearer s3cret'})
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body.decode().splitlines()), 4)
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command('export_orders', '--format', 'csv', '--total-amount-gte', '10', stdout=out)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 6)
+
+
+class GraphQLClientTests(TestCase):
+    def test_local_execution(self):
+        create_orders(2)
+        data = graphql_client.execute_graphql("query { hello crmStats { orderCount revenue } }")
+        self.assertEqual(data['crmStats']['orderCount'], 2)
+        self.assertEqual(Decimal(data['crmStats']['revenue']), Decimal('40'))
+
+    def test_errors_are_raised(self):
+        with self.assertRaises(graphql_client.GraphQLClientError) as ctx:
+            graphql_client.execute_graphql("query { bogus }")
+        self.assertIn("bogus", str(ctx.exception))
+        with self.assertRaises(graphql_client.GraphQLClientError):
+            graphql_client.execute_graphql("query {")
+
+    def test_local_mutation(self):
+        Product.objects.create(name="Low", price=Decimal('5.50'), stock=2)
+        data = graphql_client.execute_graphql("mutation { updateLowStockProducts { count } }")
+        self.assertEqual(data['updateLowStockProducts']['count'], 1)
+
+    def test_http_mode_uses_the_shared_session(self):
+        self.assertIs(graphql_client.get_session(), graphql_client.get_session())
+        session = Mock()
+        session.post.return_value.json.return_value = {'data': {'hello': 'Hello, GraphQL!'}}
+        config = {'MODE': 'http', 'URL': 'http://crm.internal/graphql'}
+        with override_settings(CRM_GRAPHQL_CLIENT=config), \
+                patch.object(graphql_client, 'get_session', return_value=session):
+            self.assertEqual(graphql_client.execute_graphql("{ hello }"), {'hello': 'Hello, GraphQL!'})
+            session.post.return_value.json.return_value = {'errors': [{'message': 'Boom'}]}
+            with self.assertRaisesMessage(graphql_client.GraphQLClientError, 'Boom'):
+                graphql_client.execute_graphql("{ hello }")
+        self.assertEqual(session.post.call_args.args, ('http://crm.internal/graphql',))
+        self.assertEqual(session.post.call_args.kwargs['json'], {'query': "{ hello }", 'variables': {}})
+
+    def test_report_task_runs_in_process(self):
+        from crm.tasks import generate_crm_report
+
+        directory = temporary_job_logs(self)
+        create_orders(1)
+        message = generate_crm_report()
+        self.assertEqual(message, "CRM report generated successfully: 1 customers, 1 orders, $20.00 revenue")
+        [record] = read_job_log(directory, 'crm_report')
+        self.assertEqual((record['customers'], record['orders'], record['revenue']), (1, 1, 20.0))
+
+
+class CustomerCleanupTests(TestCase):
+    def setUp(self):
+        temporary_job_logs(self)
+        create_orders(2)
+        for i in range(5):
+            Customer.objects.create(name=f"Idle {i}", email=f"idle{i}@example.com")
+        Customer.objects.create(name="New", email="new@example.com")
+        # Everyone but "New" signed up two years ago
+        Customer.objects.exclude(name="New").update(created_at=timezone.now() - timedelta(days=730))
+
+    def test_deletes_old_customers_without_orders_in_batches(self):
+        with CaptureQueriesContext(connection) as ctx:
+            result = cleanup.delete_inactive_customers(batch_size=2, sleep=0)
+        self.assertEqual(result, cleanup.CleanupResult(5, 3, complete=True, resumed=False))
+        self.assertEqual(
+            sorted(Customer.objects.values_list('name', flat=True)),
+            ["Customer 0", "Customer 1", "New"],
+        )
+        # One DELETE per batch, without the collector's per-row lookups
+        deletes = [q['sql'] for q in ctx if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 3)
+        self.assertFalse([q for q in ctx if q['sql'].startswith('SELECT "crm_order"')])
+        self.assertEqual(JobCheckpoint.objects.get(name=cleanup.CHECKPOINT).state, {})
+
+    def test_interrupted_run_resumes(self):
+        first = cleanup.delete_inactive_customers(batch_size=2, sleep=0, max_batches=1)
+        self.assertEqual((first.deleted, first.complete), (2, False))
+        state = JobCheckpoint.objects.get(name=cleanup.CHECKPOINT).state
+        self.assertEqual(state['deleted'], 2)
+
+        # The resumed run keeps the first run's cutoff
+        with patch.object(cleanup.timezone, 'now', return_value=timezone.now() + timedelta(days=730)):
+            second = cleanup.delete_inactive_customers(batch_size=2, sleep=0)
+        self.assertEqual((second.deleted, second.complete, second.resumed), (3, True, True))
+        self.assertTrue(Customer.objects.filter(name="New").exists())
+
+    def test_collector_is_used_when_other_relations_exist(self):
+        with patch.object(cleanup, 'can_raw_delete', return_value=False):
+            result = cleanup.delete_inactive_customers(sleep=0)
+        self.assertEqual(result.deleted, 5)
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command('clean_inactive_customers', '--batch-size', '10', '--sleep', '0', stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Deleted 5 inactive customers in 1 batches")
+
+    def test_out_of_date_order_count_keeps_the_customer(self):
+        Customer.objects.filter(name="Customer 0").update(order_count=0)
+        result = cleanup.delete_inactive_customers(sleep=0)
+        self.assertEqual(result.deleted, 5)
+        self.assertTrue(Order.objects.filter(customer__name="Customer 0").exists())
+
+
+def settle_orders():
+    """Move every order out of the reminders' grace window."""
+    Order.objects.update(order_date=timezone.now() - timedelta(minutes=5))
+
+
+class OrderReminderTests(TestCase):
+    def setUp(self):
+        create_orders(3)
+        settle_orders()
+        self.sent = []
+
+    def run_reminders(self, **kwargs):
+        return reminders.send_order_reminders(self.sent.append, **kwargs)
+
+    def test_first_run_covers_the_lookback_window(self):
+        Order.objects.filter(customer__name="Customer 0").update(order_date=timezone.now() - timedelta(days=30))
+        result = self.run_reminders()
+        self.assertEqual([order.customer.name for order in self.sent], ["Customer 1", "Customer 2"])
+        self.assertEqual(result.high_water_mark, Order.objects.order_by('pk').last().pk)
+
+    def test_later_runs_only_see_new_orders(self):
+        self.run_reminders()
+        self.sent.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.run_reminders().sent, 0)
+        # Checkpoint lookup, last settled order and one empty page of new orders
+        self.assertEqual(len(ctx), 3)
+
+        customer = Customer.objects.get(name="Customer 0")
+        Order.objects.create(customer=customer, total_amount=Decimal('5.00'))
+        settle_orders()
+        self.assertEqual(self.run_reminders().sent, 1)
+        self.assertEqual(OrderReminder.objects.count(), 4)
+
+    def test_recent_orders_wait_for_the_grace_window(self):
+        mark = self.run_reminders().high_water_mark
+        customer = Customer.objects.get(name="Customer 0")
+        for _ in range(2):
+            Order.objects.create(customer=customer, total_amount=Decimal('5.00'))
+        # Orders with lower ids may still be committing
+        result = self.run_reminders()
+        self.assertEqual((result.sent, result.high_water_mark), (0, mark))
+
+        settle_orders()
+        self.assertEqual(self.run_reminders().sent, 2)
+
+    def test_batches_and_idempotence(self):
+        # A reminder recorded by an overlapping run is not sent again
+        OrderReminder.objects.create(order=Order.objects.order_by('pk')[1])
+        result = self.run_reminders(batch_size=2, max_batches=1)
+        self.assertEqual((result.sent, result.batches), (1, 1))
+        result = self.run_reminders(batch_size=2)
+        self.assertEqual((result.sent, result.batches), (1, 1))
+        self.assertEqual(len({order.pk for order in self.sent}), 2)
+
+    def test_only_claimed_orders_are_sent(self):
+        first, second, third = Order.objects.order_by('pk')
+        OrderReminder.objects.create(order=second)
+        with transaction.atomic():
+            self.assertEqual(reminders.claim_reminders([first.pk, second.pk]), {first.pk})
+            self.assertEqual(reminders.claim_reminders([first.pk, third.pk]), {third.pk})
+        self.assertEqual(reminders.remind_batch([first, second, third], self.sent.append), 0)
+        self.assertEqual(self.sent, [])
+
+    def test_claims_without_insert_returning(self):
+        first, second, third = Order.objects.order_by('pk')
+        OrderReminder.objects.create(order=second)
+        with patch.object(reminders, 'supports_insert_returning', return_value=False), transaction.atomic():
+            self.assertEqual(reminders.claim_reminders([first.pk, second.pk]), {first.pk})
+            self.assertEqual(reminders.claim_reminders([first.pk, third.pk]), {third.pk})
+        self.assertEqual(OrderReminder.objects.count(), 3)
+
+    def test_failed_batch_is_retried(self):
+        def fail(order):
+            raise RuntimeError("mail server down")
+
+        with self.assertRaises(RuntimeError):
+            reminders.send_order_reminders(fail)
+        self.assertFalse(OrderReminder.objects.exists())
+        self.assertEqual(self.run_reminders().sent, 3)
+
+    def test_log_order_reminders(self):
+        directory = temporary_job_logs(self)
+        result = reminders.log_order_reminders()
+        self.assertEqual(result.sent, 3)
+        records = read_job_log(directory, 'order_reminders')
+        self.assertIn("Customer: Customer 0 (c0@example.com)", records[0]['message'])
+        self.assertEqual(records[0]['customer_email'], 'c0@example.com')
+        self.assertEqual(records[-1]['message'], "Processed 3 new orders")
+
+
+class PartitionedTaskTests(TestCase):
+    def setUp(self):
+        # Run subtasks and chord callbacks inline, without Redis
+        previous = {key: celery_app.conf[key] for key in (
+            'task_always_eager', 'task_eager_propagates', 'broker_url', 'result_backend',
+        )}
+        celery_app.conf.update(
+            task_always_eager=True, task_eager_propagates=True,
+            broker_url='memory://', result_backend='cache+memory://',
+        )
+        self.addCleanup(celery_app.conf.update, previous)
+        create_orders(5)
+        settle_orders()
+        self.ids = list(Order.objects.order_by('pk').values_list('pk', flat=True))
+
+    def run_task(self, task, **kwargs):
+        directory = temporary_job_logs(self)
+        message = task.delay(**kwargs).get()
+        log = ''.join(
+            record['message'] + '\n' for name in os.listdir(directory)
+            for record in read_job_log(directory, name[:-len('_log.txt')])
+        )
+        return message, log
+
+    def test_id_partitions(self):
+        first = self.ids[0] - 1
+        self.assertEqual(
+            id_partitions(Order.objects.all(), 2),
+            [(first, first + 2), (first + 2, first + 4), (first + 4, first + 5)],
+        )
+        self.assertEqual(id_partitions(Order.objects.all(), 10, after_id=self.ids[-1]), [])
+
+    def test_report_merges_partitions(self):
+        message, log = self.run_task(tasks.generate_crm_report_parallel, partition_size=2)
+        self.assertEqual(message, "CRM report dispatched over 3 partitions")
+        self.assertIn("Report: 5 customers, 5 orders, $100.00 revenue", log)
+
+    def test_reminders_fan_out_and_move_the_mark(self):
+        message, log = self.run_task(tasks.send_order_reminders_parallel, partition_size=2)
+        self.assertEqual(message, "Order reminders dispatched over 3 partitions")
+        self.assertEqual(log.count("Order ID:"), 5)
+        self.assertIn("Processed 5 new orders", log)
+        self.assertEqual(reminders.get_high_water_mark(7), self.ids[-1])
+
+        message, log = self.run_task(tasks.send_order_reminders_parallel, partition_size=2)
+        self.assertEqual(message, "Order reminders dispatched over 0 partitions")
+        self.assertIn("No new orders found", log)
+
+    def test_reminders_leave_recent_orders_for_the_next_run(self):
+        self.run_task(tasks.send_order_reminders_parallel, partition_size=2)
+        customer = Customer.objects.get(name="Customer 0")
+        for _ in range(2):
+            Order.objects.create(customer=customer, total_amount=Decimal('5.00'))
+        message, log = self.run_task(tasks.send_order_reminders_parallel, partition_size=2)
+        self.assertEqual(message, "Order reminders dispatched over 0 partitions")
+        self.assertEqual(reminders.get_high_water_mark(7), self.ids[-1])
+
+        settle_orders()
+        message, log = self.run_task(tasks.send_order_reminders_parallel, partition_size=2)
+        self.assertIn("Processed 2 new orders", log)
+
+    def test_failed_partition_keeps_the_mark(self):
+        mark = reminders.get_high_water_mark(7)
+        remind_range = reminders.remind_range
+
+        def flaky(send, after_id, up_to_id, batch_size=None):
+            if after_id > mark:
+                raise RuntimeError("mail server down")
+            return remind_range(send, after_id, up_to_id, batch_size)
+
+        with patch.object(reminders, 'remind_range', flaky), self.assertRaises(RuntimeError):
+            self.run_task(tasks.send_order_reminders_parallel, partition_size=2)
+        self.assertEqual(reminders.get_high_water_mark(7), mark)
+        self.assertEqual(OrderReminder.objects.count(), 2)
+
+        message, log = self.run_task(tasks.send_order_reminders_parallel, partition_size=2)
+        self.assertIn("Processed 3 new orders", log)
+
+
+class JobLogTests(TestCase):
+    def setUp(self):
+        self.directory = temporary_job_logs(self)
+        self.path = os.path.join(self.directory, 'test_job_log.txt')
+
+    def test_records_are_written_once_when_the_job_ends(self):
+        with patch('crm.joblog.RotatingFile.write', autospec=True) as write:
+            with job_log('test_job') as log:
+                log.info("Started")
+                log.error("Something failed", order_id=3)
+                write.assert_not_called()
+        write.assert_called_once()
+        records = [json.loads(line) for line in write.call_args.args[1].splitlines()]
+        self.assertEqual([record['level'] for record in records], ['info', 'error'])
+        self.assertEqual(records[1]['order_id'], 3)
+        self.assertEqual(records[1]['job'], 'test_job')
+
+    def test_unhandled_errors_are_logged(self):
+        with self.assertRaises(RuntimeError), job_log('test_job'):
+            raise RuntimeError("boom")
+        [record] = read_job_log(self.directory, 'test_job')
+        self.assertEqual(record['message'], "Unhandled error: boom")
+
+    def test_size_rotation(self):
+        target = RotatingFile(self.path, max_bytes=10, backup_count=2)
+        for text in ('first\n', 'second\n', 'third\n', 'fourth\n'):
+            target.write(text)
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'fourth\n')
+        with open(self.path + '.1') as f:
+            self.assertEqual(f.read(), 'third\n')
+        with open(self.path + '.2') as f:
+            self.assertEqual(f.read(), 'second\n')
+        self.assertFalse(os.path.exists(self.path + '.3'))
+
+    def test_daily_rotation(self):
+        target = RotatingFile(self.path, backup_count=1, when='daily')
+        target.write('yesterday\n')
+        target.write('today\n')
+        self.assertFalse(os.path.exists(self.path + '.1'))
+        day_ago = time.time() - 86400
+        os.utime(self.path, (day_ago, day_ago))
+        target.write('today\n')
+        with open(self.path + '.1') as f:
+            self.assertEqual(f.read(), 'yesterday\ntoday\n')
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'today\n')
+
+    def test_background_writes(self):
+        config = {**JobLog('test_job').config, 'BACKGROUND': True}
+        log = JobLog('test_job', config)
+        log.info("From the background")
+        log.flush()
+        background_writer.stop()
+        [record] = read_job_log(self.directory, 'test_job')
+        self.assertEqual(record['message'], "From the background")
+
+
+class HealthCheckTests(TransactionTestCase):
+    def setUp(self):
+        previous = celery_app.conf.broker_url
+        celery_app.conf.broker_url = 'memory://'
+        self.addCleanup(setattr, celery_app.conf, 'broker_url', previous)
+        self.django_app = Mock(return_value=[b'django'])
+        self.app = health.HealthCheckWSGIApp(self.django_app)
+
+    def get(self, path):
+        start_response = Mock()
+        body = b''.join(self.app({'PATH_INFO': path, 'REQUEST_METHOD': 'GET'}, start_response))
+        return start_response.call_args.args[0] if start_response.called else None, body
+
+    def test_probes_bypass_django(self):
+        self.assertEqual(self.get('/healthz'), ('200 OK', b'{"status": "ok"}'))
+        status, body = self.get('/readyz')
+        self.assertEqual(status, '200 OK')
+        checks = json.loads(body)['checks']
+        self.assertEqual(list(checks), ['database', 'cache', 'broker'])
+        self.assertTrue(all(check['ok'] and check['latency_ms'] >= 0 for check in checks.values()))
+        self.django_app.assert_not_called()
+        self.assertEqual(self.get('/graphql'), (None, b'django'))
+
+    def test_unreachable_dependency(self):
+        def broker_down(config):
+            raise ConnectionRefusedError("Connection refused")
+
+        with patch.dict(health.CHECKS, broker=broker_down):
+            status, body = self.get('/readyz')
+        self.assertEqual(status, '503 Service Unavailable')
+        body = json.loads(body)
+        self.assertEqual(body['status'], 'unavailable')
+        self.assertEqual(body['checks']['broker']['error'], "Connection refused")
+        self.assertTrue(body['checks']['database']['ok'])
+
+    async def test_asgi_probe(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        app = health.HealthCheckASGIApp(Mock())
+        await app({'type': 'http', 'path': '/healthz'}, None, send)
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(sent[1]['body'], b'{"status": "ok"}')
+
+    def heartbeat(self, response=None, error=None):
+        """Run log_crm_heartbeat against a web server answering ``response``."""
+        directory = temporary_job_logs(self)
+        session = Mock()
+        session.get.return_value = response
+        session.get.side_effect = error
+        with patch('crm.graphql_client.get_session', return_value=session):
+            cron.log_crm_heartbeat()
+        [record] = read_job_log(directory, 'crm_heartbeat')
+        return session, record
+
+    def test_heartbeat_probes_the_web_server(self):
+        status, body = self.get('/readyz')
+        response = Mock(status_code=int(status[:3]))
+        response.json.return_value = json.loads(body)
+        session, record = self.heartbeat(response)
+        session.get.assert_called_once_with('http://localhost:8000/readyz', timeout=2)
+        self.assertEqual(record['message'], "CRM is alive")
+        self.assertGreaterEqual(record['latency_ms'], 0)
+        self.assertIn('latency_ms', record['checks']['database'])
+
+    def test_heartbeat_reports_an_unreachable_web_server(self):
+        session, record = self.heartbeat(error=requests.ConnectionError("Connection refused"))
+        self.assertEqual(record['level'], 'error')
+        self.assertEqual(record['message'], "Readiness probe error: Connection refused")
+
+    def test_heartbeat_reports_an_unready_web_server(self):
+        response = Mock(status_code=503)
+        response.json.return_value = {'status': 'unavailable', 'checks': {'broker': {'ok': False}}}
+        session, record = self.heartbeat(response)
+        self.assertEqual(record['level'], 'error')
+        self.assertEqual(record['message'], "CRM is alive but not ready: broker")
+
+    def test_local_heartbeat(self):
+        directory = temporary_job_logs(self)
+        with self.settings(CRM_HEALTH={**settings.CRM_HEALTH, 'MODE': 'local'}):
+            cron.log_crm_heartbeat()
+        [record] = read_job_log(directory, 'crm_heartbeat')
+        self.assertEqual(record['message'], "CRM is alive")
+        self.assertIn('latency_ms', record['checks']['database'])
+
+
+class CustomerTotalsTests(TestCase):
+    CREATE_ORDER = """
+    mutation Create($customerId: ID!) {
+        createOrder(input: {customerId: $customerId, items: [{productId: "%s", quantity: 2}]}) {
+            order { customer { orderCount lifetimeValue lastOrderAt } }
+            message
+        }
+    }
+    """
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.product = Product.objects.create(name="Widget", price=Decimal('12.50'), stock=100)
+
+    def create_order(self):
+        result = execute(self.CREATE_ORDER % self.product.pk, {'customerId': str(self.customer.pk)})
+        self.assertIsNone(result.errors)
+        return result.data['createOrder']['order']['customer']
+
+    def test_create_order_updates_totals(self):
+        self.create_order()
+        customer = self.create_order()
+        self.assertEqual(customer['orderCount'], 2)
+        self.assertEqual(Decimal(customer['lifetimeValue']), Decimal('50.00'))
+        last_order = Order.objects.latest('order_date')
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.last_order_at, last_order.order_date)
+
+        # An older order does not move last_order_at back
+        older = Order(
+            customer=self.customer, total_amount=Decimal('1.00'),
+            order_date=timezone.now() - timedelta(days=3),
+        )
+        customer_totals.record_customer_orders([older])
+        self.assertEqual(
+            (older.customer.order_count, older.customer.last_order_at),
+            (3, last_order.order_date),
+        )
+
+    def test_bulk_create_orders_updates_totals(self):
+        other = Customer.objects.create(name="Bob", email="bob@example.com")
+        items = f'items: [{{productId: "{self.product.pk}", quantity: 1}}]'
+        result = execute(f"""
+        mutation {{
+            bulkCreateOrders(input: [
+                {{customerId: "{self.customer.pk}", {items}}},
+                {{customerId: "{self.customer.pk}", {items}}},
+                {{customerId: "{other.pk}", {items}}}
+            ]) {{ count }}
+        }}
+        """)
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            list(Customer.objects.order_by('pk').values_list('order_count', 'lifetime_value')),
+            [(2, Decimal('25.00')), (1, Decimal('12.50'))],
+        )
+
+    def test_reconcile_fixes_drift(self):
+        self.create_order()
+        Order.objects.all().delete()
+        self.assertEqual(customer_totals.reconcile(), customer_totals.ReconcileResult(1, 1))
+        self.customer.refresh_from_db()
+        self.assertEqual(
+            (self.customer.order_count, self.customer.lifetime_value, self.customer.last_order_at),
+            (0, Decimal('0'), None),
+        )
+        out = StringIO()
+        temporary_job_logs(self)
+        call_command('reconcile_customer_totals', stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Checked 1 customers, fixed 0")
+
+    def test_filter_and_keyset_sort_by_last_order(self):
+        Customer.objects.create(name="Never", email="never@example.com")
+        self.create_order()
+        recent = Customer.objects.create(name="Recent", email="recent@example.com")
+        Customer.objects.filter(pk=recent.pk).update(order_count=1, last_order_at=timezone.now() + timedelta(hours=1))
+
+        query = """
+        query Page($after: String, $orderBy: String) {
+            allCustomers(keyset: true, first: 1, after: $after, orderBy: $orderBy, orderCountGte: %s) {
+                edges { node { name } }
+                pageInfo { hasNextPage endCursor }
+            }
+        }
+        """
+        for order_by, min_orders, expected in [
+            ('lastOrderAt', 0, ["Never", "Alice", "Recent"]),
+            ('-lastOrderAt', 0, ["Recent", "Alice", "Never"]),
+            ('-lastOrderAt', 1, ["Recent", "Alice"]),
+        ]:
+            names, after = [], None
+            while True:
+                result = execute(query % min_orders, {'after': after, 'orderBy': order_by})
+                self.assertIsNone(result.errors)
+                page = result.data['allCustomers']
+                names += [edge['node']['name'] for edge in page['edges']]
+                if not page['pageInfo']['hasNextPage']:
+                    break
+                after = page['pageInfo']['endCursor']
+            self.assertEqual(names, expected, order_by)
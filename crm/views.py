@@ -1,3 +1,433 @@
-from django.shortcuts import render
+"""
+GraphQL endpoint for the CRM.
 
-# Create your views here.
+CRMGraphQLView extends graphene-django's GraphQLView with:
+
+* an LRU cache of parsed and validated documents keyed by the SHA-256 of the
+  query text, so repeated queries skip parse/validate entirely;
+* automatic persisted queries (Apollo APQ, version 1): a client may send only
+  ``extensions.persistedQuery.sha256Hash`` once the full query has been
+  registered with a previous request;
+* a response cache for opted-in read-only queries (see ``crm.cache``);
+* query cost and depth limits checked before execution, with the estimate
+  reported under ``extensions.cost`` (see ``crm.cost``).
+
+AsyncCRMGraphQLView is the ASGI variant, which resolves the root fields of
+a query concurrently. Both are instrumented by ``crm.instrumentation``,
+whose metrics ``metrics_view`` serves to Prometheus.
+"""
+
+import hashlib
+import json
+from collections import namedtuple
+from inspect import isawaitable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import GraphQLError, OperationType, execute, get_operation_ast, parse, validate
+from graphql.execution import ExecutionResult
+from graphql.type import validate_schema
+
+from .cache import LRUCache, response_cache
+from .cost import check_query_cost
+from .execution import ConcurrentRootExecutionContext
+from .exports import astream_orders, export_queryset, get_renderer, stream_orders
+from .instrumentation import finish_trace, metrics, metrics_settings, tracing
+
+PERSISTED_QUERY_PREFIX = 'crm:apq:'
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+# A request that passed validation and cost checks and still has to run
+PreparedRequest = namedtuple('PreparedRequest', 'document operation_ast cache_key extensions')
+
+document_cache = LRUCache(getattr(settings, 'CRM_GRAPHQL_DOCUMENT_CACHE_SIZE', 512))
+
+
+def get_persisted_query_hash(request, data):
+    """Return the APQ sha256Hash sent with the request, if any."""
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+    persisted_query = (extensions or {}).get('persistedQuery') or {}
+    if persisted_query.get('version') != 1:
+        return None
+    return persisted_query.get('sha256Hash')
+
+
+class CRMGraphQLView(GraphQLView):
+    document_cache = document_cache
+    response_cache = response_cache
+
+    def resolve_persisted_query(self, request, data, query):
+        """
+        Return the query text to execute, registering or looking up the
+        persisted query, or raise GraphQLError if it cannot be resolved.
+        """
+        sha256_hash = get_persisted_query_hash(request, data)
+        if not sha256_hash:
+            return query
+        key = PERSISTED_QUERY_PREFIX + sha256_hash
+        if query:
+            if query_hash(query) != sha256_hash:
+                raise GraphQLError(
+                    "provided sha does not match query",
+                    extensions={'code': 'PERSISTED_QUERY_HASH_MISMATCH'},
+                )
+            cache.set(key, query, timeout=getattr(settings, 'CRM_PERSISTED_QUERY_TIMEOUT', None))
+            return query
+        query = cache.get(key)
+        if query is None:
+            raise GraphQLError(
+                "PersistedQueryNotFound",
+                extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'},
+            )
+        return query
+
+    def get_document(self, schema, query):
+        """Parse and validate ``query``, reusing the cached result when possible."""
+        key = query_hash(query)
+        entry = self.document_cache.get(key)
+        if entry is None:
+            document = parse(query)
+            validation_errors = validate(
+                schema,
+                document,
+                self.validation_rules,
+                graphene_settings.MAX_VALIDATION_ERRORS,
+            )
+            entry = (document, validation_errors)
+            self.document_cache.set(key, entry)
+        return entry
+
+    def get_client_id(self, request):
+        """Identify the client charged for query cost budgets."""
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f"user:{user.pk}"
+        return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+    def prepare_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        """
+        Resolve, parse, validate and cost the request and look it up in the
+        response cache. Returns ``(result, prepared)``; when ``prepared`` is
+        None there is nothing to execute and ``result`` is the answer (an
+        error, a cached response, or None for GraphiQL).
+        """
+        try:
+            query = self.resolve_persisted_query(request, data, query)
+        except GraphQLError as e:
+            return ExecutionResult(data=None, errors=[e]), None
+
+        if not query:
+            if show_graphiql:
+                return None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors), None
+
+        try:
+            document, validation_errors = self.get_document(schema, query)
+        except Exception as e:
+            return ExecutionResult(errors=[e]), None
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None, None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors), None
+
+        extensions, cost_error = check_query_cost(
+            schema, document, operation_ast, variables, self.get_client_id(request)
+        )
+        if cost_error:
+            return ExecutionResult(data=None, errors=[cost_error], extensions=extensions), None
+
+        cache_key = self.response_cache.key(
+            schema, document, operation_ast, query_hash(query), variables
+        )
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return ExecutionResult(data=cached, extensions=extensions or None), None
+        return None, PreparedRequest(document, operation_ast, cache_key, extensions)
+
+    def get_execute_options(self, request, variables, operation_name):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+    def finish_result(self, prepared, result):
+        """Cache a successful query result and attach the extensions."""
+        if prepared.cache_key and not result.errors:
+            self.response_cache.set(prepared.cache_key, result.data)
+        if prepared.extensions:
+            result.extensions = {**(result.extensions or {}), **prepared.extensions}
+        return result
+
+    def execute_document(self, request, prepared, variables, operation_name):
+        schema = self.schema.graphql_schema
+        operation_ast = prepared.operation_ast
+        try:
+            execute_options = self.get_execute_options(request, variables, operation_name)
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, prepared.document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return self.finish_result(prepared, result)
+
+            result = execute(schema, prepared.document, **execute_options)
+            return self.finish_result(prepared, result)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        with tracing(request) as trace:
+            result, prepared = self.prepare_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+            if prepared is not None:
+                result = self.execute_document(request, prepared, variables, operation_name)
+        return finish_trace(trace, result)
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+        if execution_result and execution_result.errors:
+            set_rollback()
+        return self.encode_result(request, execution_result, id, show_graphiql)
+
+    def encode_result(self, request, execution_result, id=None, show_graphiql=False):
+        """
+        Serialize ``execution_result`` as GraphQLView.get_response does,
+        including its ``extensions``. Returns ``(body, status_code)``.
+        """
+        if not execution_result:
+            return None, 200
+
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+        if execution_result.errors and any(
+            not getattr(e, "path", None) for e in execution_result.errors
+        ):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    CRMGraphQLView for ASGI deployments.
+
+    Queries are executed without holding a thread for the whole request:
+    every root field is resolved in its own worker thread and the root
+    fields run concurrently (see ``crm.execution``). Mutations and the
+    GraphiQL page go through the sync path.
+    """
+
+    view_is_async = True
+    execution_context_class = ConcurrentRootExecutionContext
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            if self.batch:
+                responses = [await self.get_response_async(request, entry) for entry in data]
+                result = "[{}]".format(",".join(response[0] for response in responses))
+                status_code = max((response[1] for response in responses), default=200)
+            else:
+                result, status_code = await self.get_response_async(request, data)
+
+            return HttpResponse(status=status_code, content=result, content_type="application/json")
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    async def get_response_async(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = await self.execute_graphql_request_async(
+            request, data, query, variables, operation_name
+        )
+        # ATOMIC_REQUESTS does not apply to async views, so unlike
+        # get_response there is no request transaction to roll back.
+        return self.encode_result(request, execution_result, id)
+
+    async def execute_graphql_request_async(self, request, data, query, variables, operation_name):
+        with tracing(request) as trace:
+            result, prepared = await sync_to_async(self.prepare_request)(
+                request, data, query, variables, operation_name
+            )
+            if prepared is not None:
+                result = await self.execute_document_async(
+                    request, prepared, variables, operation_name
+                )
+        return finish_trace(trace, result)
+
+    async def execute_document_async(self, request, prepared, variables, operation_name):
+        operation_ast = prepared.operation_ast
+        if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+            return await sync_to_async(self.execute_document)(
+                request, prepared, variables, operation_name
+            )
+
+        try:
+            result = execute(
+                self.schema.graphql_schema,
+                prepared.document,
+                **self.get_execute_options(request, variables, operation_name),
+            )
+            if isawaitable(result):
+                result = await result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        return await sync_to_async(self.finish_result)(prepared, result)
+
+
+def has_bulk_access(request, token):
+    """
+    Whether ``request`` may read a bulk endpoint: always when DEBUG is on,
+    for staff users, and with ``Authorization: Bearer <token>`` when
+    ``token`` is set.
+    """
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return True
+    return token is not None and constant_time_compare(
+        request.headers.get('Authorization', ''), f"Bearer {token}"
+    )
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint for this process's GraphQL metrics."""
+    if not has_bulk_access(request, metrics_settings()['METRICS_TOKEN']):
+        return HttpResponseForbidden()
+    documents = document_cache.stats()
+    responses = response_cache.stats()
+    body = metrics.render([
+        ('crm_graphql_document_cache_hits_total', 'counter',
+         "Parsed-document cache hits", documents['hits']),
+        ('crm_graphql_document_cache_misses_total', 'counter',
+         "Parsed-document cache misses", documents['misses']),
+        ('crm_graphql_document_cache_size', 'gauge',
+         "Parsed documents currently cached", documents['size']),
+        ('crm_graphql_response_cache_hits_total', 'counter',
+         "Response cache hits", responses['hits']),
+        ('crm_graphql_response_cache_misses_total', 'counter',
+         "Response cache misses", responses['misses']),
+    ])
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_GET
+def export_orders_view(request):
+    """
+    Stream the orders matching the OrderFilter arguments in the query
+    string, e.g. ``/exports/orders?format=csv&order_date_gte=2025-01-01``.
+    ``format`` is ``ndjson`` (default) or ``csv``. Needs a staff user,
+    ``DEBUG`` or ``CRM_EXPORT_TOKEN`` as a bearer token.
+    """
+    if not has_bulk_access(request, getattr(settings, 'CRM_EXPORT_TOKEN', None)):
+        return HttpResponseForbidden()
+    params = request.GET.copy()
+    export_format = params.pop('format', ['ndjson'])[-1]
+    try:
+        renderer = get_renderer(export_format)
+        queryset = export_queryset(params)
+    except ValidationError as e:
+        return JsonResponse({'errors': getattr(e, 'message_dict', None) or e.messages}, status=400)
+
+    stream = astream_orders if isinstance(request, ASGIRequest) else stream_orders
+    response = StreamingHttpResponse(stream(queryset, renderer), content_type=renderer.content_type)
+    response['Content-Disposition'] = f'attachment; filename="orders.{renderer.extension}"'
+    return response